@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+A5/1 implementation for recovering keys from the internal states found by Kraken.
+
+All functions work on arrays of candidates, so that many states can be backclocked and many keys can be verified
+with a single call. The registers are held in three arrays of integers, bit 0 being the bit that is shifted in.
+"""
+import binascii
+
+import numpy
+
+# length, feedback taps and clocking bit of the registers R1, R2 and R3
+REGISTERS = [
+    (19, (13, 16, 17, 18), 8),
+    (22, (20, 21), 10),
+    (23, (7, 20, 21, 22), 10),
+]
+STATE_SIZE = 64
+KEY_SIZE = 64
+COUNT_SIZE = 22
+MIX_CLOCKS = 100
+KEYSTREAM_SIZE = 114
+
+# clocking patterns possible under the majority rule, at least two registers are clocked
+_PATTERNS = [(1, 1, 1), (1, 1, 0), (1, 0, 1), (0, 1, 1)]
+_OFFSETS = [0, 19, 41]  # position of the registers in a state vector
+
+
+def _mask(length):
+    return (1 << length) - 1
+
+
+def _feedback(register, taps):
+    feedback = register >> taps[0]
+    for tap in taps[1:]:
+        feedback = feedback ^ (register >> tap)
+    return feedback & 1
+
+
+def _clock_bits(registers):
+    return [(register >> clock_bit) & 1 for register, (length, taps, clock_bit) in zip(registers, REGISTERS)]
+
+
+def _clock(registers, enabled=None):
+    """
+    Clock the registers.
+
+    :param registers: the three register arrays.
+    :param enabled: for each register, None to clock it or a mask of the candidates for which it is clocked.
+    :return: the new register arrays.
+    """
+    clocked = []
+    for i, (register, (length, taps, clock_bit)) in enumerate(zip(registers, REGISTERS)):
+        shifted = ((register << 1) & _mask(length)) | _feedback(register, taps)
+        if enabled is not None:
+            shifted = numpy.where(enabled[i], shifted, register)
+        clocked.append(shifted)
+    return clocked
+
+
+def _clock_majority(registers):
+    c1, c2, c3 = _clock_bits(registers)
+    majority = (c1 & c2) | (c1 & c3) | (c2 & c3)
+    return _clock(registers, [c1 == majority, c2 == majority, c3 == majority])
+
+
+def _output(registers):
+    return [(register >> (length - 1)) & 1 for register, (length, taps, clock_bit) in zip(registers, REGISTERS)]
+
+
+def _unclock(register, length, taps):
+    """
+    Invert a single clock of a register. The bit shifted out is the top tap, which is determined by the feedback
+    bit and the other taps.
+    """
+    previous = register >> 1
+    top = register & 1
+    for tap in taps[:-1]:
+        top = top ^ ((previous >> tap) & 1)
+    return previous | (top << (length - 1))
+
+
+def _to_vectors(registers):
+    """
+    :return: the states as (n, 64) bit matrix.
+    """
+    columns = []
+    for register, (length, taps, clock_bit) in zip(registers, REGISTERS):
+        register = numpy.asarray(register, dtype=numpy.uint64)
+        columns.extend((register >> numpy.uint64(bit)) & numpy.uint64(1) for bit in range(length))
+    return numpy.stack(columns, axis=-1).astype(numpy.uint8)
+
+
+def _from_vectors(vectors):
+    registers = []
+    for offset, (length, taps, clock_bit) in zip(_OFFSETS, REGISTERS):
+        weights = numpy.left_shift(numpy.int64(1), numpy.arange(length, dtype=numpy.int64))
+        registers.append(vectors[:, offset:offset + length].astype(numpy.int64).dot(weights))
+    return registers
+
+
+def _load_matrices():
+    """
+    Loading the key and the count clocks all registers, which is linear over GF(2). The state after loading is
+    key_matrix * key + count_matrix * count.
+    """
+    def load(key_bits, count_bits):
+        registers = [numpy.zeros(1, dtype=numpy.int64) for _ in REGISTERS]
+        for bit in list(key_bits) + list(count_bits):
+            registers = [register ^ bit for register in _clock(registers)]
+        return _to_vectors(registers)[0]
+
+    unit = numpy.eye(KEY_SIZE + COUNT_SIZE, dtype=numpy.int64)
+    key_matrix = numpy.stack([load(unit[i, :KEY_SIZE], unit[i, KEY_SIZE:]) for i in range(KEY_SIZE)], axis=1)
+    count_matrix = numpy.stack([load(unit[i, :KEY_SIZE], unit[i, KEY_SIZE:])
+                                for i in range(KEY_SIZE, KEY_SIZE + COUNT_SIZE)], axis=1)
+    return key_matrix, count_matrix
+
+
+def _invert(matrix):
+    """
+    Invert a square matrix over GF(2) by Gauss-Jordan elimination.
+    """
+    size = len(matrix)
+    augmented = numpy.concatenate((matrix % 2, numpy.eye(size, dtype=matrix.dtype)), axis=1).astype(numpy.uint8)
+    for column in range(size):
+        pivot = column + numpy.flatnonzero(augmented[column:, column])[0]
+        augmented[[column, pivot]] = augmented[[pivot, column]]
+        rows = numpy.flatnonzero(augmented[:, column])
+        rows = rows[rows != column]
+        augmented[rows] ^= augmented[column]
+    return augmented[:, size:]
+
+
+_KEY_MATRIX, _COUNT_MATRIX = _load_matrices()
+_INVERSE_KEY_MATRIX = _invert(_KEY_MATRIX)
+
+
+def key_to_bits(keys):
+    """
+    :param keys: keys as hex strings, the first byte being the first byte of the key.
+    :return: a (n, 64) matrix of key bits, in the order they are loaded.
+    """
+    key_bytes = numpy.frombuffer(b"".join(binascii.unhexlify(key) for key in keys), dtype=numpy.uint8)
+    key_bytes = key_bytes.reshape(-1, KEY_SIZE // 8)
+    # bit i of the key is bit i % 8 of byte i / 8
+    return numpy.unpackbits(key_bytes[:, :, None], axis=2)[:, :, ::-1].reshape(-1, KEY_SIZE)
+
+
+def bits_to_key(bits):
+    """
+    :param bits: a (64,) vector of key bits, in the order they are loaded.
+    :return: the key as hex string.
+    """
+    key_bytes = numpy.packbits(numpy.asarray(bits, dtype=numpy.uint8).reshape(-1, 8)[:, ::-1], axis=1)
+    return "".join("%02x" % byte for byte in key_bytes.ravel().tolist())
+
+
+def _count_bits(counts):
+    counts = numpy.asarray(counts, dtype=numpy.int64).reshape(-1, 1)
+    return ((counts >> numpy.arange(COUNT_SIZE, dtype=numpy.int64)) & 1).astype(numpy.uint8)
+
+
+def _load(keys, counts):
+    """
+    :return: the registers after loading the keys and counts.
+    """
+    key_vectors = numpy.asarray(keys, dtype=numpy.int64).reshape(-1, KEY_SIZE).dot(_KEY_MATRIX.T)
+    count_vectors = _count_bits(counts).astype(numpy.int64).dot(_COUNT_MATRIX.T)
+    return _from_vectors((key_vectors + count_vectors) % 2)
+
+
+def fn2count(framenumbers):
+    """
+    Derive the COUNT value loaded into A5/1 from framenumbers.
+
+    :param framenumbers: a framenumber or an array of framenumbers.
+    :return: the COUNT value of each framenumber.
+    """
+    t1 = framenumbers // 1326
+    t2 = framenumbers % 26
+    t3 = framenumbers % 51
+    return (t1 << 11) | (t3 << 5) | t2
+
+
+def keystream(keys, counts, length=KEYSTREAM_SIZE):
+    """
+    Generate the keystream of many keys or many frames at once.
+
+    The first 114 bits are the keystream of the downlink, the following 114 bits the one of the uplink.
+
+    :param keys: a (n, 64) matrix of key bits, see key_to_bits(). A single key is used for all counts.
+    :param counts: the COUNT values derived from the framenumbers, one for all keys or one per key.
+    :param length: number of keystream bits, at most 228.
+    :return: a (n, length) matrix of keystream bits.
+    """
+    registers = _load(keys, counts)
+    for _ in range(MIX_CLOCKS):
+        registers = _clock_majority(registers)
+
+    result = numpy.empty((len(registers[0]), length), dtype=numpy.uint8)
+    for i in range(length):
+        registers = _clock_majority(registers)
+        o1, o2, o3 = _output(registers)
+        result[:, i] = o1 ^ o2 ^ o3
+    return result
+
+
+def match_keys(keys, counts, keystreams):
+    """
+    Check many keys against many known keystreams at once.
+
+    :param keys: a (k, 64) matrix of key bits, see key_to_bits().
+    :param counts: the COUNT values of the m keystreams.
+    :param keystreams: a (m, 114) matrix of known (downlink) keystream bits.
+    :return: a (k, m) boolean matrix, True where a key generates the keystream.
+    """
+    keys = numpy.asarray(keys, dtype=numpy.uint8).reshape(-1, KEY_SIZE)
+    keystreams = numpy.asarray(keystreams, dtype=numpy.uint8).reshape(-1, KEYSTREAM_SIZE)
+    counts = numpy.asarray(counts, dtype=numpy.int64).reshape(-1)
+    generated = keystream(numpy.repeat(keys, len(counts), axis=0), numpy.tile(counts, len(keys)))
+    return numpy.all(generated == numpy.tile(keystreams, (len(keys), 1)), axis=1).reshape(len(keys), len(counts))
+
+
+def kraken_state(value):
+    """
+    Convert a state reported by Kraken to registers.
+
+    Kraken reports the state as 64 bit hex value holding R1, R2 and R3 in reverse bit order, i.e. the most
+    significant bit is bit 0 of R1, followed by R2 and R3. The layout follows Kraken's find_kc; it is an assumption
+    that holds for the tables generated by Kraken's own A5/1 implementation.
+
+    :param value: the state as hex string.
+    :return: the three register values.
+    """
+    bits = bin(int(value, 16))[2:].zfill(STATE_SIZE)  # most significant bit first
+    reversed_value = int(bits[::-1], 2)
+    return [(reversed_value >> offset) & _mask(length) for offset, (length, taps, clock_bit) in
+            zip(_OFFSETS, REGISTERS)]
+
+
+def internal_states(keys, counts, bitpositions):
+    """
+    Get the internal states that generate the keystream starting at the given bit positions, i.e. the states
+    Kraken finds for the keystream.
+
+    :param keys: a (n, 64) matrix of key bits.
+    :param counts: the COUNT value of each key.
+    :param bitpositions: the keystream bit position of each key.
+    :return: the three register arrays of the states.
+    """
+    registers = _load(keys, counts)
+    steps = numpy.asarray(bitpositions, dtype=numpy.int64) + MIX_CLOCKS + 1
+    states = list(registers)
+    for step in range(1, int(steps.max()) + 1 if len(steps) > 0 else 0):
+        registers = _clock_majority(registers)
+        reached = steps == step
+        states = [numpy.where(reached, register, state) for register, state in zip(registers, states)]
+    return states
+
+
+def kraken_value(registers):
+    """
+    Convert registers to states as Kraken reports them, see kraken_state().
+
+    :param registers: the three register arrays.
+    :return: the states as hex strings.
+    """
+    values = []
+    for r1, r2, r3 in zip(*[numpy.asarray(register).tolist() for register in registers]):
+        bits = bin(r1 | (r2 << _OFFSETS[1]) | (r3 << _OFFSETS[2]))[2:].zfill(STATE_SIZE)
+        values.append("%016x" % int(bits[::-1], 2))
+    return values
+
+
+def backclock(registers, steps):
+    """
+    Find all states that result in the given states after a number of majority clocks.
+
+    :param registers: the three register arrays of the states.
+    :param steps: number of clocks to go back, one for all states or one per state.
+    :return: the index of the originating state and the three register arrays of each predecessor.
+    """
+    registers = [numpy.asarray(register, dtype=numpy.int64) for register in registers]
+    remaining = numpy.broadcast_to(numpy.asarray(steps, dtype=numpy.int64), registers[0].shape).copy()
+    origins = numpy.arange(len(remaining))
+    done_origins, done_registers = [], []
+
+    while len(origins) > 0:
+        finished = remaining <= 0
+        if finished.any():
+            done_origins.append(origins[finished])
+            done_registers.append([register[finished] for register in registers])
+            registers = [register[~finished] for register in registers]
+            origins, remaining = origins[~finished], remaining[~finished]
+
+        unclocked = [_unclock(register, length, taps) for register, (length, taps, clock_bit) in
+                     zip(registers, REGISTERS)]
+        predecessors = []
+        for pattern in _PATTERNS:
+            previous = [unclocked[i] if clocked else registers[i] for i, clocked in enumerate(pattern)]
+            c1, c2, c3 = _clock_bits(previous)
+            majority = (c1 & c2) | (c1 & c3) | (c2 & c3)
+            valid = (c1 == majority) == bool(pattern[0])
+            valid &= (c2 == majority) == bool(pattern[1])
+            valid &= (c3 == majority) == bool(pattern[2])
+            predecessors.append((valid, previous))
+
+        origins = numpy.concatenate([origins[valid] for valid, previous in predecessors])
+        remaining = numpy.concatenate([remaining[valid] for valid, previous in predecessors]) - 1
+        registers = [numpy.concatenate([previous[i][valid] for valid, previous in predecessors]) for i in range(3)]
+
+    if not done_origins:
+        return numpy.zeros(0, dtype=numpy.int64), [numpy.zeros(0, dtype=numpy.int64) for _ in REGISTERS]
+    return (numpy.concatenate(done_origins),
+            [numpy.concatenate([registers[i] for registers in done_registers]) for i in range(3)])
+
+
+def recover_keys(registers, bitpositions, counts):
+    """
+    Recover the keys that lead to the given states.
+
+    :param registers: the three register arrays of the states found at the given keystream bit positions.
+    :param bitpositions: keystream bit position of each state.
+    :param counts: the COUNT value of each state.
+    :return: the index of the originating state and a (n, 64) matrix with the bits of each possible key.
+    """
+    # the state found at keystream bit 0 is the one after the 101st mixing clock
+    steps = numpy.asarray(bitpositions, dtype=numpy.int64) + MIX_CLOCKS + 1
+    origins, loaded = backclock(registers, steps)
+    counts = numpy.broadcast_to(numpy.asarray(counts, dtype=numpy.int64), steps.shape)[origins]
+    vectors = (_to_vectors(loaded).astype(numpy.int64) + _count_bits(counts).dot(_COUNT_MATRIX.T)) % 2
+    keys = vectors.dot(_INVERSE_KEY_MATRIX.T.astype(numpy.int64)) % 2
+    return origins, keys.astype(numpy.uint8)
+
+
+def find_keys(states, bitpositions, counts, check_counts, check_keystreams):
+    """
+    Recover the keys of many states found by Kraken and verify them with a further burst.
+
+    :param states: the states as hex strings, see kraken_state().
+    :param bitpositions: keystream bit position of each state.
+    :param counts: the COUNT value of the burst each state was found for, see fn2count().
+    :param check_counts: the COUNT value of the verification burst of each state.
+    :param check_keystreams: a (n, 114) matrix with the keystream of the verification burst of each state.
+    :return: the number of possible keys and the matching key as hex string or None, for each state.
+    """
+    if len(states) == 0:
+        return []
+    registers = [numpy.array(register, dtype=numpy.int64) for register in zip(*[kraken_state(state)
+                                                                                  for state in states])]
+    origins, keys = recover_keys(registers, bitpositions, counts)
+    check_keystreams = numpy.asarray(check_keystreams, dtype=numpy.uint8)
+    matches = numpy.all(keystream(keys, numpy.asarray(check_counts)[origins]) == check_keystreams[origins], axis=1)
+
+    candidates = numpy.bincount(origins, minlength=len(states))
+    results = [None] * len(states)
+    for origin, key in zip(origins[matches].tolist(), keys[matches]):
+        results[origin] = bits_to_key(key)
+    return list(zip(candidates.tolist(), results))
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import grgsm
+from gnuradio import gr
+
+from adapter.grgsm.burstfile import BurstSelection
+
+
+class AnalysisEngine(gr.top_block):
+    """
+    Demaps and decodes the bursts of a timeslot once and passes the decoded messages to every registered extractor.
+    """
+
+    def __init__(self, timeslot, burst_file, mode):
+        gr.top_block.__init__(self, "Analysis Engine")
+
+        self.burst_selection = BurstSelection(burst_file, timeslot=timeslot)
+        self.burst_file_source = grgsm.burst_file_source(self.burst_selection.path)
+
+        if mode == 'BCCH':
+            self.demapper = grgsm.gsm_bcch_ccch_demapper(timeslot_nr=timeslot, )
+        elif mode == 'BCCH_SDCCH4':
+            self.demapper = grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=timeslot, )
+        else:
+            self.demapper = grgsm.gsm_sdcch8_demapper(timeslot_nr=timeslot, )
+
+        self.decoder = grgsm.control_channels_decoder()
+        self.extractors = dict()
+
+        self.msg_connect((self.burst_file_source, 'out'), (self.demapper, 'bursts'))
+        self.msg_connect((self.demapper, 'bursts'), (self.decoder, 'bursts'))
+
+    def register(self, name, extractor):
+        """
+        Register an extractor block. The block receives all decoded messages on its 'msgs' port.
+        Extractors have to be registered before the engine is started.
+
+        :param name: name for retrieving the extractor.
+        :param extractor: the extractor block, e.g. grgsm.extract_cmc().
+        :return: the extractor.
+        """
+        self.extractors[name] = extractor
+        self.msg_connect((self.decoder, 'msgs'), (extractor, 'msgs'))
+        return extractor
+
+    def get(self, name):
+        return self.extractors.get(name)
+
+    def wait(self):
+        """
+        Override gr.top_block's wait method.
+        """
+        gr.top_block.wait(self)
+        self.burst_selection.remove()
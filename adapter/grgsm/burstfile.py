@@ -0,0 +1,979 @@
+# -*- coding: utf-8 -*-
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy
+
+BURST_SIZE = 148
+GSMTAP_HEADER_SIZE = 16
+
+SUBSLOT_SDCCH4 = "SDCCH4"
+SUBSLOT_SDCCH8 = "SDCCH8"
+
+# gr-gsm's burst_file_sink writes every burst as a serialized PMT pair of PMT_NIL and a u8 vector that holds
+# the GSMTAP header followed by the 148 burst bits (one bit per byte):
+# PST_PAIR, PST_NULL, PST_UNIFORM_VECTOR, UVI_U8, vector length (u32, big endian), padding length, padding
+_PMT_PST_NULL = 0x06
+_PMT_PST_PAIR = 0x07
+_PMT_PST_UNIFORM_VECTOR = 0x0a
+_PMT_UVI_U8 = 0x00
+_PMT_RECORD_HEADER = numpy.frombuffer(
+    struct.pack(">BBBBIBB", _PMT_PST_PAIR, _PMT_PST_NULL, _PMT_PST_UNIFORM_VECTOR, _PMT_UVI_U8,
+                GSMTAP_HEADER_SIZE + BURST_SIZE, 1, 0), dtype=numpy.uint8)
+
+RECORD_DTYPE = numpy.dtype([
+    ('pmt_header', numpy.uint8, (len(_PMT_RECORD_HEADER),)),
+    ('version', numpy.uint8),
+    ('hdr_len', numpy.uint8),
+    ('type', numpy.uint8),
+    ('timeslot', numpy.uint8),
+    ('arfcn', '>u2'),
+    ('signal_dbm', numpy.int8),
+    ('snr_db', numpy.int8),
+    ('frame_number', '>u4'),
+    ('sub_type', numpy.uint8),
+    ('antenna_nr', numpy.uint8),
+    ('sub_slot', numpy.uint8),
+    ('res', numpy.uint8),
+    ('bits', numpy.uint8, (BURST_SIZE,)),
+])
+
+_GSMTAP_VERSION = 0x02
+_GSMTAP_TYPE_UM_BURST = 0x03
+_GSMTAP_ARFCN_MASK = 0x3fff
+
+# the dummy burst as defined in 3GPP TS 45.002, 5.2.6, including tail bits
+DUMMY_BURST = numpy.array(
+    [0, 0, 0,
+     1, 1, 1, 1, 1, 0, 1, 1, 0, 1, 1, 1, 0, 1, 1, 0, 0, 0, 0, 0, 1, 0, 1, 0, 0, 1, 0, 0, 1, 1, 1, 0,
+     0, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 0, 0, 0, 1, 1, 1, 0, 0,
+     0, 1, 0, 1, 1, 1, 0, 0, 0, 1, 0, 1, 1, 1, 0, 0, 0, 1, 0, 1, 0, 1, 1, 1, 0, 1, 0, 0, 1, 0, 1, 0,
+     0, 0, 1, 1, 0, 0, 1, 1, 0, 0, 1, 1, 1, 0, 0, 1, 1, 1, 1, 0, 1, 0, 0, 1, 1, 1, 1, 1, 0, 0, 0, 1,
+     0, 0, 1, 0, 1, 1, 1, 1, 1, 0, 1, 0, 1, 0,
+     0, 0, 0], dtype=numpy.uint8)
+_PACKED_DUMMY_BURST = numpy.packbits(DUMMY_BURST)
+
+
+def _create_subslot_tables():
+    """
+    Create the mapping of (framenumber mod 102) to SDCCH subslot, as used by gr-gsm's subslot filter.
+    Bursts of the SACCH belonging to a subslot are mapped to that subslot as well, -1 marks all other bursts.
+
+    :return: a dictionary holding a lookup table for SDCCH/4 and SDCCH/8.
+    """
+    sdcch4 = numpy.full(102, -1, dtype=numpy.int8)
+    sdcch8 = numpy.full(102, -1, dtype=numpy.int8)
+
+    for fn_mod102 in range(102):
+        fn_mod51 = fn_mod102 % 51
+        second_half = fn_mod102 >= 51
+
+        # SDCCH/4 is combined with BCCH and CCCH on timeslot 0
+        if 22 <= fn_mod51 <= 29:
+            sdcch4[fn_mod102] = (fn_mod51 - 22) // 4
+        elif 32 <= fn_mod51 <= 39:
+            sdcch4[fn_mod102] = 2 + (fn_mod51 - 32) // 4
+        elif 42 <= fn_mod51 <= 49:  # SACCH/4
+            sdcch4[fn_mod102] = (fn_mod51 - 42) // 4 + (2 if second_half else 0)
+
+        if fn_mod51 <= 31:
+            sdcch8[fn_mod102] = fn_mod51 // 4
+        elif fn_mod51 <= 47:  # SACCH/8
+            sdcch8[fn_mod102] = (fn_mod51 - 32) // 4 + (4 if second_half else 0)
+
+    return {SUBSLOT_SDCCH4: sdcch4, SUBSLOT_SDCCH8: sdcch8}
+
+
+SUBSLOT_TABLES = _create_subslot_tables()
+
+
+def _create_sacch_tables():
+    """
+    Create the mapping of (framenumber mod 102) to whether a burst belongs to a SACCH of SDCCH/4 or SDCCH/8.
+
+    :return: a dictionary holding a boolean lookup table for SDCCH/4 and SDCCH/8.
+    """
+    fn_mod51 = numpy.arange(102) % 51
+    return {SUBSLOT_SDCCH4: (fn_mod51 >= 42) & (fn_mod51 <= 49),
+            SUBSLOT_SDCCH8: (fn_mod51 >= 32) & (fn_mod51 <= 47)}
+
+
+SACCH_TABLES = _create_sacch_tables()
+
+
+class BurstFileError(Exception):
+    """
+    Signals a burst file that cannot be parsed.
+    """
+    pass
+
+
+class Bursts(object):
+    """
+    Columnar view on a set of bursts.
+    All properties return NumPy arrays, which are views on the underlying records wherever possible.
+    """
+
+    def __init__(self, records):
+        self._records = records
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, selection):
+        """
+        Select a subset of the bursts.
+
+        :param selection: a slice, an index array or a boolean mask.
+        :return: the selected bursts.
+        """
+        if isinstance(selection, (int, numpy.integer)):
+            selection = numpy.atleast_1d(selection)
+        return self._subset(self._records[selection])
+
+    def _subset(self, records):
+        return Bursts(records)
+
+    @property
+    def records(self):
+        return self._records
+
+    @property
+    def framenumbers(self):
+        return self._records['frame_number']
+
+    @property
+    def timeslots(self):
+        return self._records['timeslot']
+
+    @property
+    def arfcns(self):
+        return self._records['arfcn'] & _GSMTAP_ARFCN_MASK
+
+    @property
+    def raw_arfcns(self):
+        """
+        :return: the GSMTAP arfcn fields, including the uplink and PCS flags.
+        """
+        return self._records['arfcn']
+
+    @property
+    def burst_types(self):
+        """
+        :return: the GSMTAP sub types, i.e. the burst types.
+        """
+        return self._records['sub_type']
+
+    @property
+    def sub_slots(self):
+        """
+        :return: the GSMTAP sub_slot fields.
+        """
+        return self._records['sub_slot']
+
+    @property
+    def antennas(self):
+        return self._records['antenna_nr']
+
+    @property
+    def signal_dbm(self):
+        return self._records['signal_dbm']
+
+    @property
+    def snr_db(self):
+        return self._records['snr_db']
+
+    @property
+    def bits(self):
+        """
+        :return: a (n, 148) array with one burst bit per byte.
+        """
+        return self._records['bits']
+
+    @property
+    def payloads(self):
+        """
+        :return: a (n, 114) array holding the encrypted / encoded payload bits of normal bursts.
+        """
+        bits = self.bits
+        return numpy.concatenate((bits[:, 3:60], bits[:, 88:145]), axis=1)
+
+    def with_payloads(self, payloads):
+        """
+        :param payloads: a (n, 114) array with one payload bit per element.
+        :return: a copy of the bursts with the payload bits replaced.
+        """
+        bits = numpy.array(self.bits, dtype=numpy.uint8)
+        bits[:, 3:60] = payloads[:, :57]
+        bits[:, 88:145] = payloads[:, 57:]
+        return self._with_bits(bits)
+
+    def _with_bits(self, bits):
+        records = self._records.copy()
+        records['bits'] = bits
+        return Bursts(records)
+
+    def subslots(self, subslot_mode=SUBSLOT_SDCCH8):
+        """
+        :param subslot_mode: the channel combination, SUBSLOT_SDCCH4 or SUBSLOT_SDCCH8.
+        :return: the SDCCH subslot of each burst, -1 for bursts that do not belong to a SDCCH or SACCH.
+        """
+        return SUBSLOT_TABLES[subslot_mode][self.framenumbers % 102]
+
+    def dummy_bursts(self):
+        """
+        :return: a boolean mask of the bursts that are dummy bursts.
+        """
+        return (self.bits == DUMMY_BURST).all(axis=1)
+
+    def mask(self, framenr_ge=None, framenr_le=None, timeslot=None, subslot=None, subslot_mode=SUBSLOT_SDCCH8,
+             filter_dummy_bursts=False):
+        """
+        Create a boolean mask for the given criteria. The criteria match the ones of gr-gsm's burst filter blocks.
+
+        :param framenr_ge: allow only framenumbers greater than or equal the specified one.
+        :param framenr_le: allow only framenumbers less than or equal the specified one.
+        :param timeslot: allow only bursts on the specified timeslot.
+        :param subslot: allow only bursts on the specified SDCCH subslot.
+        :param subslot_mode: the channel combination used for the subslot, SUBSLOT_SDCCH4 or SUBSLOT_SDCCH8.
+        :param filter_dummy_bursts: remove dummy bursts.
+        :return: a boolean mask with one entry per burst.
+        """
+        result = numpy.ones(len(self), dtype=bool)
+        if framenr_ge is not None:
+            result &= self.framenumbers >= framenr_ge
+        if framenr_le is not None:
+            result &= self.framenumbers <= framenr_le
+        if timeslot is not None:
+            result &= self.timeslots == timeslot
+        if subslot is not None:
+            result &= self.subslots(subslot_mode) == subslot
+        if filter_dummy_bursts:
+            result &= ~self.dummy_bursts()
+        return result
+
+    def filter(self, **criteria):
+        """
+        Select the bursts matching the given criteria, see mask().
+        """
+        return self[self.mask(**criteria)]
+
+    def chunks(self, size=65536):
+        """
+        Iterate over the bursts in chunks of the given size.
+
+        :param size: number of bursts per chunk.
+        """
+        for start in range(0, len(self), size):
+            yield self[start:start + size]
+
+
+class CompactBursts(Bursts):
+    """
+    Columnar view on a set of bursts in the compact layout, which holds the burst bits packed.
+    """
+
+    def _subset(self, records):
+        return CompactBursts(records)
+
+    def _with_bits(self, bits):
+        records = self._records.copy()
+        records['packed_bits'] = numpy.packbits(bits, axis=1)
+        return CompactBursts(records)
+
+    @property
+    def bits(self):
+        return numpy.unpackbits(self._records['packed_bits'], axis=1)[:, :BURST_SIZE]
+
+    @property
+    def packed_bits(self):
+        """
+        :return: a (n, 19) array with the burst bits packed, MSB first.
+        """
+        return self._records['packed_bits']
+
+    def dummy_bursts(self):
+        return (self.packed_bits == _PACKED_DUMMY_BURST).all(axis=1)
+
+
+class BurstFile(Bursts):
+    """
+    Reader for gr-gsm burst files.
+    The file is memory-mapped, so only the accessed parts of a file are read.
+    """
+
+    def __init__(self, path, start=0, stop=None):
+        """
+        :param path: path of the burst file.
+        :param start: byte offset of the first record to read.
+        :param stop: byte offset after the last record to read. If None, the file is read until its end.
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = None
+
+        if stop is None or stop > size:
+            stop = size
+        self.start = start
+        self.stop = max(start, stop)
+
+        if self.stop > self.start:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            data = numpy.frombuffer(self._mmap, dtype=numpy.uint8, count=self.stop - self.start, offset=self.start)
+        else:
+            data = numpy.zeros(0, dtype=numpy.uint8)
+
+        records, self._record_starts = self.__parse(data)
+        super(BurstFile, self).__init__(records)
+
+    def record_offsets(self):
+        """
+        :return: the byte offset of each burst's record in the file.
+        """
+        if self._record_starts is not None:
+            return self._record_starts + self.start
+        return numpy.arange(len(self), dtype=numpy.int64) * RECORD_DTYPE.itemsize + self.start
+
+    def close(self):
+        self._records = self._records[:0].copy()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # views on the mapping are still referenced, it is unmapped once they are released
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    @staticmethod
+    def __parse(data):
+        if len(data) == 0:
+            return numpy.zeros(0, dtype=RECORD_DTYPE), None
+
+        if len(data) % RECORD_DTYPE.itemsize == 0:
+            records = data.view(RECORD_DTYPE)
+            if (records['pmt_header'] == _PMT_RECORD_HEADER).all():
+                return records, None
+
+        # the records differ from the layout gr-gsm usually writes, i.e. the PMT pair carries metadata.
+        return BurstFile.__parse_generic(data)
+
+    @staticmethod
+    def __parse_generic(data):
+        """
+        Parse the serialized PMTs one by one and copy them into records of the common layout.
+
+        :return: the records and the start offset of every record in data.
+        """
+        raw = data.tobytes()
+        starts = []
+        offsets = []
+        pos = 0
+        while pos < len(raw):
+            starts.append(pos)
+            if ord(raw[pos:pos + 1]) != _PMT_PST_PAIR:
+                raise BurstFileError("Unexpected PMT type at offset %s" % pos)
+            pos = _skip_pmt(raw, pos + 1)  # metadata
+            if ord(raw[pos:pos + 1]) != _PMT_PST_UNIFORM_VECTOR or ord(raw[pos + 1:pos + 2]) != _PMT_UVI_U8:
+                raise BurstFileError("Burst at offset %s does not contain a u8 vector" % pos)
+            length, npad = struct.unpack(">IB", raw[pos + 2:pos + 7])
+            pos += 7 + npad
+            if length != GSMTAP_HEADER_SIZE + BURST_SIZE or pos + length > len(raw):
+                raise BurstFileError("Invalid burst length at offset %s" % pos)
+            offsets.append(pos)
+            pos += length
+
+        offsets = numpy.array(offsets, dtype=numpy.int64)
+        records = numpy.zeros(len(offsets), dtype=RECORD_DTYPE)
+        records['pmt_header'] = _PMT_RECORD_HEADER
+        flat = records.view(numpy.uint8).reshape(len(offsets), RECORD_DTYPE.itemsize)
+        header_size = len(_PMT_RECORD_HEADER)
+        flat[:, header_size:] = data[offsets[:, None] + numpy.arange(GSMTAP_HEADER_SIZE + BURST_SIZE)]
+        return records, numpy.array(starts, dtype=numpy.int64)
+
+
+def _skip_pmt(raw, pos):
+    """
+    Skip a serialized PMT.
+
+    :param raw: the serialized data.
+    :param pos: position of the PMT's type tag.
+    :return: the position after the PMT.
+    """
+    tag = ord(raw[pos:pos + 1])
+    pos += 1
+    if tag in (0x00, 0x01, _PMT_PST_NULL):  # true, false, null
+        return pos
+    elif tag == 0x02:  # symbol
+        return pos + 2 + struct.unpack(">H", raw[pos:pos + 2])[0]
+    elif tag == 0x03:  # int32
+        return pos + 4
+    elif tag in (0x04, 0x0b, 0x0d):  # double, uint64, int64
+        return pos + 8
+    elif tag == 0x05:  # complex
+        return pos + 16
+    elif tag in (_PMT_PST_PAIR, 0x09):  # pair, dict
+        return _skip_pmt(raw, _skip_pmt(raw, pos))
+    elif tag in (0x08, 0x0c):  # vector, tuple
+        length = struct.unpack(">I", raw[pos:pos + 4])[0]
+        pos += 4
+        for i in range(length):
+            pos = _skip_pmt(raw, pos)
+        return pos
+    elif tag == _PMT_PST_UNIFORM_VECTOR:
+        item_sizes = [1, 1, 2, 2, 4, 4, 8, 8, 4, 8, 8, 16]
+        item_size = item_sizes[ord(raw[pos:pos + 1])]
+        length, npad = struct.unpack(">IB", raw[pos + 1:pos + 6])
+        return pos + 6 + npad + length * item_size
+    raise BurstFileError("Unknown PMT type %s" % tag)
+
+
+class BurstFileWriter(object):
+    """
+    Writes bursts in gr-gsm's burst file format.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "wb")
+
+    def write(self, bursts):
+        """
+        Append bursts to the file.
+
+        :param bursts: the bursts to write.
+        :type bursts: Bursts
+        """
+        records = bursts.records
+        if records.dtype != RECORD_DTYPE:
+            records = to_records(bursts)
+        records.tofile(self._file)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def to_records(bursts):
+    """
+    Convert bursts into records of gr-gsm's burst file layout.
+
+    :param bursts: the bursts to convert.
+    :return: an array of RECORD_DTYPE.
+    """
+    records = numpy.zeros(len(bursts), dtype=RECORD_DTYPE)
+    records['pmt_header'] = _PMT_RECORD_HEADER
+    records['version'] = _GSMTAP_VERSION
+    records['hdr_len'] = GSMTAP_HEADER_SIZE // 4
+    records['type'] = _GSMTAP_TYPE_UM_BURST
+    records['timeslot'] = bursts.timeslots
+    records['arfcn'] = bursts.raw_arfcns
+    records['signal_dbm'] = bursts.signal_dbm
+    records['snr_db'] = bursts.snr_db
+    records['frame_number'] = bursts.framenumbers
+    records['sub_type'] = bursts.burst_types
+    records['antenna_nr'] = bursts.antennas
+    records['sub_slot'] = bursts.sub_slots
+    records['bits'] = bursts.bits
+    return records
+
+
+# The compact burst file format starts with COMPACT_MAGIC, followed by the length of the header (u32, little
+# endian) and the header, which is a JSON object holding the format version and the capture metadata. The header
+# is padded to a multiple of COMPACT_ALIGNMENT bytes and followed by the records of COMPACT_RECORD_DTYPE.
+COMPACT_MAGIC = b"GATBURST"
+COMPACT_VERSION = 2
+COMPACT_ALIGNMENT = 64
+COMPACT_METADATA_KEYS = ("band", "fc", "ppm", "samp_rate")
+
+COMPACT_RECORD_DTYPE = numpy.dtype([
+    ('frame_number', '<u4'),
+    ('timeslot', numpy.uint8),
+    ('arfcn', '<u2'),
+    ('signal_dbm', numpy.int8),
+    ('snr_db', numpy.int8),
+    ('sub_type', numpy.uint8),
+    ('antenna_nr', numpy.uint8),
+    ('sub_slot', numpy.uint8),
+    ('packed_bits', numpy.uint8, ((BURST_SIZE + 7) // 8,)),
+])
+
+
+def is_compact_burst_file(path):
+    """
+    :param path: path of a burst file.
+    :return: True if the file is in the compact burst file format, False if it is a gr-gsm burst file.
+    """
+    with open(path, "rb") as burst_file:
+        return burst_file.read(len(COMPACT_MAGIC)) == COMPACT_MAGIC
+
+
+class CompactBurstFile(CompactBursts):
+    """
+    Reader for compact burst files.
+    The file is memory-mapped and its records are used as they are, so opening a file does not require any parsing.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path of the compact burst file.
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = None
+        size = os.fstat(self._file.fileno()).st_size
+
+        header = self._file.read(len(COMPACT_MAGIC) + 4)
+        if len(header) < len(COMPACT_MAGIC) + 4 or header[:len(COMPACT_MAGIC)] != COMPACT_MAGIC:
+            self._file.close()
+            raise BurstFileError("%s is not a compact burst file" % path)
+        header_length = struct.unpack("<I", header[len(COMPACT_MAGIC):])[0]
+        try:
+            header = json.loads(self._file.read(header_length).decode("utf-8"))
+        except ValueError:
+            self._file.close()
+            raise BurstFileError("Invalid header in %s" % path)
+        if header.get("version") != COMPACT_VERSION:
+            self._file.close()
+            raise BurstFileError("Unsupported compact burst file version %s" % header.get("version"))
+
+        self.metadata = header.get("metadata", dict())
+        self.start = len(COMPACT_MAGIC) + 4 + header_length
+        # a trailing incomplete record, i.e. of an interrupted write, is ignored
+        count = max(size - self.start, 0) // COMPACT_RECORD_DTYPE.itemsize
+
+        if count > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            records = numpy.frombuffer(self._mmap, dtype=COMPACT_RECORD_DTYPE, count=count, offset=self.start)
+        else:
+            records = numpy.zeros(0, dtype=COMPACT_RECORD_DTYPE)
+        super(CompactBurstFile, self).__init__(records)
+
+    def close(self):
+        self._records = self._records[:0].copy()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # views on the mapping are still referenced, it is unmapped once they are released
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class CompactBurstFileWriter(object):
+    """
+    Writes bursts in the compact burst file format.
+    """
+
+    def __init__(self, path, metadata=None):
+        """
+        :param path: path of the compact burst file.
+        :param metadata: capture metadata, a dictionary holding any of COMPACT_METADATA_KEYS.
+        """
+        self.path = path
+        self.metadata = dict((key, value) for key, value in (metadata or dict()).items()
+                             if key in COMPACT_METADATA_KEYS and value is not None)
+
+        header = json.dumps({"version": COMPACT_VERSION, "metadata": self.metadata}, sort_keys=True).encode("utf-8")
+        prefix_length = len(COMPACT_MAGIC) + 4
+        header += b" " * (-(prefix_length + len(header)) % COMPACT_ALIGNMENT)
+
+        self._file = open(path, "wb")
+        self._file.write(COMPACT_MAGIC + struct.pack("<I", len(header)) + header)
+
+    def write(self, bursts):
+        """
+        Append bursts to the file.
+
+        :param bursts: the bursts to write.
+        :type bursts: Bursts
+        """
+        records = bursts.records
+        if records.dtype != COMPACT_RECORD_DTYPE:
+            records = to_compact_records(bursts)
+        records.tofile(self._file)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def to_compact_records(bursts):
+    """
+    Convert bursts into records of the compact burst file layout.
+
+    :param bursts: the bursts to convert.
+    :return: an array of COMPACT_RECORD_DTYPE.
+    """
+    records = numpy.zeros(len(bursts), dtype=COMPACT_RECORD_DTYPE)
+    records['frame_number'] = bursts.framenumbers
+    records['timeslot'] = bursts.timeslots
+    records['arfcn'] = bursts.raw_arfcns
+    records['signal_dbm'] = bursts.signal_dbm
+    records['snr_db'] = bursts.snr_db
+    records['sub_type'] = bursts.burst_types
+    records['antenna_nr'] = bursts.antennas
+    records['sub_slot'] = bursts.sub_slots
+    records['packed_bits'] = numpy.packbits(bursts.bits, axis=1)
+    return records
+
+
+def open_burst_file(path):
+    """
+    Open a burst file of either format.
+
+    :param path: path of the burst file.
+    :return: a BurstFile or a CompactBurstFile.
+    """
+    if is_compact_burst_file(path):
+        return CompactBurstFile(path)
+    return BurstFile(path)
+
+
+def compact_metadata(path):
+    """
+    :param path: path of a burst file.
+    :return: the capture metadata of a compact burst file, None for gr-gsm burst files.
+    """
+    if not is_compact_burst_file(path):
+        return None
+    with CompactBurstFile(path) as bursts:
+        return bursts.metadata
+
+
+def burst_file_writer(path, compact=False, metadata=None):
+    """
+    Create a writer for the given format.
+
+    :param path: path of the burst file.
+    :param compact: if True, the compact burst file format is written, otherwise gr-gsm's format.
+    :param metadata: capture metadata, only stored in compact burst files.
+    :return: a BurstFileWriter or a CompactBurstFileWriter.
+    """
+    if compact:
+        return CompactBurstFileWriter(path, metadata)
+    return BurstFileWriter(path)
+
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+INDEX_STRIDE = 1024
+
+
+class _SparseTable(object):
+    """
+    Sparse table of framenumber -> byte offset entries, grouped in segments of non-decreasing framenumbers.
+    """
+
+    def __init__(self, fnrs, offsets, bounds, ends, last_fnrs):
+        """
+        :param fnrs: framenumbers of the indexed bursts.
+        :param offsets: record offsets of the indexed bursts.
+        :param bounds: index of the first entry of each segment, followed by the number of entries.
+        :param ends: byte offset after the last record of each segment.
+        :param last_fnrs: framenumber of the last burst of each segment.
+        """
+        self.fnrs = fnrs
+        self.offsets = offsets
+        self.bounds = bounds
+        self.ends = ends
+        self.last_fnrs = last_fnrs
+
+    def byte_ranges(self, framenr_ge=None, framenr_le=None):
+        """
+        Get the byte ranges that hold all bursts within the given framenumbers.
+        The ranges may also contain bursts outside of the framenumbers.
+
+        :return: a list of (start, stop) tuples.
+        """
+        result = []
+        for segment in range(len(self.ends)):
+            fnrs = self.fnrs[self.bounds[segment]:self.bounds[segment + 1]]
+            offsets = self.offsets[self.bounds[segment]:self.bounds[segment + 1]]
+
+            if framenr_ge is not None and self.last_fnrs[segment] < framenr_ge:
+                continue
+            if framenr_le is not None and fnrs[0] > framenr_le:
+                continue
+
+            first = 0
+            if framenr_ge is not None:
+                first = max(numpy.searchsorted(fnrs, framenr_ge, side='left') - 1, 0)
+            last = len(fnrs)
+            if framenr_le is not None:
+                last = numpy.searchsorted(fnrs, framenr_le, side='right')
+
+            stop = offsets[last] if last < len(fnrs) else self.ends[segment]
+            result.append((int(offsets[first]), int(stop)))
+        return result
+
+    def to_dict(self, name):
+        return {name + "_fnrs": self.fnrs, name + "_offsets": self.offsets, name + "_bounds": self.bounds,
+                name + "_ends": self.ends, name + "_last_fnrs": self.last_fnrs}
+
+    @staticmethod
+    def from_dict(data, name):
+        return _SparseTable(data[name + "_fnrs"], data[name + "_offsets"], data[name + "_bounds"],
+                            data[name + "_ends"], data[name + "_last_fnrs"])
+
+
+class _SparseTableBuilder(object):
+    def __init__(self, stride):
+        self.stride = stride
+        self.count = 0
+        self.last_fnr = None
+        self.last_end = None
+        self.fnrs = []
+        self.offsets = []
+        self.bounds = []
+        self.ends = []
+        self.last_fnrs = []
+
+    def add(self, fnrs, offsets, ends):
+        if len(fnrs) == 0:
+            return
+        previous = numpy.empty(len(fnrs), dtype=numpy.int64)
+        previous[1:] = fnrs[:-1]
+        previous[0] = fnrs[0] if self.last_fnr is None else self.last_fnr
+        segment_starts = fnrs < previous
+        if self.last_fnr is None:
+            segment_starts[0] = True
+
+        entries = segment_starts | ((numpy.arange(len(fnrs)) + self.count) % self.stride == 0)
+        entry_positions = numpy.flatnonzero(entries)
+        number_of_entries = sum(len(f) for f in self.fnrs)
+
+        for position in numpy.flatnonzero(segment_starts):
+            if position > 0:
+                self.ends.append(ends[position - 1])
+                self.last_fnrs.append(fnrs[position - 1])
+            elif self.last_fnr is not None:
+                self.ends.append(self.last_end)
+                self.last_fnrs.append(self.last_fnr)
+            self.bounds.append(number_of_entries + numpy.searchsorted(entry_positions, position))
+
+        self.fnrs.append(fnrs[entries])
+        self.offsets.append(offsets[entries])
+        self.count += len(fnrs)
+        self.last_fnr = fnrs[-1]
+        self.last_end = ends[-1]
+
+    def finish(self):
+        fnrs = numpy.concatenate(self.fnrs) if self.fnrs else numpy.zeros(0, dtype=numpy.int64)
+        ends = list(self.ends)
+        last_fnrs = list(self.last_fnrs)
+        if self.last_fnr is not None:
+            ends.append(self.last_end)
+            last_fnrs.append(self.last_fnr)
+        return _SparseTable(fnrs,
+                            numpy.concatenate(self.offsets) if self.offsets else numpy.zeros(0, dtype=numpy.int64),
+                            numpy.array(self.bounds + [len(fnrs)], dtype=numpy.int64),
+                            numpy.array(ends, dtype=numpy.int64),
+                            numpy.array(last_fnrs, dtype=numpy.int64))
+
+
+class BurstIndex(object):
+    """
+    Sparse index of a burst file, which is stored next to the burst file.
+
+    The index maps the framenumber of every INDEX_STRIDE-th burst to the byte offset of its record, both over all
+    bursts and per timeslot. This allows to read only the parts of a burst file that hold a given range of
+    framenumbers instead of scanning the whole file.
+    """
+
+    def __init__(self, burst_file, size, mtime, table, timeslot_tables, timeslot_counts):
+        self.burst_file = burst_file
+        self.size = size
+        self.mtime = mtime
+        self.table = table
+        self.timeslot_tables = timeslot_tables
+        self.timeslot_counts = timeslot_counts
+
+    @staticmethod
+    def index_path(burst_file):
+        return burst_file + INDEX_SUFFIX
+
+    @staticmethod
+    def build(burst_file, save=True):
+        """
+        Create the index of a burst file.
+
+        :param burst_file: path of the burst file.
+        :param save: if True, the index is stored next to the burst file.
+        :return: the index.
+        """
+        stat = os.stat(burst_file)
+        builder = _SparseTableBuilder(INDEX_STRIDE)
+        timeslot_builders = [_SparseTableBuilder(INDEX_STRIDE) for i in range(8)]
+        timeslot_counts = numpy.zeros(8, dtype=numpy.int64)
+
+        with BurstFile(burst_file) as bursts:
+            offsets = bursts.record_offsets()
+            ends = numpy.append(offsets[1:], bursts.stop)
+            for start in range(0, len(bursts), 65536):
+                chunk = bursts[start:start + 65536]
+                fnrs = chunk.framenumbers.astype(numpy.int64)
+                timeslots = chunk.timeslots & 0x07
+                chunk_offsets = offsets[start:start + 65536]
+                chunk_ends = ends[start:start + 65536]
+
+                builder.add(fnrs, chunk_offsets, chunk_ends)
+                timeslot_counts += numpy.bincount(timeslots, minlength=8)
+                for timeslot in range(8):
+                    selected = timeslots == timeslot
+                    timeslot_builders[timeslot].add(fnrs[selected], chunk_offsets[selected], chunk_ends[selected])
+
+        index = BurstIndex(burst_file, stat.st_size, stat.st_mtime, builder.finish(),
+                           [b.finish() for b in timeslot_builders], timeslot_counts)
+        if save:
+            index.save()
+        return index
+
+    @staticmethod
+    def load(burst_file):
+        """
+        Load the index of a burst file. The index is built on first use or if the burst file has changed since.
+
+        :param burst_file: path of the burst file.
+        :return: the index.
+        """
+        path = BurstIndex.index_path(burst_file)
+        if os.path.isfile(path):
+            stat = os.stat(burst_file)
+            try:
+                with open(path, "rb") as index_file:
+                    data = numpy.load(index_file)
+                    if int(data["version"]) == INDEX_VERSION and int(data["size"]) == stat.st_size \
+                            and float(data["mtime"]) == stat.st_mtime:
+                        return BurstIndex(burst_file, stat.st_size, stat.st_mtime,
+                                          _SparseTable.from_dict(data, "all"),
+                                          [_SparseTable.from_dict(data, "ts%s" % i) for i in range(8)],
+                                          data["timeslot_counts"])
+            except (IOError, ValueError, KeyError):
+                pass  # the index is rebuilt
+        return BurstIndex.build(burst_file)
+
+    def save(self):
+        data = dict(version=INDEX_VERSION, size=self.size, mtime=self.mtime, timeslot_counts=self.timeslot_counts)
+        data.update(self.table.to_dict("all"))
+        for timeslot in range(8):
+            data.update(self.timeslot_tables[timeslot].to_dict("ts%s" % timeslot))
+        try:
+            with open(self.index_path(self.burst_file), "wb") as index_file:
+                numpy.savez(index_file, **data)
+        except (IOError, OSError):
+            pass  # the index is only an optimization, e.g. the burst file might be on read-only storage
+
+    def byte_ranges(self, framenr_ge=None, framenr_le=None, timeslot=None):
+        """
+        Get the byte ranges of the burst file that hold all bursts within the given framenumbers.
+
+        :param framenr_ge: lowest framenumber.
+        :param framenr_le: highest framenumber.
+        :param timeslot: if set, the ranges only need to cover the bursts on this timeslot.
+        :return: a list of (start, stop) tuples.
+        """
+        table = self.table if timeslot is None else self.timeslot_tables[timeslot]
+        return table.byte_ranges(framenr_ge, framenr_le)
+
+
+def read_bursts(burst_file, chunk_size=65536, window=None, **criteria):
+    """
+    Iterate over the bursts of a burst file that match the given criteria, in chunks.
+    Both gr-gsm and compact burst files are supported. If the framenumbers of a gr-gsm burst file are restricted,
+    the burst file's index is used to read only the relevant parts of the file.
+
+    :param burst_file: path of the burst file.
+    :param chunk_size: maximum number of bursts read at once.
+    :param window: allow only framenumbers within the window, which may span the hyperframe wraparound.
+    :type window: FnrWindow
+    :param criteria: filter criteria, see Bursts.mask().
+    """
+    if window is not None:
+        # the window is read as framenumber ranges that do not wrap around, so each of them maps to index seeks
+        for first, last in window.ranges():
+            range_criteria = dict(criteria)
+            if criteria.get("framenr_ge") is not None:
+                first = max(first, criteria["framenr_ge"])
+            if criteria.get("framenr_le") is not None:
+                last = min(last, criteria["framenr_le"])
+            if first > last:
+                continue
+            range_criteria.update(framenr_ge=first, framenr_le=last)
+            for bursts in read_bursts(burst_file, chunk_size, **range_criteria):
+                yield bursts
+        return
+
+    if is_compact_burst_file(burst_file):
+        # the framenumbers of compact burst files are read directly from their column, no index is required
+        with CompactBurstFile(burst_file) as bursts:
+            for chunk in bursts.chunks(chunk_size):
+                selected = chunk.filter(**criteria)
+                if len(selected) > 0:
+                    yield selected
+        return
+
+    framenr_ge = criteria.get("framenr_ge")
+    framenr_le = criteria.get("framenr_le")
+
+    if framenr_ge is None and framenr_le is None:
+        ranges = [(0, None)]
+    else:
+        ranges = BurstIndex.load(burst_file).byte_ranges(framenr_ge, framenr_le, criteria.get("timeslot"))
+
+    for start, stop in ranges:
+        with BurstFile(burst_file, start, stop) as bursts:
+            for chunk in bursts.chunks(chunk_size):
+                selected = chunk.filter(**criteria)
+                if len(selected) > 0:
+                    yield selected
+
+
+class BurstSelection(object):
+    """
+    Temporary burst file holding the bursts of a burst file that match the given criteria.
+    Filtering is done on the memory-mapped burst file, so that gr-gsm flowgraphs only have to process the
+    selected bursts. The temporary file is always in gr-gsm's format.
+    """
+
+    def __init__(self, burst_file, **criteria):
+        """
+        :param burst_file: path of the source burst file, either a gr-gsm or a compact burst file.
+        :param criteria: filter criteria, see read_bursts().
+        """
+        fd, self.path = tempfile.mkstemp(suffix=".bursts", prefix="gat-")
+        os.close(fd)
+
+        with BurstFileWriter(self.path) as destination:
+            for bursts in read_bursts(burst_file, **criteria):
+                destination.write(bursts)
+
+    def remove(self):
+        if self.path is not None and os.path.isfile(self.path):
+            os.remove(self.path)
+        self.path = None
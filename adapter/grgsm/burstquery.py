@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+import ast
+import operator
+
+import numpy
+
+from adapter.grgsm.burstfile import SUBSLOT_SDCCH8, read_bursts
+
+# numpy.isin is not available in older NumPy versions
+_isin = getattr(numpy, "isin", None) or getattr(numpy, "in1d")
+
+# the fields that can be used in queries and the functions for retrieving them from a set of bursts
+QUERY_FIELDS = {
+    "fn": lambda bursts, subslot_mode: bursts.framenumbers.astype(numpy.int64),
+    "ts": lambda bursts, subslot_mode: bursts.timeslots.astype(numpy.int64),
+    "arfcn": lambda bursts, subslot_mode: bursts.arfcns.astype(numpy.int64),
+    "subslot": lambda bursts, subslot_mode: bursts.subslots(subslot_mode).astype(numpy.int64),
+    "dummy": lambda bursts, subslot_mode: bursts.dummy_bursts(),
+    "snr": lambda bursts, subslot_mode: bursts.snr_db.astype(numpy.int64),
+    "power": lambda bursts, subslot_mode: bursts.signal_dbm.astype(numpy.int64),
+}
+
+_COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+_ARITHMETIC = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+}
+
+
+class QueryError(Exception):
+    """
+    Signals an invalid burst query.
+    """
+    pass
+
+
+class _Fields(object):
+    """
+    Retrieves the fields of a set of bursts, every field at most once.
+    """
+
+    def __init__(self, bursts, subslot_mode):
+        self.bursts = bursts
+        self.subslot_mode = subslot_mode
+        self.values = dict()
+
+    def get(self, name):
+        if name not in self.values:
+            self.values[name] = QUERY_FIELDS[name](self.bursts, self.subslot_mode)
+        return self.values[name]
+
+
+class BurstQuery(object):
+    """
+    A query on bursts, given as a Python-like boolean expression, e.g.
+    'ts in (0, 2) and fn >= 1200000 and not dummy and subslot == 3'.
+
+    Supported are the fields of QUERY_FIELDS, integer constants, comparisons, 'in' / 'not in' with a tuple or list of
+    constants, 'and', 'or', 'not' and the arithmetic operators +, -, *, // and %.
+    The expression is compiled once and evaluated as NumPy operations over whole chunks of bursts.
+    """
+
+    def __init__(self, expression, subslot_mode=SUBSLOT_SDCCH8):
+        """
+        :param expression: the query expression.
+        :param subslot_mode: the channel combination used for the subslot field, SUBSLOT_SDCCH4 or SUBSLOT_SDCCH8.
+        """
+        self.expression = expression
+        self.subslot_mode = subslot_mode
+        try:
+            self.__tree = ast.parse(expression.strip(), mode="eval").body
+        except SyntaxError as e:
+            raise QueryError("Invalid query: %s" % e)
+        self.__evaluate = self.__compile(self.__tree)
+
+    def mask(self, bursts):
+        """
+        :param bursts: the bursts to evaluate the query for.
+        :return: a boolean mask of the bursts that match the query.
+        """
+        result = numpy.asarray(self.__evaluate(_Fields(bursts, self.subslot_mode)))
+        if result.dtype != bool:
+            raise QueryError("The query does not evaluate to a boolean value")
+        return numpy.broadcast_to(result, (len(bursts),))
+
+    def criteria(self):
+        """
+        Derive filter criteria from the framenumber and timeslot conditions that all matching bursts have to
+        fulfill. The criteria allow reading only the relevant parts of indexed burst files.
+
+        :return: a dictionary of filter criteria, see Bursts.mask().
+        """
+        conditions = self.__tree.values if self.__is_and(self.__tree) else [self.__tree]
+        criteria = dict()
+        for condition in conditions:
+            if not isinstance(condition, ast.Compare) or len(condition.ops) != 1:
+                continue
+            field = condition.left.id if isinstance(condition.left, ast.Name) else None
+            value = self.__constant(condition.comparators[0])
+            if value is None or isinstance(value, bool):
+                continue
+            op = type(condition.ops[0])
+
+            if field == "fn":
+                if op in (ast.GtE, ast.Gt, ast.Eq):
+                    lowest = value + 1 if op == ast.Gt else value
+                    criteria["framenr_ge"] = max(lowest, criteria.get("framenr_ge", lowest))
+                if op in (ast.LtE, ast.Lt, ast.Eq):
+                    highest = value - 1 if op == ast.Lt else value
+                    criteria["framenr_le"] = min(highest, criteria.get("framenr_le", highest))
+            elif field == "ts" and op == ast.Eq:
+                criteria["timeslot"] = value
+        return criteria
+
+    @staticmethod
+    def __is_and(node):
+        return isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And)
+
+    @staticmethod
+    def __constant(node):
+        """
+        :return: the value of an integer or boolean constant node, None if the node is not a constant.
+        """
+        if hasattr(ast, "Constant") and isinstance(node, ast.Constant):
+            value = node.value
+        elif hasattr(ast, "Num") and isinstance(node, ast.Num):
+            value = node.n
+        elif isinstance(node, ast.Name) and node.id in ("True", "False"):
+            value = node.id == "True"
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            value = BurstQuery.__constant(node.operand)
+            return -value if value is not None and not isinstance(value, bool) else None
+        else:
+            return None
+        if isinstance(value, bool) or isinstance(value, int) or type(value).__name__ == "long":
+            return value
+        return None
+
+    def __compile(self, node):
+        """
+        Compile an expression node into a function, which evaluates the node for the fields of a set of bursts.
+        """
+        value = self.__constant(node)
+        if value is not None:
+            return lambda fields: value
+
+        if isinstance(node, ast.Name):
+            if node.id not in QUERY_FIELDS:
+                raise QueryError("Unknown field '%s', available fields: %s" % (node.id,
+                                                                                ", ".join(sorted(QUERY_FIELDS))))
+            name = node.id
+            return lambda fields: fields.get(name)
+
+        if isinstance(node, ast.BoolOp):
+            operands = [self.__compile(operand) for operand in node.values]
+            combine = numpy.logical_and if isinstance(node.op, ast.And) else numpy.logical_or
+
+            def evaluate_bool_op(fields):
+                result = operands[0](fields)
+                for operand in operands[1:]:
+                    result = combine(result, operand(fields))
+                return result
+
+            return evaluate_bool_op
+
+        if isinstance(node, ast.UnaryOp):
+            operand = self.__compile(node.operand)
+            if isinstance(node.op, ast.Not):
+                return lambda fields: numpy.logical_not(operand(fields))
+            if isinstance(node.op, ast.USub):
+                return lambda fields: numpy.negative(operand(fields))
+
+        if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC:
+            left = self.__compile(node.left)
+            right = self.__compile(node.right)
+            function = _ARITHMETIC[type(node.op)]
+            return lambda fields: function(left(fields), right(fields))
+
+        if isinstance(node, ast.Compare):
+            return self.__compile_compare(node)
+
+        raise QueryError("Unsupported expression: %s" % type(node).__name__)
+
+    def __compile_compare(self, node):
+        left = self.__compile(node.left)
+        comparisons = []
+        for op, comparator in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)):
+                if not isinstance(comparator, (ast.Tuple, ast.List, ast.Set)):
+                    raise QueryError("'in' requires a tuple or list of constants")
+                values = [self.__constant(element) for element in comparator.elts]
+                if None in values:
+                    raise QueryError("'in' requires a tuple or list of constants")
+                comparisons.append((isinstance(op, ast.NotIn), numpy.array(values, dtype=numpy.int64)))
+            elif type(op) in _COMPARISONS:
+                comparisons.append((_COMPARISONS[type(op)], self.__compile(comparator)))
+            else:
+                raise QueryError("Unsupported comparison: %s" % type(op).__name__)
+
+        if any(isinstance(comparison, bool) for comparison, operand in comparisons[:-1]):
+            raise QueryError("'in' can only be the last comparison of a chain")
+
+        def evaluate_compare(fields):
+            # comparisons are chained like in Python, a < b < c means a < b and b < c
+            result = True
+            current = left(fields)
+            for comparison, operand in comparisons:
+                if isinstance(comparison, bool):  # 'in' or 'not in'
+                    matches = _isin(current, operand, invert=comparison)
+                else:
+                    following = operand(fields)
+                    matches = comparison(current, following)
+                    current = following
+                result = numpy.logical_and(result, matches)
+            return result
+
+        return evaluate_compare
+
+
+def query_bursts(burst_file, query, chunk_size=65536):
+    """
+    Iterate over the bursts of a burst file that match a query, in chunks.
+
+    :param burst_file: path of the burst file.
+    :param query: the query.
+    :type query: BurstQuery
+    :param chunk_size: maximum number of bursts read at once.
+    """
+    for bursts in read_bursts(burst_file, chunk_size, **query.criteria()):
+        selected = query.mask(bursts)
+        if selected.any():
+            yield bursts[selected]
+
+
+class BurstHistogram(object):
+    """
+    Counts the bursts per value of a query field.
+    """
+
+    def __init__(self, field, bin_size=1, subslot_mode=SUBSLOT_SDCCH8):
+        """
+        :param field: name of the field, see QUERY_FIELDS.
+        :param bin_size: number of consecutive values counted together.
+        :param subslot_mode: the channel combination used for the subslot field.
+        """
+        if field not in QUERY_FIELDS:
+            raise QueryError("Unknown field '%s'" % field)
+        self.field = field
+        self.bin_size = bin_size
+        self.subslot_mode = subslot_mode
+        self.counts = dict()
+
+    def add(self, bursts):
+        values = QUERY_FIELDS[self.field](bursts, self.subslot_mode).astype(numpy.int64)
+        values, counts = numpy.unique(values // self.bin_size * self.bin_size, return_counts=True)
+        for value, count in zip(values.tolist(), counts.tolist()):
+            self.counts[value] = self.counts.get(value, 0) + count
+
+    def items(self):
+        """
+        :return: a sorted list of (value, count) tuples, the value being the first one of its bin.
+        """
+        return sorted(self.counts.items())
@@ -1,40 +1,287 @@
 # -*- coding: utf-8 -*-
-import grgsm
-from gnuradio import gr
+import collections
 
-class BurstFilter(gr.top_block):
+import numpy
+
+from adapter import a51
+from adapter.grgsm.burstfile import SUBSLOT_SDCCH8, burst_file_writer, compact_metadata, is_compact_burst_file, \
+    read_bursts
+from core.common.bits import PackedBursts
+
+
+class BurstFilter(object):
     def __init__(self, source, destination, framenr_ge=None, framenr_le=None, timeslot=None, subslot=None,
                  filter_dummy_bursts=False):
-        gr.top_block.__init__(self, "Top Block")
+        self.source = source
+        self.destination = destination
+        self.criteria = dict(framenr_ge=framenr_ge, framenr_le=framenr_le, timeslot=timeslot, subslot=subslot,
+                             filter_dummy_bursts=filter_dummy_bursts)
+
+    def run(self):
+        """
+        Write the bursts of the source file that match the filter criteria to the destination file.
+        The destination file has the same format as the source file.
+
+        :return: the number of bursts written.
+        """
+        metadata = compact_metadata(self.source)
+        count = 0
+        with burst_file_writer(self.destination, metadata is not None, metadata) as destination:
+            for bursts in read_bursts(self.source, **self.criteria):
+                destination.write(bursts)
+                count += len(bursts)
+        return count
+
+
+class BurstConverter(object):
+    """
+    Converts gr-gsm burst files into compact burst files and vice versa.
+    """
+
+    def __init__(self, source, destination, metadata=None):
+        """
+        :param source: path of the source burst file.
+        :param destination: path of the destination burst file.
+        :param metadata: capture metadata stored in the destination file, if it is a compact burst file.
+        """
+        self.source = source
+        self.destination = destination
+        self.metadata = metadata
+        self.to_compact = not is_compact_burst_file(source)
+
+    def run(self):
+        """
+        Convert the source file.
+
+        :return: the number of bursts written.
+        """
+        count = 0
+        with burst_file_writer(self.destination, self.to_compact, self.metadata) as destination:
+            for bursts in read_bursts(self.source):
+                destination.write(bursts)
+                count += len(bursts)
+        return count
+
+
+class BurstDecryptor(object):
+    """
+    Deciphers the A5/1 encrypted bursts of a dedicated channel in a burst file with a known key.
+    All other bursts, e.g. the ones of the BCCH, the CCCH or other timeslots, are not encrypted and copied unchanged.
+    The keystream of all frames of a chunk of bursts is generated at once.
+    """
+
+    # position of the idle frame of a TCH/F in the 26-multiframe
+    TCH_IDLE_FRAME = 25
+
+    def __init__(self, source, destination, kc, timeslot, subslot=None, uplink=False, framenr_ge=None,
+                 framenr_le=None, subslot_mode=SUBSLOT_SDCCH8):
+        """
+        :param source: path of the source burst file.
+        :param destination: path of the destination burst file, which has the same format as the source file.
+        :param kc: the session key Kc as hex string.
+        :param timeslot: the timeslot of the dedicated channel.
+        :param subslot: the subslot of a SDCCH, whose SDCCH and SACCH bursts are deciphered. If None, the timeslot
+        holds a TCH/F, whose TCH, FACCH and SACCH bursts are deciphered.
+        :param uplink: the bursts are uplink bursts, which use the second half of the keystream of a frame.
+        :param framenr_ge: decipher only bursts with framenumbers greater than or equal the specified one, e.g. the
+        one of the Cipher Mode Command.
+        :param framenr_le: decipher only bursts with framenumbers less than or equal the specified one.
+        :param subslot_mode: the channel combination used for the subslot.
+        """
+        self.source = source
+        self.destination = destination
+        self.kc = kc
+        self.uplink = uplink
+        self.timeslot = timeslot
+        self.subslot = subslot
+        self.subslot_mode = subslot_mode
+        self.framenr_ge = framenr_ge
+        self.framenr_le = framenr_le
+
+    def __encrypted(self, bursts):
+        """
+        :return: a boolean mask of the bursts that belong to the dedicated channel and are encrypted.
+        """
+        mask = bursts.mask(framenr_ge=self.framenr_ge, framenr_le=self.framenr_le, timeslot=self.timeslot,
+                           subslot=self.subslot, subslot_mode=self.subslot_mode)
+        if self.subslot is None:
+            mask &= bursts.framenumbers % 26 != self.TCH_IDLE_FRAME
+        return mask & ~bursts.dummy_bursts()
+
+    def run(self):
+        """
+        Write all bursts of the source file to the destination file, with the bursts of the dedicated channel
+        deciphered.
+
+        :return: the number of bursts written and the number of bursts deciphered.
+        """
+        key = a51.key_to_bits([self.kc])
+        offset = a51.KEYSTREAM_SIZE if self.uplink else 0
+
+        metadata = compact_metadata(self.source)
+        count = 0
+        deciphered = 0
+        with burst_file_writer(self.destination, metadata is not None, metadata) as destination:
+            for bursts in read_bursts(self.source):
+                encrypted = self.__encrypted(bursts)
+                if encrypted.any():
+                    selected = bursts[encrypted]
+                    # all bursts of a frame share the keystream
+                    framenumbers, frames = numpy.unique(selected.framenumbers.astype(numpy.int64),
+                                                        return_inverse=True)
+                    keystream = a51.keystream(key, a51.fn2count(framenumbers), 2 * a51.KEYSTREAM_SIZE)
+                    keystream = keystream[frames.ravel(), offset:offset + a51.KEYSTREAM_SIZE]
+                    payloads = numpy.array(bursts.payloads, dtype=numpy.uint8)
+                    payloads[encrypted] ^= keystream
+                    bursts = bursts.with_payloads(payloads)
+                    deciphered += len(selected)
+                destination.write(bursts)
+                count += len(bursts)
+        return count, deciphered
+
+
+class BurstCollector(object):
+    """
+    Collects the payloads of the bursts with the given framenumbers into a preallocated packed array.
+    Only the requested bursts are retained, regardless of the size of the burst file.
+    """
+
+    def __init__(self, source, framenumbers, timeslot=None, window=None):
+        """
+        :param source: path of the source burst file.
+        :param framenumbers: framenumbers of the bursts to collect.
+        :param timeslot: collect only bursts on the specified timeslot.
+        :param window: read only the framenumbers within the window.
+        :type window: FnrWindow
+        """
+        self.source = source
+        self.framenumbers = framenumbers
+        self.timeslot = timeslot
+        self.window = window
+
+    def run(self):
+        """
+        :return: the collected payloads.
+        :rtype: PackedBursts
+        """
+        collected = PackedBursts.allocate(self.framenumbers)
+        for bursts in read_bursts(self.source, timeslot=self.timeslot, window=self.window):
+            selected = bursts[collected.allocated(bursts.framenumbers)]
+            collected.store(selected.framenumbers, selected.payloads, selected.snr_db)
+        return collected
+
+
+class BurstSplitter(object):
+    """
+    Writes the bursts of a burst file to several destination files, reading the source file only once.
+
+    Destinations are either added with filter criteria, like the ones of BurstFilter, or as partitions, which
+    distribute the bursts over a number of files by a key, e.g. the timeslot. All destination files have the same
+    format as the source file.
+    """
+
+    def __init__(self, source, filter_dummy_bursts=False):
+        """
+        :param source: path of the source burst file.
+        :param filter_dummy_bursts: remove dummy bursts from all destination files.
+        """
+        self.source = source
+        self.filter_dummy_bursts = filter_dummy_bursts
+        self.outputs = []
+        self.partitions = []
+
+    def add_output(self, destination, framenr_ge=None, framenr_le=None, timeslot=None, subslot=None,
+                   subslot_mode=SUBSLOT_SDCCH8, filter_dummy_bursts=False):
+        """
+        Add a destination file for the bursts matching the given criteria, see Bursts.mask().
+        """
+        self.outputs.append((destination, dict(framenr_ge=framenr_ge, framenr_le=framenr_le, timeslot=timeslot,
+                                               subslot=subslot, subslot_mode=subslot_mode,
+                                               filter_dummy_bursts=filter_dummy_bursts)))
+
+    def add_partition(self, key, destination):
+        """
+        Add a partition of the bursts.
+
+        :param key: function returning an integer key for each of the bursts passed to it, -1 skips a burst.
+        :param destination: function returning the path of the destination file for a key.
+        """
+        self.partitions.append((key, destination))
+
+    def run(self):
+        """
+        Split the source file.
+
+        :return: an ordered dictionary holding the number of bursts written to each destination file.
+        """
+        metadata = compact_metadata(self.source)
+        compact = metadata is not None
+        writers = collections.OrderedDict()
+        counts = collections.OrderedDict()
+
+        def open_writer(destination):
+            if destination not in writers:
+                writers[destination] = burst_file_writer(destination, compact, metadata)
+                counts[destination] = 0
+
+        def write(destination, bursts):
+            open_writer(destination)
+            writers[destination].write(bursts)
+            counts[destination] += len(bursts)
+
+        try:
+            for destination, criteria in self.outputs:
+                open_writer(destination)  # files of filtered outputs are created even if no burst matches
+
+            for bursts in read_bursts(self.source, filter_dummy_bursts=self.filter_dummy_bursts):
+                for destination, criteria in self.outputs:
+                    selected = bursts.mask(**criteria)
+                    if selected.any():
+                        write(destination, bursts[selected])
+
+                for key, destination in self.partitions:
+                    keys = numpy.asarray(key(bursts), dtype=numpy.int64)
+                    order = numpy.argsort(keys, kind="mergesort")  # stable, so bursts keep their order
+                    sorted_keys = keys[order]
+                    boundaries = numpy.flatnonzero(numpy.diff(sorted_keys)) + 1
+                    for group in numpy.split(order, boundaries):
+                        if len(group) > 0 and keys[group[0]] >= 0:
+                            write(destination(int(keys[group[0]])), bursts[group])
+        finally:
+            for writer in writers.values():
+                writer.close()
+        return counts
+
+
+def timeslot_key(bursts):
+    return bursts.timeslots
 
-        self.burst_file_source = grgsm.burst_file_source(source)
-        self.burst_file_sink = grgsm.burst_file_sink(destination)
 
-        lastblock = self.burst_file_source
+# subslots per timeslot in subslot partition keys, SDCCH/8 has the most
+SUBSLOTS_PER_TIMESLOT = 8
 
-        if framenr_ge is not None:
-            self.burst_fnr_filterge = grgsm.burst_fnr_filter(grgsm.FILTER_GREATER_OR_EQUAL, framenr_ge)
-            self.msg_connect((lastblock, 'out'), (self.burst_fnr_filterge, 'in'))
-            lastblock = self.burst_fnr_filterge
 
-        if framenr_le is not None:
-            self.burst_fnr_filterle = grgsm.burst_fnr_filter(grgsm.FILTER_LESS_OR_EQUAL, framenr_le)
-            self.msg_connect((lastblock, 'out'), (self.burst_fnr_filterle, 'in'))
-            lastblock = self.burst_fnr_filterle
+def subslot_key(subslot_mode):
+    """
+    :return: a partition key function for the SDCCH subslots of the given channel combination on each timeslot.
+    The key is timeslot * SUBSLOTS_PER_TIMESLOT + subslot, see subslot_of_key().
+    """
+    def key(bursts):
+        subslots = bursts.subslots(subslot_mode).astype(numpy.int64)
+        return numpy.where(subslots >= 0, bursts.timeslots.astype(numpy.int64) * SUBSLOTS_PER_TIMESLOT + subslots, -1)
+    return key
 
-        if timeslot is not None:
-            self.burst_timeslot_filter = grgsm.burst_timeslot_filter(timeslot)
-            self.msg_connect((lastblock, 'out'), (self.burst_timeslot_filter, 'in'))
-            lastblock = self.burst_timeslot_filter
 
-        if subslot is not None:
-            self.burst_sdcch_subslot_filter = grgsm.burst_sdcch_subslot_filter(grgsm.SS_FILTER_SDCCH8, subslot)
-            self.msg_connect((lastblock, 'out'), (self.burst_sdcch_subslot_filter, 'in'))
-            lastblock = self.burst_sdcch_subslot_filter
+def subslot_of_key(key):
+    """
+    :param key: a key of subslot_key().
+    :return: the timeslot and the subslot.
+    """
+    return divmod(key, SUBSLOTS_PER_TIMESLOT)
 
-        if filter_dummy_bursts:
-            self.dummy_burst_filter = grgsm.dummy_burst_filter()
-            self.msg_connect((lastblock, 'out'), (self.dummy_burst_filter, 'in'))
-            lastblock = self.dummy_burst_filter
 
-        self.msg_connect((lastblock, 'out'), (self.burst_file_sink, 'in'))
+def framenumber_key(bucket_size):
+    """
+    :return: a partition key function for buckets of bucket_size consecutive framenumbers.
+    """
+    return lambda bursts: bursts.framenumbers // bucket_size
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import numpy
+
+from adapter.grgsm.burstfile import SUBSLOT_SDCCH8, read_bursts
+from core.common.fnr_window import MAX_FNR
+
+FRAMES_PER_MULTIFRAME = 51
+
+
+class BurstStatistics(object):
+    """
+    Statistics of a burst file, collected chunk by chunk in a single pass.
+    Bursts are expected in the order gr-gsm writes them, i.e. ordered by framenumber apart from hyperframe
+    wraparounds.
+    """
+
+    def __init__(self, subslot_mode=SUBSLOT_SDCCH8):
+        """
+        :param subslot_mode: the channel combination used for counting bursts per subslot.
+        """
+        self.subslot_mode = subslot_mode
+        self.count = 0
+        self.dummy_count = 0
+        self.timeslot_counts = numpy.zeros(8, dtype=numpy.int64)
+        # per timeslot, index 0 counts bursts that do not belong to a SDCCH or SACCH, index i + 1 the ones of
+        # subslot i
+        self.subslot_counts = numpy.zeros((8, 9), dtype=numpy.int64)
+        self.first_fnr = None
+        self.last_fnr = None
+        self.min_fnr = None
+        self.max_fnr = None
+        self.wraparounds = 0
+        self.frames = 0
+        self.gaps = 0
+        self.missing_frames = 0
+        self.longest_gap = 0
+        self.multiframe_frames = []  # number of frames with bursts of each completed multiframe
+        self.__multiframe = None
+        self.__multiframe_frames = 0
+
+    def add(self, bursts):
+        """
+        Add a chunk of bursts to the statistics.
+        """
+        if len(bursts) == 0:
+            return
+        fnrs = bursts.framenumbers.astype(numpy.int64)
+
+        self.count += len(bursts)
+        self.dummy_count += int(numpy.count_nonzero(bursts.dummy_bursts()))
+        timeslots = (bursts.timeslots & 0x07).astype(numpy.int64)
+        self.timeslot_counts += numpy.bincount(timeslots, minlength=8)
+        subslots = bursts.subslots(self.subslot_mode).astype(numpy.int64) + 1
+        self.subslot_counts += numpy.bincount(timeslots * 9 + subslots, minlength=8 * 9).reshape(8, 9)
+
+        if self.first_fnr is None:
+            self.first_fnr = int(fnrs[0])
+            self.min_fnr = int(fnrs.min())
+            self.max_fnr = int(fnrs.max())
+            differences = numpy.diff(fnrs)
+            frames = fnrs[numpy.concatenate(([True], differences != 0))]
+        else:
+            self.min_fnr = min(self.min_fnr, int(fnrs.min()))
+            self.max_fnr = max(self.max_fnr, int(fnrs.max()))
+            differences = numpy.diff(numpy.concatenate(([self.last_fnr], fnrs)))
+            frames = fnrs[differences != 0]
+        self.last_fnr = int(fnrs[-1])
+
+        wraparound = differences < -MAX_FNR // 2
+        self.wraparounds += int(numpy.count_nonzero(wraparound))
+        steps = numpy.where(wraparound, differences + MAX_FNR, differences)
+        gap_sizes = steps[steps > 1] - 1
+        if len(gap_sizes) > 0:
+            self.gaps += len(gap_sizes)
+            self.missing_frames += int(gap_sizes.sum())
+            self.longest_gap = max(self.longest_gap, int(gap_sizes.max()))
+
+        self.frames += len(frames)
+        self.__add_multiframes(frames // FRAMES_PER_MULTIFRAME)
+
+    def __add_multiframes(self, multiframes):
+        """
+        Count the frames per multiframe, using run lengths of the multiframe numbers of consecutive frames.
+        """
+        if len(multiframes) == 0:
+            return
+        starts = numpy.flatnonzero(numpy.concatenate(([True], numpy.diff(multiframes) != 0)))
+        lengths = numpy.diff(numpy.append(starts, len(multiframes)))
+
+        if self.__multiframe == multiframes[0]:
+            self.__multiframe_frames += int(lengths[0])
+        else:
+            self.__finish_multiframe()
+            self.__multiframe_frames = int(lengths[0])
+        if len(starts) > 1:
+            self.multiframe_frames.append(self.__multiframe_frames)
+            self.multiframe_frames.extend(lengths[1:-1].tolist())
+            self.__multiframe_frames = int(lengths[-1])
+        self.__multiframe = int(multiframes[-1])
+
+    def __finish_multiframe(self):
+        if self.__multiframe is not None:
+            self.multiframe_frames.append(self.__multiframe_frames)
+            self.__multiframe = None
+
+    def finish(self):
+        """
+        Complete the statistics after the last chunk was added.
+        """
+        self.__finish_multiframe()
+        return self
+
+    @property
+    def dummy_ratio(self):
+        return float(self.dummy_count) / self.count if self.count > 0 else 0.0
+
+    @property
+    def multiframe_occupancy(self):
+        """
+        :return: the mean share of frames of a 51-multiframe that hold bursts.
+        """
+        if len(self.multiframe_frames) == 0:
+            return 0.0
+        return float(sum(self.multiframe_frames)) / (len(self.multiframe_frames) * FRAMES_PER_MULTIFRAME)
+
+    @property
+    def complete_multiframes(self):
+        """
+        :return: the number of 51-multiframes that hold bursts in all of their frames.
+        """
+        return sum(1 for frames in self.multiframe_frames if frames >= FRAMES_PER_MULTIFRAME)
+
+
+def collect_statistics(burst_file, subslot_mode=SUBSLOT_SDCCH8):
+    """
+    Collect the statistics of a burst file in a single pass.
+
+    :param burst_file: path of the burst file, either a gr-gsm or a compact burst file.
+    :param subslot_mode: the channel combination used for counting bursts per subslot.
+    :return: the statistics.
+    """
+    statistics = BurstStatistics(subslot_mode)
+    for bursts in read_bursts(burst_file):
+        statistics.add(bursts)
+    return statistics.finish()
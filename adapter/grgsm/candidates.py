@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import binascii
+
+from adapter.grgsm.cmc_analyzer import PRECEDING_MESSAGES
+from core.adapterinterfaces.a5 import A5ReconstructionAdapter
+from core.common.fnr_window import fnr_add
+
+LAPDM_UI = "LAPDm UI"
+
+
+class Candidate(object):
+    """
+    A burst set together with what is known about its plaintext guess.
+    """
+
+    def __init__(self, burst_set, channel, message, plaintext, observed=True):
+        """
+        :type burst_set: A5BurstSet
+        :param channel: "SDCCH" or "SACCH".
+        :param message: index of the message after the CMC (SDCCH) or after the last System Information message
+        before the CMC (SACCH), starting at 0.
+        :param plaintext: the guessed message, LAPDM_UI or the System Information type.
+        :param observed: if the plaintext was seen on the attacked channel itself, not only on other channels.
+        """
+        self.burst_set = burst_set
+        self.channel = channel
+        self.message = message
+        self.plaintext = plaintext
+        self.observed = observed
+        self.score = None
+
+
+class CandidateRanker(object):
+    """
+    Ranks the burst sets of a session by the probability that their plaintext guess is right and the bursts are
+    received without errors, so that Kraken gets the best candidates first.
+
+    The probabilities are rough estimates, based on evidence from the capture:
+    - the unciphered SDCCH messages before the CMC tell whether the network sends standard fill frames,
+    - the System Information messages on the SACCH tell how regular the cycle of their types is,
+    - the timing advance on the SACCH tells whether the L1 header of the next messages can be predicted,
+    - the SNR of the bursts tells how likely bit errors are.
+    """
+
+    # probability that the n-th SDCCH message after the CMC is a fill frame: the first one is often an
+    # acknowledgement of the Ciphering Mode Complete
+    SDCCH_PRIORS = [0.3, 0.5, 0.6, 0.6, 0.6]
+    # SNR in dB from which bit errors are unlikely
+    GOOD_SNR = 12.0
+
+    def __init__(self, cmc_analysis, fnr_cmc, window):
+        """
+        :type cmc_analysis: CMCAnalysis
+        :param fnr_cmc: framenumber of the CMC.
+        :param window: the framenumbers around the CMC.
+        :type window: FnrWindow
+        """
+        self.cmc_analysis = cmc_analysis
+        self.fnr_cmc = fnr_cmc
+        self.window = window
+        self.subchannel = cmc_analysis.get_subchannel(fnr_cmc)
+        self.fill_frames = self.__fill_frame_evidence()
+        self.si_cycle_regularity = self.__si_cycle_regularity()
+        self.ta_stable = self.__ta_stable()
+
+    def __fill_frame_evidence(self):
+        """
+        :return: True if a standard fill frame precedes the CMC, False if all preceding messages were received and
+        none is a fill frame, which hints at randomized fill frames, None if there is no evidence.
+        """
+        bursts = self.cmc_analysis.bursts
+        complete = 0
+        for i in range(1, PRECEDING_MESSAGES + 1):
+            fnrs = [fnr_add(self.fnr_cmc, -i * 51 + j) for j in range(4)]
+            if not all(fnr in bursts for fnr in fnrs):
+                continue
+            complete += 1
+            if all((bursts[fnrs[j]] == A5ReconstructionAdapter.lapdm_ui[j]).all() for j in range(4)):
+                return True
+        return False if complete == PRECEDING_MESSAGES else None
+
+    def __session_sits(self):
+        """
+        :return: the System Information messages on the attacked SACCH before the CMC, as (type, data) tuples in
+        the order of the capture.
+        """
+        sits = self.cmc_analysis.sacch_sits
+        fnrs = [fnr for fnr in sits if fnr in self.window and sits[fnr][0] == self.subchannel
+                and self.window.offset(fnr) < self.window.offset(self.fnr_cmc)]
+        return [sits[fnr][1:] for fnr in sorted(fnrs, key=self.window.offset)]
+
+    def __si_cycle_regularity(self):
+        """
+        :return: the share of consecutive System Information messages on the SACCHs of the timeslot whose types
+        follow the cycle of types, with one pseudo-observation each for and against regularity. The cycle observed by
+        the analysis is used if it is known, otherwise the order in which the types first appear on a subchannel.
+        """
+        sits = self.cmc_analysis.sacch_sits
+        regular = 1
+        total = 2
+        for subchannel in set(sit[0] for sit in sits.values()):
+            types = [sits[fnr][1] for fnr in sorted(sits, key=self.window.offset) if sits[fnr][0] == subchannel]
+            cycle = list(self.cmc_analysis.si_cycle or [])
+            for si_type in types:
+                if si_type not in cycle:
+                    cycle.append(si_type)
+            for previous, current in zip(types, types[1:]):
+                total += 1
+                if cycle.index(current) == (cycle.index(previous) + 1) % len(cycle):
+                    regular += 1
+        return float(regular) / total
+
+    def __ta_stable(self):
+        """
+        :return: False if the timing advance on the attacked SACCH changed before the CMC, True otherwise.
+        """
+        timing_advances = set()
+        for si_type, data in self.__session_sits():
+            message = bytearray(binascii.unhexlify(data))
+            if len(message) > 1:
+                timing_advances.add(message[1])
+        return len(timing_advances) <= 1
+
+    def __snr_factor(self, burst_set):
+        """
+        :return: the probability estimate that the burst and the verification burst are received without errors.
+        """
+        factor = 1.0
+        for fnr in (burst_set.frame_number, burst_set.check_frame_number):
+            snr = self.cmc_analysis.bursts.snr(fnr)
+            # gr-gsm does not measure the SNR and always writes 0, which is treated as unknown
+            if snr:
+                factor *= min(1.0, max(0.1, snr / self.GOOD_SNR))
+        return factor
+
+    def score(self, candidate):
+        """
+        :type candidate: Candidate
+        :return: the probability estimate that the candidate yields the key.
+        """
+        if candidate.channel == "SDCCH":
+            probability = self.SDCCH_PRIORS[min(candidate.message, len(self.SDCCH_PRIORS) - 1)]
+            if self.fill_frames is None:
+                probability *= 0.7
+            elif not self.fill_frames:
+                probability *= 0.1
+        else:
+            # predictions further away from the last known message are less reliable
+            probability = self.si_cycle_regularity * 0.95 ** candidate.message
+            if not self.ta_stable:
+                probability *= 0.5
+            if not candidate.observed:
+                probability *= 0.8  # the L1 header was taken from another channel
+        return probability * self.__snr_factor(candidate.burst_set)
+
+    def rank(self, candidates, budget=None):
+        """
+        :param candidates: the candidates of the session.
+        :param budget: maximum number of candidates to keep, None for all.
+        :return: the candidates, the most promising first, with their scores set.
+        """
+        for candidate in candidates:
+            candidate.score = self.score(candidate)
+        # the sort is stable, so candidates of equal score keep their order
+        ranked = sorted(candidates, key=lambda candidate: -candidate.score)
+        return ranked if budget is None else ranked[:budget]
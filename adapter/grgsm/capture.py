@@ -7,6 +7,8 @@ import pmt
 from gnuradio import blocks
 from gnuradio import gr
 
+from adapter.grgsm.burstfile import BurstIndex
+
 
 class grgsm_capture(gr.top_block):
     def __init__(self, fc, gain, samp_rate, ppm, arfcn, cfile=None, burst_file=None, band=None, verbose=False,
@@ -104,3 +106,12 @@ class grgsm_capture(gr.top_block):
                 self.msg_connect(self.gsm_receiver, "C0", self.bcch_demapper, "bursts")
                 self.msg_connect(self.bcch_demapper, "bursts", self.cch_decoder, "bursts")
                 self.msg_connect(self.cch_decoder, "msgs", self.socket_pdu, "pdus")
+
+    def wait(self):
+        """
+        Override gr.top_block's wait method.
+        """
+        gr.top_block.wait(self)
+        if self.burst_file:
+            # index the capture right away, so that later analyses can seek to the frames they need
+            BurstIndex.load(self.burst_file)
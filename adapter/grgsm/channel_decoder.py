@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+import heapq
+import multiprocessing
+import os
+import socket
+import struct
+import tempfile
+
+import grgsm
+from gnuradio import gr
+
+from adapter.grgsm.burstfile import BurstFileWriter, GSMTAP_HEADER_SIZE, read_bursts
+from core.common.fnr_window import MAX_FNR
+
+CHANNEL_MODES = ['BCCH', 'BCCH_SDCCH4', 'SDCCH8', 'TCHF']
+# number of subslots of the channel modes with SDCCHs
+SUBSLOTS = {'BCCH_SDCCH4': 4, 'SDCCH8': 8}
+
+
+def parse_numbers(value, maximum):
+    """
+    Parse a list of numbers like '0,2-4'.
+
+    :param value: comma separated numbers and ranges of numbers, ranges include both ends.
+    :param maximum: highest allowed number.
+    :return: the sorted numbers, without duplicates.
+    """
+    numbers = set()
+    for part in str(value).split(","):
+        bounds = part.strip().split("-")
+        if len(bounds) > 2 or not all(bound.strip().isdigit() for bound in bounds):
+            raise ValueError("Invalid number or range '%s'" % part.strip())
+        first, last = int(bounds[0]), int(bounds[-1])
+        if first > last or last > maximum:
+            raise ValueError("Invalid number or range '%s', numbers range from 0 to %s" % (part.strip(), maximum))
+        numbers.update(range(first, last + 1))
+    return sorted(numbers)
+
+
+class Channel(object):
+    """
+    A logical channel to decode.
+    """
+
+    def __init__(self, mode, timeslot, subslot=None):
+        """
+        :param mode: the channel mode, one of CHANNEL_MODES.
+        :param timeslot: the timeslot.
+        :param subslot: the subslot of an SDCCH, None for all subslots of the timeslot.
+        """
+        if mode not in CHANNEL_MODES:
+            raise ValueError("Invalid channel mode '%s'" % mode)
+        if subslot is not None and not 0 <= subslot < SUBSLOTS.get(mode, 0):
+            raise ValueError("Channel mode %s has no subslot %s" % (mode, subslot))
+        self.mode = mode
+        self.timeslot = timeslot
+        self.subslot = subslot
+
+    def __str__(self):
+        if self.subslot is None:
+            return "%s ts %s" % (self.mode, self.timeslot)
+        return "%s ts %s/%s" % (self.mode, self.timeslot, self.subslot)
+
+    @staticmethod
+    def parse(spec):
+        """
+        Parse a channel specification MODE:TIMESLOTS[:SUBSLOTS], e.g. 'SDCCH8:1:0-7'.
+
+        :return: a list of channels, one per timeslot and subslot.
+        """
+        parts = spec.split(":")
+        if len(parts) not in (2, 3):
+            raise ValueError("Invalid channel '%s', use MODE:TIMESLOTS[:SUBSLOTS]" % spec)
+        return create_channels([parts[0].upper()], parts[1], parts[2] if len(parts) == 3 else None)
+
+
+def create_channels(modes, timeslots, subslots=None):
+    """
+    Create the channels of all combinations of modes, timeslots and subslots.
+
+    :param modes: list of channel modes.
+    :param timeslots: the timeslots, e.g. '0-3' or a single number.
+    :param subslots: the subslots, e.g. '0-7', applied to channel modes with SDCCHs only. None for all subslots of
+    the timeslot as a single channel.
+    :return: a list of channels.
+    """
+    channels = []
+    for mode in modes:
+        for timeslot in parse_numbers(timeslots, 7):
+            if subslots is None or mode not in SUBSLOTS:
+                channels.append(Channel(mode, timeslot))
+            else:
+                for subslot in parse_numbers(subslots, SUBSLOTS[mode] - 1):
+                    channels.append(Channel(mode, timeslot, subslot))
+    return channels
+
+
+class DecodedMessage(object):
+    """
+    A message decoded on a channel, including its GSMTAP header.
+    """
+
+    def __init__(self, channel, data):
+        """
+        :type channel: Channel
+        :param data: the GSMTAP header followed by the message, as bytearray.
+        """
+        self.channel = channel
+        self.data = data
+        self.frame_number = struct.unpack(">I", bytes(data[8:12]))[0]
+
+    @property
+    def payload(self):
+        return self.data[GSMTAP_HEADER_SIZE:]
+
+
+class _ChannelDecoder(gr.top_block):
+    """
+    Decodes the messages of a single channel from a burst file holding the bursts of its timeslot.
+    """
+
+    def __init__(self, path, channel, kc=None, a5=1, speech_codec=None):
+        gr.top_block.__init__(self, "Channel Decoder")
+
+        self.burst_file_source = grgsm.burst_file_source(path)
+        self.message_sink = grgsm.message_sink()
+        self.decryptions = []
+        decrypt = kc is not None and any(kc)
+
+        source = (self.burst_file_source, 'out')
+        if channel.subslot is not None:
+            self.subslot_filter = grgsm.burst_sdcch_subslot_filter(
+                grgsm.SS_FILTER_SDCCH4 if channel.mode == 'BCCH_SDCCH4' else grgsm.SS_FILTER_SDCCH8, channel.subslot)
+            self.msg_connect(source, (self.subslot_filter, 'in'))
+            source = (self.subslot_filter, 'out')
+
+        if channel.mode == 'TCHF':
+            self.demapper = grgsm.tch_f_chans_demapper(channel.timeslot)
+            self.tch_f_decoder = grgsm.tch_f_decoder(speech_codec if speech_codec is not None else grgsm.TCH_FS,
+                                                     False)
+            self.msg_connect(source, (self.demapper, 'bursts'))
+            # the FACCH messages on the traffic channel and the messages on the SACCH
+            self.__connect((self.demapper, 'tch_bursts'), (self.tch_f_decoder, 'bursts'), kc, a5, decrypt)
+            self.msg_connect((self.tch_f_decoder, 'msgs'), (self.message_sink, 'in'))
+            source = (self.demapper, 'acch_bursts')
+        else:
+            if channel.mode == 'BCCH':
+                self.demapper = grgsm.gsm_bcch_ccch_demapper(timeslot_nr=channel.timeslot, )
+            elif channel.mode == 'BCCH_SDCCH4':
+                self.demapper = grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=channel.timeslot, )
+            else:
+                self.demapper = grgsm.gsm_sdcch8_demapper(timeslot_nr=channel.timeslot, )
+            self.msg_connect(source, (self.demapper, 'bursts'))
+            source = (self.demapper, 'bursts')
+
+        self.control_channels_decoder = grgsm.control_channels_decoder()
+        self.__connect(source, (self.control_channels_decoder, 'bursts'), kc, a5, decrypt)
+        self.msg_connect((self.control_channels_decoder, 'msgs'), (self.message_sink, 'in'))
+
+    def __connect(self, source, destination, kc, a5, decrypt):
+        if decrypt:
+            decryption = grgsm.decryption(kc, a5)
+            self.decryptions.append(decryption)
+            self.msg_connect(source, (decryption, 'bursts'))
+            self.msg_connect((decryption, 'bursts'), destination)
+        else:
+            self.msg_connect(source, destination)
+
+    def messages(self):
+        """
+        :return: the decoded messages with their GSMTAP headers, as bytearrays.
+        """
+        return [bytearray(int(byte, 16) for byte in message.split()) for message in self.message_sink.get_messages()]
+
+
+def decode_channel(task):
+    """
+    Decode a channel, run in a worker process.
+
+    :param task: tuple of the path of the burst file holding the bursts of the channel's timeslot, the channel, the
+    Kc, the A5 version and the speech codec of traffic channels.
+    :return: the decoded messages, see _ChannelDecoder.messages().
+    """
+    path, channel, kc, a5, speech_codec = task
+    decoder = _ChannelDecoder(path, channel, kc, a5, speech_codec)
+    decoder.run()
+    return decoder.messages()
+
+
+class MultiChannelDecoder(object):
+    """
+    Decodes several channels of a burst file at once.
+
+    The burst file is read only once and split by timeslot, then the channels are decoded in parallel worker
+    processes. The messages of all channels are merged in the order of their framenumbers.
+    """
+
+    def __init__(self, burst_file, channels, kc=None, a5=1, speech_codec=None, processes=None):
+        """
+        :param burst_file: path of the burst file, either a gr-gsm or a compact burst file.
+        :param channels: the channels to decode.
+        :param kc: the Kc as list of 8 byte values, None or all zero to decode without decryption.
+        :param a5: the A5 version.
+        :param speech_codec: the speech codec of traffic channels, only the FACCH and SACCH messages are decoded.
+        :param processes: number of worker processes, None for the number of CPUs.
+        """
+        self.burst_file = burst_file
+        self.channels = channels
+        self.kc = kc
+        self.a5 = a5
+        self.speech_codec = speech_codec
+        self.processes = processes if processes is not None else multiprocessing.cpu_count()
+        self.first_frame_number = None
+
+    def run(self):
+        """
+        :return: the decoded messages of all channels as DecodedMessage objects, in the order of their framenumbers.
+        """
+        paths = self.__split()
+        try:
+            tasks = [(paths[channel.timeslot], channel, self.kc, self.a5, self.speech_codec)
+                     for channel in self.channels]
+            pool = multiprocessing.Pool(max(1, min(self.processes, len(tasks))))
+            try:
+                results = pool.map(decode_channel, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            for path in paths.values():
+                os.remove(path)
+        return self.__merge(results)
+
+    def __split(self):
+        """
+        Write the bursts of every timeslot of the channels to a temporary gr-gsm burst file, reading the burst file
+        once.
+
+        :return: a dictionary of the paths of the temporary files by timeslot.
+        """
+        paths = dict()
+        writers = dict()
+        try:
+            try:
+                for timeslot in sorted(set(channel.timeslot for channel in self.channels)):
+                    fd, paths[timeslot] = tempfile.mkstemp(suffix=".bursts", prefix="gat-ts%s-" % timeslot)
+                    os.close(fd)
+                    writers[timeslot] = BurstFileWriter(paths[timeslot])
+                for bursts in read_bursts(self.burst_file):
+                    if self.first_frame_number is None:
+                        self.first_frame_number = int(bursts.framenumbers[0])
+                    timeslots = bursts.timeslots
+                    for timeslot, writer in writers.items():
+                        selected = timeslots == timeslot
+                        if selected.any():
+                            writer.write(bursts[selected])
+            finally:
+                for writer in writers.values():
+                    writer.close()
+        except Exception:
+            for path in paths.values():
+                os.remove(path)
+            raise
+        return paths
+
+    def __merge(self, results):
+        """
+        Merge the messages of the channels, which are in the order of the capture each. The framenumbers are
+        compared as offsets from the start of the capture, as the capture may span the hyperframe wraparound.
+        """
+        first = self.first_frame_number or 0
+        decoded = []
+        for i, (channel, messages) in enumerate(zip(self.channels, results)):
+            decoded.append([])
+            for message in messages:
+                message = DecodedMessage(channel, message)
+                # channels are decoded in the given order if framenumbers are the same
+                decoded[-1].append(((message.frame_number - first) % MAX_FNR, i, len(decoded[-1]), message))
+        return [message for _, _, _, message in heapq.merge(*decoded)]
+
+
+def send_gsmtap(messages, host="127.0.0.1", port=4729):
+    """
+    Send decoded messages to a GSMTAP receiver, e.g. Wireshark, like gr-gsm's decoder does.
+    """
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for message in messages:
+            udp.sendto(bytes(message.data), (host, port))
+    finally:
+        udp.close()
@@ -1,50 +1,136 @@
 # -*- coding: utf-8 -*-
+import binascii
+import collections
+import itertools
+import os
+import tempfile
+import threading
+
 import grgsm
+import numpy
+import pmt
 from gnuradio import gr
 
+from adapter.grgsm.burstfile import BURST_SIZE, BurstFileWriter, BurstSelection, Bursts, GSMTAP_HEADER_SIZE, \
+    RECORD_DTYPE, SACCH_TABLES, SUBSLOT_SDCCH4, SUBSLOT_SDCCH8, read_bursts, to_records
+from adapter.grgsm.bursts import BurstCollector
+from adapter.grgsm.l3 import L3Assembler
 from core.adapterinterfaces.a5 import A5BurstSet, A5ReconstructionAdapter
-
-
-class CMCAnalyzer(gr.top_block):
-    def __init__(self, timeslot, burst_file, mode, fnr_start, fnr_end):
-        gr.top_block.__init__(self, "Top Block")
-
-        self.burst_file_source = grgsm.burst_file_source(burst_file)
-        self.timeslot_filter = grgsm.burst_timeslot_filter(timeslot)
-        self.fnr_filter_start = grgsm.burst_fnr_filter(grgsm.FILTER_GREATER_OR_EQUAL, fnr_start)
-        self.fnr_filter_end = grgsm.burst_fnr_filter(grgsm.FILTER_LESS_OR_EQUAL, fnr_end)
-        if mode == 'BCCH_SDCCH4':
-            self.subslot_splitter = grgsm.burst_sdcch_subslot_splitter(grgsm.SPLITTER_SDCCH4)
-            self.subslot_analyzers = [CMCAnalyzerArm() for x in range(4)]
-            self.demapper = grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=timeslot, )
-        else:
-            self.subslot_splitter = grgsm.burst_sdcch_subslot_splitter(grgsm.SPLITTER_SDCCH8)
-            self.subslot_analyzers = [CMCAnalyzerArm() for x in range(8)]
-            self.demapper = grgsm.gsm_sdcch8_demapper(timeslot_nr=timeslot, )
-
-        self.control_channels_decoder = grgsm.control_channels_decoder()
-        self.burst_sink = grgsm.burst_sink()
-
-        self.msg_connect((self.burst_file_source, 'out'), (self.timeslot_filter, 'in'))
-        self.msg_connect((self.timeslot_filter, 'out'), (self.fnr_filter_start, 'in'))
-        self.msg_connect((self.fnr_filter_start, 'out'), (self.fnr_filter_end, 'in'))
-        self.msg_connect((self.fnr_filter_end, 'out'), (self.demapper, 'bursts'))
-        self.msg_connect((self.demapper, 'bursts'), (self.burst_sink, 'in'))
-        self.msg_connect((self.demapper, 'bursts'), (self.subslot_splitter, 'in'))
-        for i in range(4 if mode == 'BCCH_SDCCH4' else 8):
-            self.msg_connect((self.subslot_splitter, 'out' + str(i)), (self.subslot_analyzers[i], 'in'))
-
-        self.bursts = None
-        self.cmcs = None
-
-    def wait(self):
-        """
-        Override gr.top_block's wait method.
-        """
-        gr.top_block.wait(self)
-        self.__create_data_dict()
-        self.__create_cmc_dict()
-        self.__create_sacch_dict()
+from core.common.bits import PackedBursts
+from core.common.fnr_window import FnrWindow, MAX_FNR, fnr_add, fnr_diff
+
+
+def attack_window(fnr_cmc):
+    """
+    :param fnr_cmc: framenumber of a cipher mode command.
+    :return: the framenumbers around the cipher mode command that are used for attacking its session.
+    """
+    return FnrWindow.around(fnr_cmc, 2 * 102, 3 * 102 + 3)
+
+
+# number of SDCCH messages before the CMC that are collected as evidence
+PRECEDING_MESSAGES = 4
+
+
+def attack_framenumbers(fnr_cmc, subslot_mode, window=None):
+    """
+    :param fnr_cmc: framenumber of a cipher mode command.
+    :param subslot_mode: the channel combination, SUBSLOT_SDCCH4 or SUBSLOT_SDCCH8.
+    :param window: the framenumbers searched for SACCH bursts, by default the attack window of the CMC.
+    :type window: FnrWindow
+    :return: the framenumbers of the bursts an attack on the session can use: the LAPDm UI messages following the
+    CMC, the unciphered SDCCH messages preceding it, which tell what the fill frames look like, and all SACCH bursts
+    within the window.
+    """
+    window = window if window is not None else attack_window(fnr_cmc)
+    window_fnrs = (window.start + numpy.arange(len(window), dtype=numpy.int64)) % MAX_FNR
+    lapdm_fnrs = numpy.array([fnr_add(fnr_cmc, i * 51 + j) for i in range(-PRECEDING_MESSAGES, 6) if i != 0
+                              for j in range(4)], dtype=numpy.int64)
+    return numpy.union1d(lapdm_fnrs, window_fnrs[SACCH_TABLES[subslot_mode][window_fnrs % 102]])
+
+
+def _cmc_dict(subslot_analyzers):
+    """
+    :param subslot_analyzers: the CMCAnalyzerArm of each subchannel.
+    :return: a dictionary of the cipher mode commands, framenumber -> (subchannel, A5 version).
+    """
+    cmcs = dict()
+    for subchannel in range(len(subslot_analyzers)):
+        analyzer = subslot_analyzers[subchannel]
+        cmc_a5_versions = analyzer.extract_cmc.get_a5_versions()
+        cmc_fnrs = analyzer.extract_cmc.get_framenumbers()
+        for i in range(len(cmc_fnrs)):
+            cmcs[cmc_fnrs[i]] = (subchannel, cmc_a5_versions[i])  # tuple: subchannel and A5 version
+    return cmcs
+
+
+def _sacch_dict(subslot_analyzers):
+    """
+    :param subslot_analyzers: the CMCAnalyzerArm of each subchannel.
+    :return: a dictionary of the System Information messages on SACCH, framenumber -> (subchannel, type, data).
+    """
+    sacch_sits = dict()
+    for subchannel in range(len(subslot_analyzers)):
+        analyzer = subslot_analyzers[subchannel]
+        sit_fnrs = analyzer.collect_system_info.get_framenumbers()
+        sit_types = analyzer.collect_system_info.get_system_information_type()
+        sit_data = analyzer.collect_system_info.get_data()
+        for i in range(len(sit_fnrs)):
+            if sit_types[i].startswith("System Information Type 5") or sit_types[i].startswith(
+                    "System Information Type 6"):
+                sacch_sits[sit_fnrs[i]] = (subchannel, sit_types[i], sit_data[i])
+    return sacch_sits
+
+
+def observed_si_cycle(si_types):
+    """
+    :param si_types: the types of the System Information messages on the SACCH of a subchannel, in the order of the
+    capture.
+    :return: the types of the first complete cycle, i.e. up to the first repetition of the first type, None if the
+    first type was not repeated yet.
+    """
+    if si_types and si_types[0] in si_types[1:]:
+        return list(si_types[:si_types.index(si_types[0], 1)])
+    return None
+
+
+def _si_cycle(sacch_sits, key=None):
+    """
+    :param sacch_sits: the System Information messages on SACCH, framenumber -> (subchannel, type, data).
+    :param key: function giving the position of a framenumber in the capture, by default the framenumber itself.
+    :return: the first complete cycle of System Information types seen on any subchannel, None if there is none.
+    """
+    for subchannel in sorted(set(sit[0] for sit in sacch_sits.values())):
+        fnrs = sorted((fnr for fnr in sacch_sits if sacch_sits[fnr][0] == subchannel), key=key)
+        si_cycle = observed_si_cycle([sacch_sits[fnr][1] for fnr in fnrs])
+        if si_cycle is not None:
+            return si_cycle
+    return None
+
+
+def _si_messages(sacch_sits):
+    """
+    :param sacch_sits: the System Information messages on SACCH, framenumber -> (subchannel, type, data).
+    :return: the first message of each System Information type, type -> data, as SICollector provides them.
+    """
+    si_messages = dict()
+    for sit_fnr in sorted(sacch_sits):
+        si_type, data = sacch_sits[sit_fnr][1:]
+        if si_type not in si_messages:
+            si_messages[si_type] = data
+    return si_messages
+
+
+class CMCAnalysis(object):
+    """
+    Cipher mode commands of a timeslot and the bursts for attacking them, as collected by CMCAnalyzer or
+    SessionAnalyzer.
+    """
+    bursts = None
+    cmcs = None
+    sacch_sits = None
+    si_messages = None  # System Information messages on SACCH by type, as SICollector provides them
+    si_cycle = None  # the types of a complete cycle of System Information messages on SACCH, the order they are sent
 
     def is_a51_cmc(self, framenumber_cmc):
         if framenumber_cmc in self.cmcs and self.cmcs[framenumber_cmc][1] == 1:
@@ -56,24 +142,26 @@ class CMCAnalyzer(gr.top_block):
         Creates a list of A5 burst sets with Lapdm UI plaintext messages
 
         :param framenumber_cmc: the framenumber of the cipher mode command
-        :return: a list of A5 burst sets
+        :return: a list of A5 burst sets, without the ones whose burst or verification burst was not captured
         """
         burst_sets = []
 
         for i in range(1, 6):  # starting from the first message after cmc, we try 5 messages
-            fnr_of_msg = framenumber_cmc + i * 51
+            fnr_of_msg = fnr_add(framenumber_cmc, i * 51)
             for j in range(0, 4):  # a message has 4 bursts
-                fnr = fnr_of_msg + j
+                fnr = fnr_add(fnr_of_msg, j)
                 check_burst_index = 0 if j > 0 else 1
+                if fnr not in self.bursts or fnr_add(fnr_of_msg, check_burst_index) not in self.bursts:
+                    continue
 
                 burst_sets.append(
                     A5BurstSet(
                         fnr,  # framenumber of the burst we want to use
                         self.bursts[fnr],  # data (payload) of the burst we want to use
                         A5ReconstructionAdapter.lapdm_ui[j],  # plaintext data (payload) of a lapdm ui message
-                        fnr_of_msg + check_burst_index,  # framenumber of verification burst.
+                        fnr_add(fnr_of_msg, check_burst_index),  # framenumber of verification burst.
                         # we use the first burst of the message as check burst, if j > 0
-                        self.bursts[fnr_of_msg + check_burst_index],  # data (payload) of the verification burst
+                        self.bursts[fnr_add(fnr_of_msg, check_burst_index)],  # data (payload) of the verification burst
                         A5ReconstructionAdapter.lapdm_ui[check_burst_index]  # plaintextdata (payload) of
                         # the verification burst
                     )
@@ -90,33 +178,80 @@ class CMCAnalyzer(gr.top_block):
             return self.cmcs[framenumber_cmc][0]
         return None
 
-    def __create_data_dict(self):
-        self.bursts = dict()
-        fnrs = self.burst_sink.get_framenumbers()
-        data = self.burst_sink.get_burst_data()
-        for i in range(len(fnrs)):
-            self.bursts[fnrs[i]] = data[i][3:60] + data[i][88:145]  # take burst payload only
+    def a51_cmcs(self):
+        """
+        :return: the framenumbers of all cipher mode commands assigning A5/1, in the order of the capture.
+        """
+        return sorted(fnr for fnr in self.cmcs if self.is_a51_cmc(fnr))
+
+
+class CMCAnalyzer(gr.top_block, CMCAnalysis):
+    def __init__(self, timeslot, burst_file, mode, window=None, fnr_cmc=None):
+        """
+        :param window: the framenumbers to analyze, None for the whole burst file.
+        :type window: FnrWindow
+        :param fnr_cmc: framenumber of the cipher mode command to attack, None to attack all cipher mode commands
+        assigning A5/1.
+        """
+        gr.top_block.__init__(self, "Top Block")
+
+        self.window = window
+        self.fnr_cmc = fnr_cmc
+        self.subslot_mode = SUBSLOT_SDCCH4 if mode == 'BCCH_SDCCH4' else SUBSLOT_SDCCH8
+        self.burst_selection = BurstSelection(burst_file, timeslot=timeslot, window=window)
+        self.burst_file_source = grgsm.burst_file_source(self.burst_selection.path)
+        if mode == 'BCCH_SDCCH4':
+            self.subslot_splitter = grgsm.burst_sdcch_subslot_splitter(grgsm.SPLITTER_SDCCH4)
+            self.subslot_analyzers = [CMCAnalyzerArm() for x in range(4)]
+            self.demapper = grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=timeslot, )
+        else:
+            self.subslot_splitter = grgsm.burst_sdcch_subslot_splitter(grgsm.SPLITTER_SDCCH8)
+            self.subslot_analyzers = [CMCAnalyzerArm() for x in range(8)]
+            self.demapper = grgsm.gsm_sdcch8_demapper(timeslot_nr=timeslot, )
+
+        self.control_channels_decoder = grgsm.control_channels_decoder()
+
+        self.msg_connect((self.burst_file_source, 'out'), (self.demapper, 'bursts'))
+        self.msg_connect((self.demapper, 'bursts'), (self.subslot_splitter, 'in'))
+        for i in range(4 if mode == 'BCCH_SDCCH4' else 8):
+            self.msg_connect((self.subslot_splitter, 'out' + str(i)), (self.subslot_analyzers[i], 'in'))
+
+        self.bursts = None
+        self.cmcs = None
+
+    def wait(self):
+        """
+        Override gr.top_block's wait method.
+        """
+        gr.top_block.wait(self)
+        self.__create_cmc_dict()
+        self.__create_sacch_dict()
+        self.__collect_bursts()
+        self.burst_selection.remove()
+
+    def __attack_framenumbers(self):
+        """
+        :return: the framenumbers of the bursts an attack can use: the LAPDm UI messages following the attacked
+        CMCs and all SACCH bursts within the windows around them.
+        """
+        fnrs_cmc = [self.fnr_cmc] if self.fnr_cmc is not None else self.a51_cmcs()
+        attack_fnrs = [numpy.zeros(0, dtype=numpy.int64)]
+        for fnr_cmc in fnrs_cmc:
+            attack_fnrs.append(attack_framenumbers(fnr_cmc, self.subslot_mode, self.window))
+        return numpy.unique(numpy.concatenate(attack_fnrs))
+
+    def __collect_bursts(self):
+        # only the bursts an attack can use are kept, as packed bits accessible by framenumber
+        collector = BurstCollector(self.burst_selection.path, self.__attack_framenumbers())
+        self.bursts = collector.run()
 
     def __create_cmc_dict(self):
-        self.cmcs = dict()
-        for subchannel in range(len(self.subslot_analyzers)):
-            analyzer = self.subslot_analyzers[subchannel]
-            cmc_a5_versions = analyzer.extract_cmc.get_a5_versions()
-            cmc_fnrs = analyzer.extract_cmc.get_framenumbers()
-            for i in range(len(cmc_fnrs)):
-                self.cmcs[cmc_fnrs[i]] = (subchannel, cmc_a5_versions[i])  # tuple: subchannel and A5 version
+        self.cmcs = _cmc_dict(self.subslot_analyzers)
 
     def __create_sacch_dict(self):
-        self.sacch_sits = dict()
-        for subchannel in range(len(self.subslot_analyzers)):
-            analyzer = self.subslot_analyzers[subchannel]
-            sit_fnrs = analyzer.collect_system_info.get_framenumbers()
-            sit_types = analyzer.collect_system_info.get_system_information_type()
-            sit_data = analyzer.collect_system_info.get_data()
-            for i in range(len(sit_fnrs)):
-                if sit_types[i].startswith("System Information Type 5") or sit_types[i].startswith(
-                        "System Information Type 6"):
-                    self.sacch_sits[sit_fnrs[i]] = (subchannel, sit_types[i], sit_data[i])
+        self.sacch_sits = _sacch_dict(self.subslot_analyzers)
+        self.si_messages = _si_messages(self.sacch_sits)
+        self.si_cycle = _si_cycle(self.sacch_sits, self.window.offset if self.window is not None else None)
 
 
 class CMCAnalyzerArm(gr.hier_block2):
@@ -143,9 +278,8 @@ class ImmediateAssignmentExtractor(gr.top_block):
     def __init__(self, burst_file, timeslot, mode, framenumber):
         gr.top_block.__init__(self, "Top Block")
 
-        self.burst_file_source = grgsm.burst_file_source(burst_file)
-        self.timeslot_filter = grgsm.burst_timeslot_filter(timeslot)
-        self.fnr_filter_start = grgsm.burst_fnr_filter(grgsm.FILTER_GREATER_OR_EQUAL, framenumber)
+        self.burst_selection = BurstSelection(burst_file, timeslot=timeslot, framenr_ge=framenumber)
+        self.burst_file_source = grgsm.burst_file_source(self.burst_selection.path)
         if mode == 'BCCH_SDCCH4':
             self.demapper = grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=timeslot, )
         else:
@@ -155,42 +289,49 @@ class ImmediateAssignmentExtractor(gr.top_block):
 
         self.extract_immediate_assignment = grgsm.extract_immediate_assignment()
 
-        self.msg_connect((self.burst_file_source, 'out'), (self.timeslot_filter, 'in'))
-        self.msg_connect((self.timeslot_filter, 'out'), (self.fnr_filter_start, 'in'))
-        self.msg_connect((self.fnr_filter_start, 'out'), (self.demapper, 'bursts'))
+        self.msg_connect((self.burst_file_source, 'out'), (self.demapper, 'bursts'))
         self.msg_connect((self.demapper, 'bursts'), (self.decoder, 'bursts'))
         self.msg_connect((self.decoder, 'msgs'), (self.extract_immediate_assignment, 'msgs'))
 
+    def wait(self):
+        """
+        Override gr.top_block's wait method.
+        """
+        gr.top_block.wait(self)
+        self.burst_selection.remove()
+
 
 class CMCFinder(gr.top_block):
     def __init__(self, burst_file, timeslot, subchannel, mode, fnr_start):
         gr.top_block.__init__(self, "Top Block")
 
-        self.burst_file_source = grgsm.burst_file_source(burst_file)
-        self.timeslot_filter = grgsm.burst_timeslot_filter(timeslot)
-        self.fnr_filter_start = grgsm.burst_fnr_filter(grgsm.FILTER_GREATER_OR_EQUAL, fnr_start)
-        # we only listen for a timespan of 12 SDCCH messages for the CMC
-        self.fnr_filter_end = grgsm.burst_fnr_filter(grgsm.FILTER_LESS_OR_EQUAL, fnr_start + 51 * 10000)
-
         if mode == "BCCH_SDCCH4":
-            self.subchannel_filter = grgsm.burst_sdcch_subslot_filter(grgsm.SS_FILTER_SDCCH4, subchannel)
+            subslot_mode = SUBSLOT_SDCCH4
             self.demapper = grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=timeslot, )
         else:
-            self.subchannel_filter = grgsm.burst_sdcch_subslot_filter(grgsm.SS_FILTER_SDCCH8, subchannel)
+            subslot_mode = SUBSLOT_SDCCH8
             self.demapper = grgsm.gsm_sdcch8_demapper(timeslot_nr=timeslot, )
 
+        # we only listen for a timespan of 12 SDCCH messages for the CMC
+        self.burst_selection = BurstSelection(burst_file, timeslot=timeslot, subslot=subchannel,
+                                              subslot_mode=subslot_mode, window=FnrWindow(fnr_start, 51 * 10000 + 1))
+        self.burst_file_source = grgsm.burst_file_source(self.burst_selection.path)
+
         self.demapper = grgsm.gsm_sdcch8_demapper(timeslot_nr=timeslot, )
         self.decoder = grgsm.control_channels_decoder()
         self.extract_cmc = grgsm.extract_cmc()
 
-        self.msg_connect((self.burst_file_source, 'out'), (self.timeslot_filter, 'in'))
-        self.msg_connect((self.timeslot_filter, 'out'), (self.subchannel_filter, 'in'))
-        self.msg_connect((self.subchannel_filter, 'out'), (self.fnr_filter_start, 'in'))
-        self.msg_connect((self.fnr_filter_start, 'out'), (self.fnr_filter_end, 'in'))
-        self.msg_connect((self.fnr_filter_end, 'out'), (self.demapper, 'bursts'))
+        self.msg_connect((self.burst_file_source, 'out'), (self.demapper, 'bursts'))
         self.msg_connect((self.demapper, 'bursts'), (self.decoder, 'bursts'))
         self.msg_connect((self.decoder, 'msgs'), (self.extract_cmc, 'msgs'))
 
+    def wait(self):
+        """
+        Override gr.top_block's wait method.
+        """
+        gr.top_block.wait(self)
+        self.burst_selection.remove()
+
     def get_cmc(self):
         fnrs = self.extract_cmc.get_framenumbers()
         if len(fnrs) > 0:
@@ -204,8 +345,8 @@ class SICollector(gr.top_block):
 
         self.si_messages = dict()
 
-        self.burst_file_source = grgsm.burst_file_source(burst_file)
-        self.timeslot_filter = grgsm.burst_timeslot_filter(timeslot)
+        self.burst_selection = BurstSelection(burst_file, timeslot=timeslot)
+        self.burst_file_source = grgsm.burst_file_source(self.burst_selection.path)
         if mode == 'BCCH_SDCCH4':
             self.demapper = grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=timeslot, )
         else:
@@ -215,8 +356,7 @@ class SICollector(gr.top_block):
         self.control_channels_decoder = grgsm.control_channels_decoder()
         self.collect_system_info = grgsm.collect_system_info()
 
-        self.msg_connect((self.burst_file_source, 'out'), (self.timeslot_filter, 'in'))
-        self.msg_connect((self.timeslot_filter, 'out'), (self.demapper, 'bursts'))
+        self.msg_connect((self.burst_file_source, 'out'), (self.demapper, 'bursts'))
         self.msg_connect((self.demapper, 'bursts'), (self.decoder, 'bursts'))
         self.msg_connect((self.decoder, 'msgs'), (self.collect_system_info, 'msgs'))
 
@@ -225,6 +365,7 @@ class SICollector(gr.top_block):
         Override gr.top_block's wait method.
         """
         gr.top_block.wait(self)
+        self.burst_selection.remove()
         self.__analyze_sacch_messages()
 
     def __analyze_sacch_messages(self):
@@ -242,3 +383,353 @@ class SICollector(gr.top_block):
 
             if len(self.si_messages) >= 4:  # there can only be 4 different SI message types on SACCH
                 break
+
+
+class _ImmediateAssignmentChunkDecoder(gr.top_block):
+    """
+    Extracts the Immediate Assignments from a burst file holding a chunk of a timeslot.
+    """
+
+    def __init__(self, path, timeslot, mode):
+        gr.top_block.__init__(self, "Top Block")
+
+        self.burst_file_source = grgsm.burst_file_source(path)
+        if mode == 'BCCH_SDCCH4':
+            self.demapper = grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=timeslot, )
+        else:
+            self.demapper = grgsm.gsm_sdcch8_demapper(timeslot_nr=timeslot, )
+        self.decoder = grgsm.control_channels_decoder()
+        self.extract_immediate_assignment = grgsm.extract_immediate_assignment()
+
+        self.msg_connect((self.burst_file_source, 'out'), (self.demapper, 'bursts'))
+        self.msg_connect((self.demapper, 'bursts'), (self.decoder, 'bursts'))
+        self.msg_connect((self.decoder, 'msgs'), (self.extract_immediate_assignment, 'msgs'))
+
+
+class _BurstSource(gr.basic_block):
+    """
+    Publishes the bursts of a sequence of chunks as gr-gsm burst messages, like grgsm.burst_file_source does for a
+    burst file. The chunks are read in a thread of their own while the flowgraph runs, so that reading can stop as
+    soon as the decoded messages tell that nothing more is needed.
+    """
+
+    def __init__(self, chunks, relay):
+        """
+        :param chunks: an iterable of Bursts in gr-gsm's record layout.
+        :param relay: the relay the bursts are published to, which limits the number of chunks in flight.
+        :type relay: _BurstRelay
+        """
+        gr.basic_block.__init__(self, name="gat_burst_source", in_sig=None, out_sig=None)
+        self.message_port_register_out(pmt.intern("out"))
+        self.__chunks = chunks
+        self.__relay = relay
+        self.__thread = None
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__publish, name="gat-burst-source")
+        self.__thread.daemon = True
+        self.__thread.start()
+        return True
+
+    def __publish(self):
+        # the GSMTAP header and the burst bits follow the PMT header of a record
+        offset = RECORD_DTYPE.itemsize - GSMTAP_HEADER_SIZE - BURST_SIZE
+        published = []  # number of bursts published after each chunk
+        for bursts in self.__chunks:
+            if len(published) >= _BurstRelay.CHUNKS_IN_FLIGHT:
+                self.__relay.wait_for(published[-_BurstRelay.CHUNKS_IN_FLIGHT])
+            data = bursts.records.view(numpy.uint8).reshape(len(bursts), RECORD_DTYPE.itemsize)[:, offset:]
+            for burst in data:
+                self.message_port_pub(pmt.intern("out"),
+                                      pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(len(burst), burst.tolist())))
+            published.append((published[-1] if published else 0) + len(bursts))
+        self._post(pmt.intern("system"), pmt.cons(pmt.intern("done"), pmt.from_long(1)))
+
+
+class _BurstRelay(gr.basic_block):
+    """
+    Passes bursts on and counts them, so that the source does not read ahead of the decoding.
+    """
+    CHUNKS_IN_FLIGHT = 2
+
+    def __init__(self):
+        gr.basic_block.__init__(self, name="gat_burst_relay", in_sig=None, out_sig=None)
+        self.message_port_register_in(pmt.intern("in"))
+        self.message_port_register_out(pmt.intern("out"))
+        self.set_msg_handler(pmt.intern("in"), self.__relay)
+        self.__condition = threading.Condition()
+        self.__count = 0
+
+    def __relay(self, msg):
+        self.message_port_pub(pmt.intern("out"), msg)
+        with self.__condition:
+            self.__count += 1
+            self.__condition.notify_all()
+
+    def wait_for(self, count):
+        """
+        Wait until the given number of bursts was passed on.
+        """
+        with self.__condition:
+            while self.__count < count:
+                self.__condition.wait()
+
+
+class _MessageSink(gr.basic_block):
+    """
+    Hands the messages decoded on a subchannel to a callback, as they are decoded.
+    """
+
+    def __init__(self, subchannel, callback):
+        """
+        :param callback: function called with the subchannel, the L3 message and the GSMTAP payload of each decoded
+        message.
+        """
+        gr.basic_block.__init__(self, name="gat_message_sink", in_sig=None, out_sig=None)
+        self.message_port_register_in(pmt.intern("in"))
+        self.set_msg_handler(pmt.intern("in"), self.__handle)
+        self.subchannel = subchannel
+        self.callback = callback
+        self.assembler = L3Assembler()
+
+    def __handle(self, msg):
+        packet = bytearray(pmt.u8vector_elements(pmt.cdr(msg)))
+        message = self.assembler.add(packet)
+        if message is not None:
+            self.callback(self.subchannel, message, packet[GSMTAP_HEADER_SIZE:])
+
+
+class _SessionDecoder(gr.top_block):
+    """
+    Decodes the SDCCH and SACCH messages of all subchannels of a timeslot from a sequence of chunks of its bursts.
+    """
+
+    def __init__(self, chunks, timeslot, mode, callback):
+        """
+        :param chunks: an iterable of Bursts of the timeslot, in gr-gsm's record layout.
+        :param callback: function called with the subchannel, the L3 message and the GSMTAP payload of each decoded
+        message.
+        """
+        gr.top_block.__init__(self, "Top Block")
+
+        self.relay = _BurstRelay()
+        self.burst_source = _BurstSource(chunks, self.relay)
+        if mode == 'BCCH_SDCCH4':
+            self.subslot_splitter = grgsm.burst_sdcch_subslot_splitter(grgsm.SPLITTER_SDCCH4)
+            self.demapper = grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=timeslot, )
+            subchannels = 4
+        else:
+            self.subslot_splitter = grgsm.burst_sdcch_subslot_splitter(grgsm.SPLITTER_SDCCH8)
+            self.demapper = grgsm.gsm_sdcch8_demapper(timeslot_nr=timeslot, )
+            subchannels = 8
+        self.decoders = [grgsm.control_channels_decoder() for x in range(subchannels)]
+        self.sinks = [_MessageSink(x, callback) for x in range(subchannels)]
+
+        self.msg_connect((self.burst_source, 'out'), (self.relay, 'in'))
+        self.msg_connect((self.relay, 'out'), (self.demapper, 'bursts'))
+        self.msg_connect((self.demapper, 'bursts'), (self.subslot_splitter, 'in'))
+        for i in range(subchannels):
+            self.msg_connect((self.subslot_splitter, 'out' + str(i)), (self.decoders[i], 'bursts'))
+            self.msg_connect((self.decoders[i], 'msgs'), (self.sinks[i], 'in'))
+
+
+class SessionAnalyzer(CMCAnalysis):
+    """
+    Follows the session started by an Immediate Assignment in a single pass over the burst file.
+
+    The Immediate Assignment is resolved from the first chunk of the burst file. The following chunks of the assigned
+    timeslot are decoded by a single flowgraph, which finds the Cipher Mode Command on the assigned subchannel and
+    the System Information messages on SACCH, while the bursts of the attack window are collected from the same
+    read of the burst file. The burst file is read from the Immediate Assignment on in chunks of whole multiframes,
+    so that no message is split, and reading stops as soon as everything needed for the attack is collected.
+    """
+    CHUNK_FRAMES = 8 * 51  # control channel messages never span a 51-multiframe
+    CMC_SEARCH_FRAMES = 51 * 10000
+    # chunks that may be read after the one of the CMC, before the CMC is decoded
+    MAX_DECODING_LAG = 16
+
+    def __init__(self, burst_file, timeslot, mode, fnr_ia):
+        """
+        :param burst_file: path of the burst file.
+        :param timeslot: timeslot of the Immediate Assignment.
+        :param mode: channel mode of the timeslot of the Immediate Assignment.
+        :param fnr_ia: framenumber of the Immediate Assignment.
+        """
+        self.burst_file = burst_file
+        self.fnr_ia = fnr_ia
+        self.ia_timeslot = timeslot
+        self.ia_mode = mode
+
+        self.ia_found = False
+        self.timeslot = None  # assigned timeslot
+        self.subchannel = None  # assigned subchannel
+        self.mode = None  # channel mode of the assigned timeslot
+        self.fnr_cmc = None
+        self.window = None  # attack window around the CMC
+        self.cmcs = dict()
+        self.sacch_sits = dict()
+        self.si_messages = dict()  # System Information messages on SACCH by type, as SICollector provides them
+        self.bursts = None
+        self.frames_read = 0
+
+        self.__lock = threading.Lock()
+        self.__si_types = collections.defaultdict(list)  # subchannel -> types of its SACCH messages, in order
+        # chunks of the assigned timeslot before the CMC is known, to collect the bursts of the window before it
+        self.__recent = collections.deque(maxlen=2 * 102 // self.CHUNK_FRAMES + 2 + self.MAX_DECODING_LAG)
+
+    def run(self):
+        """
+        :return: the analyzer. ia_found is False if there is no Immediate Assignment at the framenumber, fnr_cmc is
+        None if no Cipher Mode Command follows it on the assigned subchannel.
+        """
+        start = fnr_add(self.fnr_ia, -(self.fnr_ia % 51))
+        search = FnrWindow(start, min(self.CMC_SEARCH_FRAMES + len(attack_window(self.fnr_ia)) + self.CHUNK_FRAMES,
+                                      MAX_FNR))
+        chunks = self.__chunks(search)
+
+        # the Immediate Assignment is in the first chunk
+        first = next(chunks, None)
+        if first is None:
+            return self
+        self.__resolve_ia(first[1])
+        if not self.ia_found:
+            return self
+
+        decoder = _SessionDecoder(self.__session_chunks(search, itertools.chain([first], chunks)), self.timeslot,
+                                  self.mode, self.__add_message)
+        decoder.start()
+        decoder.wait()
+        # the CMC may have been decoded after the last chunk was read
+        self.__collect()
+        return self
+
+    def __session_chunks(self, search, chunks):
+        """
+        :return: a generator yielding the bursts of the assigned timeslot of each chunk, until everything needed for
+        the attack is read.
+        """
+        for chunk_start, bursts in chunks:
+            if self.__complete(chunk_start):
+                return
+            self.frames_read = search.offset(chunk_start) + self.CHUNK_FRAMES
+            session_bursts = bursts.filter(timeslot=self.timeslot)
+            self.__collect(session_bursts)
+            yield session_bursts
+
+    def __complete(self, chunk_start):
+        """
+        :param chunk_start: the first framenumber of the next chunk.
+        :return: True if no further chunk is needed, i.e. no CMC was found within the search range or the attack
+        window is read and a complete cycle of System Information messages on SACCH is known.
+        """
+        with self.__lock:
+            if self.fnr_cmc is None:
+                return self.frames_read > self.CMC_SEARCH_FRAMES
+            return fnr_diff(chunk_start, self.window.last) > 0 and self.si_cycle is not None
+
+    def __collect(self, bursts=None):
+        """
+        Collect the bursts of the attack window. Bursts are kept aside until the CMC is known.
+
+        :param bursts: bursts of the assigned timeslot, None to only store the bursts kept aside.
+        """
+        if bursts is not None:
+            self.__recent.append(bursts)
+        with self.__lock:
+            if self.fnr_cmc is None:
+                return
+        if self.bursts is None:
+            subslot_mode = SUBSLOT_SDCCH4 if self.mode == 'BCCH_SDCCH4' else SUBSLOT_SDCCH8
+            self.bursts = PackedBursts.allocate(attack_framenumbers(self.fnr_cmc, subslot_mode))
+        while self.__recent:
+            previous = self.__recent.popleft()
+            self.bursts.store(previous.framenumbers, previous.payloads, previous.snr_db)
+
+    def __add_message(self, subchannel, message, payload):
+        """
+        Called by the flowgraph for every message decoded on the assigned timeslot.
+
+        :param payload: the GSMTAP payload of the message, i.e. the L2 block including the L1 header on SACCH.
+        """
+        if message.uplink:
+            return
+        fnr = message.frame_number
+        with self.__lock:
+            if message.message_type == "Ciphering Mode Command" and not message.channel.startswith("SACCH"):
+                self.cmcs[fnr] = (subchannel, message.fields.get("a5_version"))
+                # the first CMC on the assigned subchannel after the Immediate Assignment belongs to the session
+                if self.fnr_cmc is None and subchannel == self.subchannel and fnr_diff(fnr, self.fnr_ia) >= 0:
+                    self.fnr_cmc = fnr
+                    self.window = attack_window(fnr)
+            elif message.channel.startswith("SACCH") and message.message_type is not None and (
+                    message.message_type.startswith("System Information Type 5") or
+                    message.message_type.startswith("System Information Type 6")):
+                data = binascii.hexlify(bytes(payload)).decode()
+                self.sacch_sits[fnr] = (subchannel, message.message_type, data)
+                if message.message_type not in self.si_messages:
+                    self.si_messages[message.message_type] = data
+                self.__add_si_type(subchannel, message.message_type)
+
+    def __add_si_type(self, subchannel, si_type):
+        """
+        Track the cycle of System Information types on the SACCH of a subchannel. The cycle is complete once the
+        first type seen on a subchannel is repeated, so that SI 5bis and 5ter are known if the network sends them.
+        """
+        types = self.__si_types[subchannel]
+        types.append(si_type)
+        if self.si_cycle is None:
+            self.si_cycle = observed_si_cycle(types)
+
+    def __chunks(self, window):
+        """
+        Read the bursts of all timeslots within the window, in chunks of CHUNK_FRAMES frames.
+
+        :return: a generator yielding the first framenumber and the bursts of each chunk.
+        """
+        block = None
+        pending = []
+        for bursts in read_bursts(self.burst_file, window=window):
+            blocks = window.offset(bursts.framenumbers.astype(numpy.int64)) // self.CHUNK_FRAMES
+            bounds = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(blocks)) + 1, [len(blocks)]))
+            for first, stop in zip(bounds[:-1], bounds[1:]):
+                if block is not None and blocks[first] != block:
+                    yield fnr_add(window.start, block * self.CHUNK_FRAMES), Bursts(numpy.concatenate(pending))
+                    pending = []
+                block = blocks[first]
+                segment = bursts[first:stop]
+                # the records are copied, as the burst file is unmapped when reading goes on
+                pending.append(segment.records.copy() if segment.records.dtype == RECORD_DTYPE else to_records(segment))
+        if pending:
+            yield fnr_add(window.start, block * self.CHUNK_FRAMES), Bursts(numpy.concatenate(pending))
+
+    def __resolve_ia(self, bursts):
+        path = self.__write(bursts.filter(timeslot=self.ia_timeslot))
+        try:
+            decoder = _ImmediateAssignmentChunkDecoder(path, self.ia_timeslot, self.ia_mode)
+            decoder.start()
+            decoder.wait()
+        finally:
+            os.remove(path)
+
+        extractor = decoder.extract_immediate_assignment
+        immediate_assignments = extractor.get_frame_numbers()
+        for i in range(len(immediate_assignments)):
+            if immediate_assignments[i] == self.fnr_ia:
+                self.ia_found = True
+                self.timeslot = extractor.get_timeslots()[i]
+                self.subchannel = extractor.get_subchannels()[i]
+                self.mode = "SDCCH8" if extractor.get_channel_types()[i] == "SDCCH/8" else "BCCH_SDCCH4"
+                return
+
+    @staticmethod
+    def __write(bursts):
+        """
+        Write bursts to a temporary burst file in gr-gsm's format.
+
+        :return: the path of the file.
+        """
+        fd, path = tempfile.mkstemp(suffix=".bursts", prefix="gat-")
+        os.close(fd)
+        with BurstFileWriter(path) as destination:
+            destination.write(bursts)
+        return path
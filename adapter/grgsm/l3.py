@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Parser for the GSM layer 3 messages decoded by gr-gsm, see 3GPP TS 44.018 (RR) and TS 24.008 (MM).
+
+Decoded messages are GSMTAP packets holding an L2 block. The L3 message is taken from the L2 block according to
+the channel and is parsed into its type and the fields needed for analyses, e.g. the identities of pagings or the
+A5 version of a Ciphering Mode Command. Messages that are not known are kept with their protocol and type only.
+"""
+import binascii
+import struct
+
+from adapter.grgsm.burstfile import GSMTAP_HEADER_SIZE
+
+# GSMTAP channel types, see gsmtap.h
+_GSMTAP_CHANNELS = {1: "BCCH", 2: "CCCH", 3: "RACH", 4: "AGCH", 5: "PCH", 6: "SDCCH", 7: "SDCCH/4", 8: "SDCCH/8",
+                    9: "TCH/F", 10: "TCH/H"}
+_GSMTAP_ACCH = 0x80
+_GSMTAP_UPLINK = 0x4000
+_SACCH_CHANNELS = {"SDCCH/4": "SACCH/4", "SDCCH/8": "SACCH/8", "TCH/F": "SACCH/TF", "TCH/H": "SACCH/TH"}
+_FACCH_CHANNELS = {"TCH/F": "FACCH/F", "TCH/H": "FACCH/H"}
+# channels whose L2 block starts with an L2 pseudo length instead of a LAPDm header
+_CCCH_CHANNELS = ["BCCH", "CCCH", "AGCH", "PCH"]
+
+PD_CC = 0x3
+PD_MM = 0x5
+PD_RR = 0x6
+PD_SMS = 0x9
+PD_SS = 0xb
+PROTOCOLS = {PD_CC: "CC", PD_MM: "MM", PD_RR: "RR", PD_SMS: "SMS", PD_SS: "SS"}
+
+RR_MESSAGES = {
+    0x00: "System Information Type 13",
+    0x02: "System Information Type 2bis",
+    0x03: "System Information Type 2ter",
+    0x05: "System Information Type 5bis",
+    0x06: "System Information Type 5ter",
+    0x07: "System Information Type 2quater",
+    0x0d: "Channel Release",
+    0x15: "Measurement Report",
+    0x19: "System Information Type 1",
+    0x1a: "System Information Type 2",
+    0x1b: "System Information Type 3",
+    0x1c: "System Information Type 4",
+    0x1d: "System Information Type 5",
+    0x1e: "System Information Type 6",
+    0x21: "Paging Request Type 1",
+    0x22: "Paging Request Type 2",
+    0x24: "Paging Request Type 3",
+    0x27: "Paging Response",
+    0x29: "Assignment Failure",
+    0x2b: "Handover Command",
+    0x2e: "Assignment Command",
+    0x32: "Ciphering Mode Complete",
+    0x35: "Ciphering Mode Command",
+    0x39: "Immediate Assignment Extended",
+    0x3a: "Immediate Assignment Reject",
+    0x3f: "Immediate Assignment",
+}
+MM_MESSAGES = {
+    0x01: "IMSI Detach Indication",
+    0x02: "Location Updating Accept",
+    0x04: "Location Updating Reject",
+    0x08: "Location Updating Request",
+    0x11: "Authentication Reject",
+    0x12: "Authentication Request",
+    0x14: "Authentication Response",
+    0x18: "Identity Request",
+    0x19: "Identity Response",
+    0x1a: "TMSI Reallocation Command",
+    0x1b: "TMSI Reallocation Complete",
+    0x21: "CM Service Accept",
+    0x22: "CM Service Reject",
+    0x24: "CM Service Request",
+}
+CC_MESSAGES = {
+    0x01: "Alerting",
+    0x02: "Call Proceeding",
+    0x05: "Setup",
+    0x07: "Connect",
+    0x0f: "Connect Acknowledge",
+    0x25: "Disconnect",
+    0x2a: "Release Complete",
+    0x2d: "Release",
+}
+_MESSAGES = {PD_RR: RR_MESSAGES, PD_MM: MM_MESSAGES, PD_CC: CC_MESSAGES}
+
+IDENTITY_IMSI = "IMSI"
+IDENTITY_IMEI = "IMEI"
+IDENTITY_IMEISV = "IMEISV"
+IDENTITY_TMSI = "TMSI"
+_IDENTITY_TYPES = {1: IDENTITY_IMSI, 2: IDENTITY_IMEI, 3: IDENTITY_IMEISV, 4: IDENTITY_TMSI}
+_IEI_MOBILE_IDENTITY = 0x17
+
+
+class L3Message(object):
+    """
+    A parsed L3 message.
+    """
+
+    def __init__(self, frame_number, timeslot, subslot, channel, uplink, data):
+        """
+        :param frame_number: framenumber of the (first) L2 block of the message.
+        :param channel: the logical channel, e.g. "PCH" or "SACCH/8".
+        :param uplink: True for messages of the mobile station.
+        :param data: the L3 message, as bytearray.
+        """
+        self.frame_number = frame_number
+        self.timeslot = timeslot
+        self.subslot = subslot
+        self.channel = channel
+        self.uplink = uplink
+        self.data = data
+        self.protocol = None
+        self.message_type = None
+        self.fields = dict()
+        self.identities = []  # (identity type, identity) tuples, e.g. ("TMSI", "1a2b3c4d")
+        self.__parse()
+
+    def __parse(self):
+        if len(self.data) < 2:
+            return
+        pd = self.data[0] & 0x0f
+        self.protocol = PROTOCOLS.get(pd, "PD %s" % pd)
+        # the two highest bits of MM and CC message types hold a send sequence number
+        value = self.data[1] if pd == PD_RR else self.data[1] & 0x3f
+        self.message_type = _MESSAGES.get(pd, {}).get(value, "%s 0x%02x" % (self.protocol, value))
+        parser = _PARSERS.get(self.message_type)
+        if parser is not None:
+            try:
+                parser(self, self.data[2:])
+            except IndexError:
+                self.fields["truncated"] = True
+
+    def add_identity(self, identity):
+        if identity is not None:
+            self.identities.append(identity)
+
+
+def mobile_identity(data):
+    """
+    :param data: the value of a mobile identity information element, see TS 24.008, 10.5.1.4.
+    :return: tuple of the identity type and the identity, None for no identity.
+    """
+    if len(data) == 0:
+        return None
+    identity_type = _IDENTITY_TYPES.get(data[0] & 0x07)
+    if identity_type is None:
+        return None
+    if identity_type == IDENTITY_TMSI:
+        return identity_type, binascii.hexlify(bytes(data[1:5])).decode()
+    digits = [data[0] >> 4]
+    for byte in data[1:]:
+        digits += [byte & 0x0f, byte >> 4]
+    if not data[0] & 0x08:  # even number of digits, the last one is a filler
+        digits = digits[:-1]
+    return identity_type, "".join("%d" % digit for digit in digits if digit < 10)
+
+
+def location_area(data):
+    """
+    :param data: a location area identification, see TS 24.008, 10.5.1.3.
+    :return: a dictionary of the MCC, MNC and LAC.
+    """
+    mcc = "%d%d%d" % (data[0] & 0x0f, data[0] >> 4, data[1] & 0x0f)
+    mnc = "%d%d" % (data[2] & 0x0f, data[2] >> 4)
+    if data[1] >> 4 != 0x0f:
+        mnc += "%d" % (data[1] >> 4)
+    return {"mcc": mcc, "mnc": mnc, "lac": struct.unpack(">H", bytes(data[3:5]))[0]}
+
+
+def channel_description(data):
+    """
+    :param data: a channel description, see TS 44.018, 10.5.2.5.
+    :return: a dictionary of the channel type, timeslot, subchannel and hopping flag, and the ARFCN of channels
+    without hopping.
+    """
+    channel_type = data[0] >> 3
+    if channel_type == 0x01:
+        channel, subchannel = "TCH/F", 0
+    elif channel_type >> 1 == 0x01:
+        channel, subchannel = "TCH/H", channel_type & 0x01
+    elif channel_type >> 2 == 0x01:
+        channel, subchannel = "SDCCH/4", channel_type & 0x03
+    elif channel_type >> 3 == 0x01:
+        channel, subchannel = "SDCCH/8", channel_type & 0x07
+    else:
+        channel, subchannel = "unknown", None
+    fields = {"channel_type": channel, "timeslot": data[0] & 0x07, "subchannel": subchannel,
+              "hopping": bool(data[1] & 0x10)}
+    if not fields["hopping"]:
+        fields["arfcn"] = (data[1] & 0x03) << 8 | data[2]
+    return fields
+
+
+def _optional_mobile_identity(message, data):
+    if len(data) >= 2 and data[0] == _IEI_MOBILE_IDENTITY:
+        message.add_identity(mobile_identity(data[2:2 + data[1]]))
+
+
+def _immediate_assignment(message, data):
+    message.fields["tbf"] = bool(data[0] & 0x10)
+    message.fields.update(channel_description(data[1:4]))
+    message.fields["timing_advance"] = data[7]
+
+
+def _paging_request_1(message, data):
+    length = data[1]
+    message.add_identity(mobile_identity(data[2:2 + length]))
+    _optional_mobile_identity(message, data[2 + length:])
+
+
+def _paging_request_2(message, data):
+    for offset in (1, 5):
+        message.add_identity((IDENTITY_TMSI, binascii.hexlify(bytes(data[offset:offset + 4])).decode()))
+    _optional_mobile_identity(message, data[9:])
+
+
+def _paging_request_3(message, data):
+    for offset in (1, 5, 9, 13):
+        message.add_identity((IDENTITY_TMSI, binascii.hexlify(bytes(data[offset:offset + 4])).decode()))
+
+
+def _ciphering_mode_command(message, data):
+    start_ciphering = bool(data[0] & 0x01)
+    message.fields["start_ciphering"] = start_ciphering
+    message.fields["a5_version"] = ((data[0] >> 1) & 0x07) + 1 if start_ciphering else 0
+
+
+def _classmark_2_and_identity(message, data):
+    # a spare half octet and the ciphering key sequence number or service type, then the mobile station
+    # classmark 2 and the mobile identity
+    length = data[1]
+    message.add_identity(mobile_identity(data[3 + length:3 + length + data[2 + length]]))
+
+
+def _system_information_cell(message, data):
+    message.fields["cell_identity"] = struct.unpack(">H", bytes(data[0:2]))[0]
+    message.fields.update(location_area(data[2:7]))
+
+
+def _location_updating_request(message, data):
+    message.fields.update(location_area(data[1:6]))
+    message.add_identity(mobile_identity(data[8:8 + data[7]]))
+
+
+def _location_updating_accept(message, data):
+    message.fields.update(location_area(data[0:5]))
+    _optional_mobile_identity(message, data[5:])
+
+
+def _tmsi_reallocation_command(message, data):
+    message.fields.update(location_area(data[0:5]))
+    message.add_identity(mobile_identity(data[6:6 + data[5]]))
+
+
+def _identity_response(message, data):
+    message.add_identity(mobile_identity(data[1:1 + data[0]]))
+
+
+_PARSERS = {
+    "Immediate Assignment": _immediate_assignment,
+    "Paging Request Type 1": _paging_request_1,
+    "Paging Request Type 2": _paging_request_2,
+    "Paging Request Type 3": _paging_request_3,
+    "Paging Response": _classmark_2_and_identity,
+    "Ciphering Mode Command": _ciphering_mode_command,
+    "System Information Type 3": _system_information_cell,
+    "System Information Type 4": lambda message, data: message.fields.update(location_area(data[0:5])),
+    "System Information Type 6": _system_information_cell,
+    "Location Updating Request": _location_updating_request,
+    "Location Updating Accept": _location_updating_accept,
+    "TMSI Reallocation Command": _tmsi_reallocation_command,
+    "Identity Response": _identity_response,
+    "CM Service Request": _classmark_2_and_identity,
+}
+
+
+class L3Assembler(object):
+    """
+    Takes the L3 messages out of decoded GSMTAP packets, reassembling the messages that LAPDm segments over several
+    I frames.
+    """
+
+    def __init__(self):
+        self.__segments = dict()  # link -> (framenumber of the first segment, data of the segments so far)
+
+    def add(self, packet):
+        """
+        :param packet: a decoded GSMTAP packet, as bytearray.
+        :return: the L3Message completed by the packet, None if the packet holds no L3 message or only a segment.
+        """
+        header = packet[:GSMTAP_HEADER_SIZE]
+        block = packet[GSMTAP_HEADER_SIZE:]
+        if len(header) < GSMTAP_HEADER_SIZE or len(block) < 3:
+            return None
+        timeslot = header[3]
+        uplink = bool(struct.unpack(">H", bytes(header[4:6]))[0] & _GSMTAP_UPLINK)
+        frame_number = struct.unpack(">I", bytes(header[8:12]))[0]
+        subslot = header[14]
+        channel = _GSMTAP_CHANNELS.get(header[12] & ~_GSMTAP_ACCH & 0xff, "unknown")
+
+        if channel in _CCCH_CHANNELS:
+            return L3Message(frame_number, timeslot, subslot, channel, uplink, block[1:1 + (block[0] >> 2)])
+        if header[12] & _GSMTAP_ACCH:
+            channel = _SACCH_CHANNELS.get(channel, channel)
+            block = block[2:]  # the L1 header
+        else:
+            channel = _FACCH_CHANNELS.get(channel, channel)
+        if len(block) < 3:
+            return None
+
+        address, control, length = block[0], block[1], block[2]
+        if control & 0x01 and control & 0xef != 0x03:
+            return None  # S and U frames other than UI frames carry no information
+        data = block[3:3 + (length >> 2)]
+        link = (timeslot, subslot, channel, uplink, (address >> 2) & 0x07)
+        first_frame_number, segments = self.__segments.pop(link, (frame_number, bytearray()))
+        segments += data
+        if length & 0x02:  # more segments follow
+            self.__segments[link] = (first_frame_number, segments)
+            return None
+        if len(segments) == 0:
+            return None
+        return L3Message(first_frame_number, timeslot, subslot, channel, uplink, segments)
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+import binascii
+import json
+import os
+import sqlite3
+
+from adapter.grgsm.channel_decoder import Channel, MultiChannelDecoder
+from adapter.grgsm.l3 import L3Assembler
+from core.common.fnr_window import MAX_FNR
+
+MESSAGE_STORE_SUFFIX = ".msgs.db"
+MESSAGE_STORE_VERSION = 1
+
+_MESSAGE_COLUMNS = ["id", "position", "frame_number", "timeslot", "subslot", "channel", "uplink", "protocol",
+                    "message_type", "data", "fields"]
+
+
+class StoredMessage(object):
+    """
+    A message read from the message store.
+    """
+
+    def __init__(self, row, identities):
+        values = dict(zip(_MESSAGE_COLUMNS, row))
+        self.position = values["position"]
+        self.frame_number = values["frame_number"]
+        self.timeslot = values["timeslot"]
+        self.subslot = values["subslot"]
+        self.channel = values["channel"]
+        self.uplink = bool(values["uplink"])
+        self.protocol = values["protocol"]
+        self.message_type = values["message_type"]
+        self.data = bytearray(binascii.unhexlify(values["data"]))
+        self.fields = json.loads(values["fields"])
+        self.identities = identities
+
+
+class MessageStore(object):
+    """
+    Persistent store of the L3 messages decoded from a burst file, stored in a SQLite database next to it.
+
+    Channels are decoded on first use only: populate() decodes the channels that were not decoded before and
+    stores their messages, later queries are lookups in the indexed database. The store is emptied if the burst
+    file changes.
+    """
+
+    def __init__(self, burst_file, path=None):
+        """
+        :param burst_file: path of the burst file.
+        :param path: path of the database, None for the default next to the burst file. If the default cannot be
+        written, e.g. on read-only storage, the store is kept in memory.
+        """
+        self.burst_file = burst_file
+        self.path = path if path is not None else burst_file + MESSAGE_STORE_SUFFIX
+        try:
+            self.__db = sqlite3.connect(self.path)
+            self.__create_tables()
+        except sqlite3.Error:
+            if path is not None:
+                raise
+            self.path = ":memory:"
+            self.__db = sqlite3.connect(self.path)
+            self.__create_tables()
+        self.__check_burst_file()
+
+    def __create_tables(self):
+        with self.__db:
+            self.__db.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)")
+            self.__db.execute("CREATE TABLE IF NOT EXISTS channels ("
+                              "mode TEXT NOT NULL, timeslot INTEGER NOT NULL, PRIMARY KEY (mode, timeslot))")
+            self.__db.execute("CREATE TABLE IF NOT EXISTS messages ("
+                              "id INTEGER PRIMARY KEY, position INTEGER NOT NULL, frame_number INTEGER NOT NULL, "
+                              "timeslot INTEGER NOT NULL, subslot INTEGER, channel TEXT NOT NULL, "
+                              "uplink INTEGER NOT NULL, protocol TEXT, message_type TEXT, data TEXT NOT NULL, "
+                              "fields TEXT NOT NULL)")
+            self.__db.execute("CREATE TABLE IF NOT EXISTS identities ("
+                              "message_id INTEGER NOT NULL, identity_type TEXT NOT NULL, identity TEXT NOT NULL)")
+            # channel modes overlap, e.g. BCCH and BCCH_SDCCH4 both hold the BCCH, so messages are stored once
+            self.__db.execute("CREATE UNIQUE INDEX IF NOT EXISTS messages_unique ON messages "
+                              "(frame_number, timeslot, subslot, channel, uplink, data)")
+            self.__db.execute("CREATE INDEX IF NOT EXISTS messages_type ON messages "
+                              "(message_type COLLATE NOCASE, position)")
+            self.__db.execute("CREATE INDEX IF NOT EXISTS messages_position ON messages (position)")
+            self.__db.execute("CREATE INDEX IF NOT EXISTS messages_frame_number ON messages (frame_number)")
+            self.__db.execute("CREATE INDEX IF NOT EXISTS identities_identity ON identities "
+                              "(identity COLLATE NOCASE, message_id)")
+
+    def __check_burst_file(self):
+        """
+        Empty the store if it was created by another version or for another state of the burst file.
+        """
+        stat = os.stat(self.burst_file)
+        expected = {"version": str(MESSAGE_STORE_VERSION), "size": str(stat.st_size), "mtime": repr(stat.st_mtime)}
+        if dict(self.__db.execute("SELECT key, value FROM metadata").fetchall()) != expected:
+            with self.__db:
+                for table in ["metadata", "channels", "messages", "identities"]:
+                    self.__db.execute("DELETE FROM %s" % table)
+                self.__db.executemany("INSERT INTO metadata (key, value) VALUES (?, ?)", expected.items())
+
+    def decoded_channels(self):
+        """
+        :return: the (mode, timeslot) tuples of the channels decoded so far.
+        """
+        return [tuple(row) for row in self.__db.execute("SELECT mode, timeslot FROM channels ORDER BY timeslot, mode")]
+
+    def populate(self, channels, processes=None):
+        """
+        Decode the channels that were not decoded before and store their messages. Channels are always decoded as
+        a whole, i.e. with all their subslots.
+
+        :param channels: the channels the following queries need.
+        :type channels: list of Channel
+        :param processes: number of worker processes, see MultiChannelDecoder.
+        :return: the number of channels decoded.
+        """
+        decoded = set(self.decoded_channels())
+        missing = []
+        for channel in channels:
+            key = (channel.mode, channel.timeslot)
+            if key not in decoded:
+                decoded.add(key)
+                missing.append(Channel(channel.mode, channel.timeslot))
+        if missing:
+            decoder = MultiChannelDecoder(self.burst_file, missing, processes=processes)
+            self.store(missing, decoder.run(), decoder.first_frame_number)
+        return len(missing)
+
+    def store(self, channels, decoded_messages, first_frame_number):
+        """
+        Store the messages decoded from channels without decryption.
+
+        :param channels: the decoded channels. Channels decoded as a whole are marked as decoded.
+        :param decoded_messages: the decoded messages, see MultiChannelDecoder.run().
+        :param first_frame_number: framenumber of the first burst of the burst file. Messages are ordered by their
+        offset from it, as the capture may span the hyperframe wraparound.
+        """
+        assembler = L3Assembler()
+        first_frame_number = first_frame_number or 0
+        with self.__db:
+            for decoded in decoded_messages:
+                message = assembler.add(decoded.data)
+                if message is None or message.message_type is None:
+                    continue
+                cursor = self.__db.execute(
+                    "INSERT OR IGNORE INTO messages (position, frame_number, timeslot, subslot, channel, uplink, "
+                    "protocol, message_type, data, fields) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    ((message.frame_number - first_frame_number) % MAX_FNR, message.frame_number, message.timeslot,
+                     message.subslot, message.channel, int(message.uplink), message.protocol, message.message_type,
+                     binascii.hexlify(bytes(message.data)).decode(), json.dumps(message.fields, sort_keys=True)))
+                if cursor.rowcount > 0:
+                    self.__db.executemany("INSERT INTO identities (message_id, identity_type, identity) "
+                                          "VALUES (?, ?, ?)",
+                                          [(cursor.lastrowid, identity_type, identity)
+                                           for identity_type, identity in message.identities])
+            self.__db.executemany("INSERT OR IGNORE INTO channels (mode, timeslot) VALUES (?, ?)",
+                                  [(channel.mode, channel.timeslot) for channel in channels
+                                   if channel.subslot is None])
+
+    def messages(self, message_type=None, identity=None, framenr_ge=None, framenr_le=None, timeslot=None,
+                 subslot=None):
+        """
+        Query the stored messages.
+
+        :param message_type: the message type, e.g. "Ciphering Mode Command". Matches case insensitive and as prefix,
+        e.g. "paging" matches all types of paging requests.
+        :param identity: a TMSI (as hex string) or IMSI the message contains.
+        :param framenr_ge: lowest framenumber.
+        :param framenr_le: highest framenumber.
+        :return: the matching messages, as StoredMessage objects, in the order of the capture.
+        """
+        conditions = []
+        parameters = []
+        if message_type is not None:
+            conditions.append("message_type LIKE ? ESCAPE '\\'")
+            parameters.append(message_type.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if identity is not None:
+            conditions.append("id IN (SELECT message_id FROM identities WHERE identity = ? COLLATE NOCASE)")
+            parameters.append(identity)
+        for column, operator, value in [("frame_number", ">=", framenr_ge), ("frame_number", "<=", framenr_le),
+                                        ("timeslot", "=", timeslot), ("subslot", "=", subslot)]:
+            if value is not None:
+                conditions.append("%s %s ?" % (column, operator))
+                parameters.append(value)
+        query = "SELECT %s FROM messages" % ", ".join(_MESSAGE_COLUMNS)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        rows = self.__db.execute(query + " ORDER BY position, id", parameters).fetchall()
+
+        identities = dict()
+        for row in rows:
+            identities[row[0]] = []
+        for message_id, identity_type, value in self.__identities(list(identities)):
+            identities[message_id].append((identity_type, value))
+        return [StoredMessage(row, identities[row[0]]) for row in rows]
+
+    def __identities(self, message_ids):
+        # SQLite limits the number of parameters of a statement
+        for start in range(0, len(message_ids), 500):
+            ids = message_ids[start:start + 500]
+            for row in self.__db.execute("SELECT message_id, identity_type, identity FROM identities "
+                                         "WHERE message_id IN (%s)" % ", ".join("?" * len(ids)), ids):
+                yield row
+
+    def cipher_mode_commands(self):
+        return self.messages("Ciphering Mode Command")
+
+    def pagings(self, identity):
+        """
+        :param identity: a TMSI (as hex string) or IMSI.
+        """
+        return self.messages("Paging Request", identity=identity)
+
+    def close(self):
+        self.__db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
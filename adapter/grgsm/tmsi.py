@@ -3,6 +3,8 @@ import grgsm
 from gnuradio import blocks
 from gnuradio import gr
 
+from adapter.grgsm.burstfile import BurstSelection
+
 
 class TmsiCapture(gr.top_block):
     def __init__(self, timeslot=0, chan_mode='BCCH',
@@ -26,8 +28,11 @@ class TmsiCapture(gr.top_block):
         # Blocks
         ##################################################
 
+        self.burst_selection = None
         if self.burst_file:
-            self.burst_file_source = grgsm.burst_file_source(burst_file)
+            # dummy bursts and other timeslots are removed from burst files before they enter the flowgraph
+            self.burst_selection = BurstSelection(burst_file, timeslot=self.timeslot, filter_dummy_bursts=True)
+            self.burst_file_source = grgsm.burst_file_source(self.burst_selection.path)
         elif self.cfile:
             self.file_source = blocks.file_source(gr.sizeof_gr_complex * 1, self.cfile, False)
             self.receiver = grgsm.receiver(4, ([0]), ([]))
@@ -55,7 +60,7 @@ class TmsiCapture(gr.top_block):
         ##################################################
 
         if self.burst_file:
-            self.msg_connect(self.burst_file_source, "out", self.dummy_burst_filter, "in")
+            bursts_block = self.burst_file_source
         elif self.cfile:
             self.connect((self.file_source, 0), (self.input_adapter, 0))
             self.connect((self.input_adapter, 0), (self.receiver, 0))
@@ -63,21 +68,29 @@ class TmsiCapture(gr.top_block):
                 self.msg_connect(self.offset_control, "ctrl", self.input_adapter, "ctrl_in")
                 self.msg_connect(self.receiver, "measurements", self.offset_control, "measurements")
             self.msg_connect(self.receiver, "C0", self.dummy_burst_filter, "in")
-
-        self.msg_connect(self.dummy_burst_filter, "out", self.timeslot_filter, "in")
+            self.msg_connect(self.dummy_burst_filter, "out", self.timeslot_filter, "in")
+            bursts_block = self.timeslot_filter
 
         if self.chan_mode == 'BCCH':
-            self.msg_connect(self.timeslot_filter, "out", self.bcch_demapper, "bursts")
+            self.msg_connect(bursts_block, "out", self.bcch_demapper, "bursts")
             self.msg_connect(self.bcch_demapper, "bursts", self.cch_decoder, "bursts")
             self.msg_connect(self.cch_decoder, "msgs", self.socket_pdu, "pdus")
             self.msg_connect(self.cch_decoder, "msgs", self.tmsi_dumper, "msgs")
 
         elif self.chan_mode == 'BCCH_SDCCH4':
-            self.msg_connect(self.timeslot_filter, "out", self.bcch_sdcch4_demapper, "bursts")
+            self.msg_connect(bursts_block, "out", self.bcch_sdcch4_demapper, "bursts")
             self.msg_connect(self.bcch_sdcch4_demapper, "bursts", self.cch_decoder, "bursts")
             self.msg_connect(self.cch_decoder, "msgs", self.socket_pdu, "pdus")
             self.msg_connect(self.cch_decoder, "msgs", self.tmsi_dumper, "msgs")
 
+    def wait(self):
+        """
+        Override gr.top_block's wait method.
+        """
+        gr.top_block.wait(self)
+        if self.burst_selection is not None:
+            self.burst_selection.remove()
+
 
 class TmsiLiveCapture(gr.top_block):
     def __init__(self, timeslot=0, chan_mode='BCCH', fc=None, arfcn=0, samp_rate=2e6, ppm=0, gain=30):
@@ -1,122 +1,655 @@
 # -*- coding: utf-8 -*-
+import collections
+import os
+import re
 import socket
-import subprocess
+import threading
+import time
 
-from core.adapterinterfaces.a5 import A5ReconstructionAdapter
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
+from adapter.a51 import find_keys, fn2count, key_to_bits, match_keys
+from adapter import kraken_metrics
+from adapter.kraken_cache import KrakenCache
+from adapter.kraken_metrics import KrakenMetrics
+from core.adapterinterfaces.a5 import A5ReconstructionAdapter, A5ReconstructionBatch, A5ReconstructionResult, \
+    A5ReconstructionStatus
+from core.common.bits import bits_to_string, unpack_bits, xor_bits
 
-class KrakenA51ReconstructorAdapter(A5ReconstructionAdapter):
-    def __init__(self, config_provider):
-        super(KrakenA51ReconstructorAdapter, self).__init__(config_provider)
-        self.__host = config_provider.get("kraken", "host")
-        self.__port = config_provider.getint("kraken", "port")
+# replies of the Kraken server
+_KRAKEN_CRACKING = re.compile(r"^Cracking #(\d+)")
+_KRAKEN_FOUND = re.compile(r"^Found ([0-9a-fA-F]+) @ (\d+)\s+#(\d+)\s+\(table:(\d+)\)")
+_KRAKEN_FINISHED = re.compile(r"^crack #(\d+) took(?: (\d+) msec)?")
+
+# seconds to wait for the threads of a closed connection
+_THREAD_JOIN_TIMEOUT = 1.0
+
+KrakenCandidate = collections.namedtuple("KrakenCandidate", ["key", "bitpos", "table"])
+
+
+class KrakenError(Exception):
+    """
+    Signals a failed communication with Kraken.
+    """
+    pass
+
+
+class KrakenJob(object):
+    """
+    A crack job submitted to Kraken.
+    """
+
+    def __init__(self, burst_set, keystream, listener):
+        """
+        :param burst_set: the burst set the keystream was derived from.
+        :type burst_set: A5BurstSet
+        :param keystream: the keystream sent to Kraken, as string of '0' and '1' characters.
+        :param listener: a queue, which receives a (job, candidate) tuple for every key candidate reported by Kraken
+        and (job, None) when the job is finished.
+        """
+        self.burst_set = burst_set
+        self.keystream = keystream
+        self.job_id = None
+        self.submitted = time.time()
+        self.acknowledged = None  # time Kraken assigned the job number
+        self.finished_at = None
+        self.kraken_time = None  # search time reported by Kraken, in seconds
+        self.candidates = []
+        self.finished = False
+        self.cancelled = False
+        self.error = None
+        self.node = None
+        self.__listener = listener
+
+    def add_candidate(self, candidate):
+        self.candidates.append(candidate)
+        self.__listener.put((self, candidate))
+
+    def finish(self, error=None):
+        if not self.finished:
+            self.finished = True
+            self.finished_at = time.time()
+            self.error = error
+            self.__listener.put((self, None))
 
-    def reconstruct(self, a5_burst_set):
-        super(KrakenA51ReconstructorAdapter, self).reconstruct(a5_burst_set)
 
-    def send2kraken(self, kraken_burst, verbose=False):
-        cracked = False
-        invalid = False
-        failed = False
-        found_key = None
+class KrakenConnection(object):
+    """
+    Long-lived connection to a Kraken server.
 
-        # Todo: Timeout for connection
-        remote_address = (self.__host, self.__port)
-        sock = None
+    Several crack jobs can be in flight at once. Kraken answers every crack command with the number of the job it
+    created, in the order of the commands, and reports candidates and the end of a job with that number. A reader
+    thread assigns the replies to the submitted jobs. Commands are sent by a writer thread, so that a blocking send
+    never holds up the reader while Kraken waits for its output to be read.
+    """
+
+    def __init__(self, host, port, connect_timeout=10):
+        """
+        :raises socket.error: if the connection cannot be established.
+        """
+        self.__socket = socket.create_connection((host, port), connect_timeout)
+        self.__socket.settimeout(None)
+        self.__file = self.__socket.makefile("r")
+        self.__lock = threading.Lock()
+        self.__unassigned = collections.deque()  # jobs waiting for their job number, in order of submission
+        self.__jobs = dict()
+        self.__commands = queue.Queue()
+        self.__error = None
+        self.closed = False
+
+        self.__reader = threading.Thread(target=self.__read, name="kraken-reader")
+        self.__reader.daemon = True
+        self.__reader.start()
+        self.__writer = threading.Thread(target=self.__write, name="kraken-writer")
+        self.__writer.daemon = True
+        self.__writer.start()
+
+    def submit(self, burst_set, keystream, listener):
+        """
+        Submit a crack job.
+
+        :param burst_set: the burst set the keystream was derived from.
+        :param keystream: the keystream, as string of '0' and '1' characters.
+        :param listener: a queue receiving the events of the job, see KrakenJob.
+        :return: the job.
+        :raises KrakenError: if the connection is closed.
+        """
+        job = KrakenJob(burst_set, keystream, listener)
+        with self.__lock:
+            if self.closed:
+                raise KrakenError("Connection to Kraken is closed")
+            # the command is queued under the lock, so that the jobs are assigned in the order they are sent
+            self.__unassigned.append(job)
+            self.__commands.put("crack %s\n" % keystream)
+        return job
+
+    def cancel(self, job):
+        """
+        Cancel a job. Its candidates are not reported anymore.
+        """
+        with self.__lock:
+            if job.finished:
+                return
+            job.cancelled = True
+            if job.job_id is not None:
+                self.__jobs.pop(job.job_id, None)
+                self.__commands.put("cancel %s\n" % job.job_id)
+            # otherwise the job is cancelled when Kraken reports its number
+        job.finish()
+
+    def pending(self):
+        """
+        :return: the number of jobs that are not finished yet.
+        """
+        with self.__lock:
+            return len(self.__unassigned) + len(self.__jobs)
+
+    def close(self):
+        with self.__lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.__commands.put(None)
+        self.__shutdown()
+        # the reader and writer end once the connection is shut down; wait for them, so they do not outlive the
+        # interpreter, unless close() is called from one of them, e.g. by a listener of a job
+        for thread in (self.__reader, self.__writer):
+            if thread is not threading.current_thread():
+                thread.join(_THREAD_JOIN_TIMEOUT)
+        self.__socket.close()
+
+    def __shutdown(self):
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        except socket.error as e:
-            print("Socket error")
-            return None
+            self.__socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
 
+    def __write(self):
+        for command in iter(self.__commands.get, None):
+            try:
+                self.__socket.sendall(command.encode("ascii"))
+            except socket.error as e:
+                # the reader fails the pending jobs once the connection is shut down
+                self.__error = "Sending to Kraken failed: %s" % e
+                self.__shutdown()
+                return
+
+    def __read(self):
+        error = "Connection closed by Kraken"
         try:
-            sock.connect(remote_address)
-        except socket.error as e:
-            sock.close()
-            sock = None
-            print("Connection error")
-            return None
+            for line in iter(self.__file.readline, ""):
+                self.__dispatch(line.strip())
+        except (socket.error, ValueError) as e:
+            error = "Connection to Kraken failed: %s" % e
+
+        with self.__lock:
+            self.closed = True
+            error = self.__error or error
+            jobs = list(self.__unassigned) + list(self.__jobs.values())
+            self.__unassigned.clear()
+            self.__jobs.clear()
+        self.__commands.put(None)
+        for job in jobs:
+            job.finish(error)
+
+    def __dispatch(self, line):
+        match = _KRAKEN_CRACKING.match(line)
+        if match is not None:
+            job_id = int(match.group(1))
+            with self.__lock:
+                if not self.__unassigned:
+                    return
+                job = self.__unassigned.popleft()
+                job.job_id = job_id
+                job.acknowledged = time.time()
+                if job.cancelled:
+                    self.__commands.put("cancel %s\n" % job_id)
+                else:
+                    self.__jobs[job_id] = job
+            return
+
+        match = _KRAKEN_FOUND.match(line)
+        if match is not None:
+            with self.__lock:
+                job = self.__jobs.get(int(match.group(3)))
+            if job is not None:
+                job.add_candidate(KrakenCandidate(match.group(1), int(match.group(2)), int(match.group(4))))
+            return
+
+        match = _KRAKEN_FINISHED.match(line)
+        if match is not None:
+            with self.__lock:
+                job = self.__jobs.pop(int(match.group(1)), None)
+            if job is not None:
+                if match.group(2) is not None:
+                    job.kraken_time = int(match.group(2)) / 1000.0
+                job.finish()
+
+
+class KrakenNode(object):
+    """
+    A Kraken server. Nodes of the same shard hold the same tables and can replace each other, a keystream has to be
+    looked up on one node of every shard.
+    """
+
+    # seconds a node is not used after it failed
+    RETRY_INTERVAL = 30
+
+    def __init__(self, host, port, shard=None, connect_timeout=10):
+        self.host = host
+        self.port = port
+        self.shard = shard
+        self.connect_timeout = connect_timeout
+        self.latency = None  # moving average of the duration of jobs, in seconds
+        self.__failed = None
+        self.__connection = None
+
+    @staticmethod
+    def parse(spec, connect_timeout=10):
+        """
+        :param spec: the node as 'host:port', optionally followed by '/shard'.
+        :raises ValueError: if the spec is invalid.
+        """
+        address, _, shard = spec.strip().partition("/")
+        host, _, port = address.rpartition(":")
+        if not host:
+            raise ValueError("Invalid Kraken node '%s', expected host:port[/shard]" % spec)
+        return KrakenNode(host, int(port), shard or None, connect_timeout)
+
+    def submit(self, burst_set, keystream, listener):
+        """
+        Submit a crack job, connecting to the node if necessary.
+
+        :raises KrakenError: if the node cannot be reached.
+        """
+        if self.__connection is None or self.__connection.closed:
+            try:
+                self.__connection = KrakenConnection(self.host, self.port, self.connect_timeout)
+            except socket.error as e:
+                self.fail()
+                raise KrakenError("Connection to Kraken at %s failed: %s" % (self, e))
+        job = self.__connection.submit(burst_set, keystream, listener)
+        job.node = self
+        return job
+
+    def cancel(self, job):
+        if self.__connection is not None:
+            self.__connection.cancel(job)
+
+    def fail(self):
+        self.__failed = time.time()
+
+    def record_latency(self, duration):
+        self.latency = duration if self.latency is None else 0.7 * self.latency + 0.3 * duration
+
+    @property
+    def available(self):
+        return self.__failed is None or time.time() - self.__failed >= KrakenNode.RETRY_INTERVAL
+
+    @property
+    def pending(self):
+        if self.__connection is None or self.__connection.closed:
+            return 0
+        return self.__connection.pending()
+
+    def cost(self, default_latency):
+        """
+        :return: the expected time until a new job is done, based on the queue depth and the observed latency.
+        """
+        return (self.pending + 1) * (self.latency if self.latency is not None else default_latency)
+
+    def close(self):
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+    def __str__(self):
+        return "%s:%s" % (self.host, self.port)
+
+
+class KrakenBatch(A5ReconstructionBatch):
+    """
+    A set of crack jobs that are in flight at the same time, keeping the queues of all Kraken nodes full.
+    Candidates of all jobs are verified in the order Kraken reports them.
+    """
 
-        burst_xored = KrakenA51ReconstructorAdapter.xor(kraken_burst.burst_data_cipher, kraken_burst.burst_data_plain)
-        sock.send("crack " + burst_xored + "\n")
+    def __init__(self, adapter, verbose=False):
+        """
+        :type adapter: KrakenA51ReconstructorAdapter
+        """
+        super(KrakenBatch, self).__init__()
+        self.adapter = adapter
+        self.verbose = verbose
+        self.__events = queue.Queue()
+        self.__jobs = dict()  # job -> result
+        self.__open = collections.OrderedDict()  # result -> {shard: job}
+        self.__tried = dict()  # result -> {shard: nodes the burst set was submitted to}
+        self.__errors = dict()  # result -> errors of shards that could not look up the keystream
+        self.__completed = []  # results that are done, but not yielded yet
+        self.__verification_times = collections.defaultdict(float)  # job -> time spent verifying its candidates
 
+    def add(self, a5_burst_sets):
+        """
+        Submit burst sets to Kraken without waiting for the results. The keystream of every burst set is sent to the
+        least loaded node of each shard.
+        Burst sets whose keystream was looked up before are answered from the cache. If no node of a shard can be
+        reached, the results of the burst sets fail.
+        """
+        results = [A5ReconstructionResult(burst_set) for burst_set in a5_burst_sets]
+        self.results.extend(results)
+        pending = [result for result in results if not self.adapter.lookup(result)]
+        self.__completed.extend(result for result in results if result.done)
+
+        # Kraken is not queried for the burst sets if a cached key was found
+        if any(result.status == A5ReconstructionStatus.FOUND for result in results):
+            for result in pending:
+                result.status = A5ReconstructionStatus.CANCELLED
+            self.__completed.extend(pending)
+            return
+
+        for result in pending:
+            self.__open[result] = dict()
+            self.__tried[result] = dict()
+            self.__errors[result] = []
+            for shard in self.adapter.shards:
+                self.__submit(result, shard)
+            self.__check_done(result)
+
+    def __iter__(self):
         while True:
-            msg = sock.recv(1024)
-            if not msg:
-                break
-            else:
-                lines = msg.splitlines()
-                for line in lines:
-                    if "crack #" in line:
-                        # not found:
-                        failed = True
-                    elif "Cracking #" in line:
-                        pass
-                    elif "Found " in line:
-                        msg_parts = line.split(" ")
-                        found_key = msg_parts[1]
-                        bitpos = msg_parts[3]
-                        table = msg_parts[7].replace("(table:", "").replace(")", "")
-
-                        if verbose:
-                            print "Candidate %s in table %s" % (found_key, table)
-
-                        fn_count = KrakenA51ReconstructorAdapter.fn2count(kraken_burst.frame_number)
-                        check_fn_count = KrakenA51ReconstructorAdapter.fn2count(kraken_burst.check_frame_number)
-                        check_burst_xored = KrakenA51ReconstructorAdapter.xor(kraken_burst.check_burst_data_cipher,
-                                                                              kraken_burst.check_burst_data_plain)
-
-                        found_key = KrakenA51ReconstructorAdapter.verify_key(found_key, bitpos, fn_count,
-                                                                             check_fn_count,
-                                                                             check_burst_xored, verbose)
-                        if found_key is not None:
-                            cracked = True
-
-                    if cracked or failed:
-                        break
-
-                if cracked or failed:
+            while self.__completed:
+                yield self.__completed.pop(0)
+            if not self.__jobs:
+                return
+
+            deadline = min(job.submitted for job in self.__jobs) + self.adapter.job_timeout
+            try:
+                job, candidate = self.__events.get(True, max(deadline - time.time(), 0))
+            except queue.Empty:
+                now = time.time()
+                for expired in [j for j in self.__jobs if j.submitted + self.adapter.job_timeout <= now]:
+                    self.adapter.cancel(expired)
+                    self.__job_failed(expired, "Timeout while waiting for Kraken job %s on %s" % (expired.job_id,
+                                                                                                 expired.node),
+                                      kraken_metrics.TIMEOUT)
+                continue
+
+            # verify all candidates reported so far at once
+            events = [(job, candidate)]
+            while True:
+                try:
+                    events.append(self.__events.get_nowait())
+                except queue.Empty:
                     break
 
-        if sock is not None:
-            sock.close()
-        if cracked:
-            return found_key
+            candidates = [(job, candidate) for job, candidate in events if candidate is not None and job in self.__jobs]
+            start = time.time()
+            keys = self.adapter.verify_candidates([(job.burst_set, candidate) for job, candidate in candidates],
+                                                  self.verbose)
+            for job, candidate in candidates:
+                # the candidates are verified at once, each one is accounted the same share of the time
+                self.__verification_times[job] += (time.time() - start) / len(candidates)
+            for (job, candidate), key in zip(candidates, keys):
+                if key is not None and job in self.__jobs:
+                    self.__finish(self.__jobs[job], A5ReconstructionStatus.FOUND, key=key, found_by=job)
+
+            for job, candidate in events:
+                if candidate is not None or job not in self.__jobs:
+                    continue  # candidates and events of cancelled jobs
+                if job.error is not None:
+                    job.node.fail()
+                    self.__job_failed(job, job.error)
+                else:
+                    job.node.record_latency(time.time() - job.submitted)
+                    self.__record(job, kraken_metrics.MISS)
+                    result = self.__jobs.pop(job)
+                    del self.__open[result][job.node.shard]
+                    self.__check_done(result)
+
+    def __submit(self, result, shard):
+        tried = self.__tried[result].setdefault(shard, set())
+        try:
+            job = self.adapter.submit(result.burst_set, self.__events, shard, tried)
+        except KrakenError as e:
+            self.__errors[result].append(str(e))
+            return
+        tried.add(job.node)
+        self.__jobs[job] = result
+        self.__open[result][shard] = job
+
+    def __job_failed(self, job, error, outcome=kraken_metrics.ERROR):
+        """
+        Fail over to another node of the shard.
+        """
+        self.__record(job, outcome, error)
+        result = self.__jobs.pop(job)
+        del self.__open[result][job.node.shard]
+        self.__submit(result, job.node.shard)
+        if job.node.shard not in self.__open[result]:
+            self.__errors[result].append(error)
+        elif self.verbose:
+            print "%s, resubmitted to %s" % (error, self.__open[result][job.node.shard].node)
+        self.__check_done(result)
+
+    def __check_done(self, result):
+        """
+        A burst set is done when every shard looked up its keystream or failed.
+        """
+        if result in self.__open and not self.__open[result]:
+            errors = self.__errors[result]
+            if errors:
+                self.__finish(result, A5ReconstructionStatus.FAILED, error="; ".join(errors))
+            else:
+                self.__finish(result, A5ReconstructionStatus.NOT_FOUND)
+
+    def __record(self, job, outcome, error=None):
+        self.adapter.metrics.record(job, outcome, self.__verification_times.pop(job, 0.0), error)
+
+    def __finish(self, result, status, key=None, error=None, found_by=None):
+        """
+        :param found_by: the job whose candidate yielded the key.
+        """
+        for job in self.__open.pop(result).values():
+            del self.__jobs[job]
+            self.adapter.cancel(job)  # Kraken would continue searching the remaining tables
+            self.__record(job, kraken_metrics.HIT if job is found_by else kraken_metrics.CANCELLED)
+        del self.__tried[result]
+        del self.__errors[result]
+        result.status = status
+        result.key = key
+        result.error = error
+        self.adapter.remember(result)
+        self.__completed.append(result)
+
+    def cancel(self, a5_burst_sets=None):
+        burst_sets = None if a5_burst_sets is None else set(id(burst_set) for burst_set in a5_burst_sets)
+        for result in list(self.__open):
+            if burst_sets is None or id(result.burst_set) in burst_sets:
+                self.__finish(result, A5ReconstructionStatus.CANCELLED)
+
+
+class KrakenA51ReconstructorAdapter(A5ReconstructionAdapter):
+    def __init__(self, config_provider):
+        super(KrakenA51ReconstructorAdapter, self).__init__(config_provider)
+        connect_timeout = config_provider.getint("kraken", "connect_timeout", 10)
+        self.__job_timeout = config_provider.getint("kraken", "job_timeout", 600)
+        self.nodes = self.__create_nodes(config_provider, connect_timeout)
+        # verdicts that a keystream is not in the tables are only valid for the tables that were searched
+        self.tables = config_provider.get("kraken", "tables", "").strip() or \
+            ",".join(sorted(set(str(node) if node.shard is None else node.shard for node in self.nodes)))
+        self.cache = KrakenCache(os.path.expanduser(config_provider.get("kraken", "cache",
+                                                                        "~/.gat/kraken_cache.db")))
+        trace = config_provider.get("kraken", "trace", "").strip()
+        self.metrics = KrakenMetrics(self.cache, os.path.expanduser(trace) if trace else None)
+
+    @staticmethod
+    def __create_nodes(config_provider, connect_timeout):
+        """
+        Create the nodes from the 'nodes' option, a comma separated list of host:port[/shard] entries, or from the
+        'host' and 'port' options if there is no such list.
+        """
+        nodes = config_provider.get("kraken", "nodes", "")
+        if not nodes.strip():
+            return [KrakenNode(config_provider.get("kraken", "host"), config_provider.getint("kraken", "port"),
+                               connect_timeout=connect_timeout)]
+        try:
+            return [KrakenNode.parse(spec, connect_timeout) for spec in nodes.split(",") if spec.strip()]
+        except ValueError as e:
+            raise KrakenError("Invalid Kraken nodes: %s" % e)
+
+    @property
+    def shards(self):
+        """
+        :return: the shards of the nodes, in the order of the nodes.
+        """
+        shards = []
+        for node in self.nodes:
+            if node.shard not in shards:
+                shards.append(node.shard)
+        return shards
+
+    def reconstruct_many(self, a5_burst_sets, verbose=False):
+        """
+        Submit all burst sets to Kraken at once. Connections are established on first use and kept open.
+
+        :return: the batch.
+        :rtype: KrakenBatch
+        """
+        batch = KrakenBatch(self, verbose)
+        batch.add(a5_burst_sets)
+        return batch
+
+    def submit(self, kraken_burst, listener, shard=None, exclude=()):
+        """
+        Submit the keystream of a burst set to the node of a shard that is expected to finish it first.
+
+        :param kraken_burst: the burst set.
+        :type kraken_burst: A5BurstSet
+        :param listener: a queue receiving the events of the job, see KrakenJob.
+        :param shard: the shard.
+        :param exclude: nodes not to use, e.g. because they failed for the burst set.
+        :return: the Kraken job.
+        :raises KrakenError: if no node of the shard can be reached.
+        """
+        nodes = [node for node in self.nodes if node.shard == shard and node not in exclude and node.available]
+        latencies = [node.latency for node in nodes if node.latency is not None]
+        default_latency = sum(latencies) / len(latencies) if latencies else 1.0
+        errors = []
+        for node in sorted(nodes, key=lambda n: n.cost(default_latency)):
+            try:
+                return node.submit(kraken_burst, self.keystream(kraken_burst), listener)
+            except KrakenError as e:
+                errors.append(str(e))
+        if not errors:
+            errors.append("No Kraken node%s available" % ("" if shard is None else " of shard %s" % shard))
+        raise KrakenError("; ".join(errors))
+
+    def lookup(self, result):
+        """
+        Answer the reconstruction of a burst set from the cache. A cached key is verified with the burst set.
+
+        :type result: A5ReconstructionResult
+        :return: True if the result was answered from the cache.
+        """
+        cached = self.cache.keystream_result(self.keystream(result.burst_set), self.tables)
+        if cached is None:
+            return False
+        status, kc = cached
+        if status == A5ReconstructionStatus.FOUND and self.check_keys([kc], [result.burst_set]) is None:
+            return False
+        result.status = status
+        result.key = kc
+        return True
+
+    def remember(self, result):
+        """
+        Store the verdict of Kraken for the keystream of a burst set in the cache.
+
+        :type result: A5ReconstructionResult
+        """
+        self.cache.store_keystream_result(self.keystream(result.burst_set), result.status, result.key, self.tables)
+
+    @staticmethod
+    def check_keys(kcs, burst_sets):
+        """
+        Check known keys, e.g. of previous sessions, against burst sets without querying Kraken.
+        A key matches a burst set if it generates the keystream of both its burst and its check burst.
+
+        :param kcs: the keys as hex strings.
+        :param burst_sets: the burst sets.
+        :return: the first matching key, None if no key matches.
+        """
+        if len(kcs) == 0 or len(burst_sets) == 0:
+            return None
+        counts = [fn2count(int(fnr)) for burst_set in burst_sets
+                  for fnr in (burst_set.frame_number, burst_set.check_frame_number)]
+        keystreams = [unpack_bits(xor_bits(cipher, plain)) for burst_set in burst_sets
+                      for cipher, plain in ((burst_set.burst_data_cipher, burst_set.burst_data_plain),
+                                            (burst_set.check_burst_data_cipher, burst_set.check_burst_data_plain))]
+        matches = match_keys(key_to_bits(kcs), counts, keystreams).reshape(len(kcs), len(burst_sets), 2)
+        for kc, key_matches in zip(kcs, matches):
+            if key_matches.all(axis=1).any():
+                return kc
         return None
 
     @staticmethod
-    def verify_key(found_key, bitpos, framecount, check_framecount, check_burst, verbose=False):
-        # todo: error handling if find_kc not found
-        cmd = "find_kc %s %s %s %s %s " % (found_key, bitpos, framecount, check_framecount, check_burst)
-        output = subprocess.check_output([cmd], shell=True, stderr=subprocess.STDOUT)
-        # print(output)
-        key = None
+    def keystream(kraken_burst):
+        """
+        :return: the keystream of the burst of a burst set, as it is sent to Kraken.
+        """
+        return KrakenA51ReconstructorAdapter.xor(kraken_burst.burst_data_cipher, kraken_burst.burst_data_plain)
+
+    def cancel(self, job):
+        job.node.cancel(job)
+
+    @property
+    def job_timeout(self):
+        return self.__job_timeout
+
+    @staticmethod
+    def verify_candidates(candidates, verbose=False):
+        """
+        Recover the keys of candidates reported by Kraken by backclocking and verify them with the check bursts of
+        their burst sets. All candidates are processed in a single vectorized call.
+
+        :param candidates: a list of (burst set, KrakenCandidate) tuples.
+        :return: the key or None for each candidate.
+        """
+        if len(candidates) == 0:
+            return []
+        results = find_keys(
+            [candidate.key for burst_set, candidate in candidates],
+            [candidate.bitpos for burst_set, candidate in candidates],
+            [KrakenA51ReconstructorAdapter.fn2count(burst_set.frame_number) for burst_set, candidate in candidates],
+            [KrakenA51ReconstructorAdapter.fn2count(burst_set.check_frame_number)
+             for burst_set, candidate in candidates],
+            [unpack_bits(xor_bits(burst_set.check_burst_data_cipher, burst_set.check_burst_data_plain))
+             for burst_set, candidate in candidates])
+
         if verbose:
-            mismatch_count = output.count("mismatch")
-            match_count = output.count("*** MATCHED ***")
-            print "Backclocking results in %s possible keys, %s match" % (mismatch_count + match_count, match_count)
-
-        if "*** MATCHED ***" in output:
-            output_lines = output.split('\n')
-            for line in output_lines:
-                if "*** MATCHED ***" in line:
-                    parts = line.split(' ')
-                    key = parts[1] + parts[2] + parts[3] + parts[4] + parts[5] + parts[6] + parts[7] + parts[8]
-            return key
-        return None
+            for (burst_set, candidate), (count, key) in zip(candidates, results):
+                candidate_info = (candidate.key, candidate.table, count, 0 if key is None else 1)
+                print "Candidate %s in table %s: backclocking results in %s possible keys, %s match" % candidate_info
+        return [key for count, key in results]
+
+    def close(self):
+        for node in self.nodes:
+            node.close()
+        self.metrics.close()
+        self.cache.close()
 
     @staticmethod
     def xor(burst_unencrypted, burst_encrypted):
-        r = ""
-        for i in range(114):
-            a = ord(burst_unencrypted[i])
-            b = ord(burst_encrypted[i])
-            r += chr(48 ^ a ^ b)
-        return r
+        """
+        XOR two bursts, given as packed bits or strings.
+
+        :return: the result as string of '0' and '1' characters, as Kraken expects it.
+        """
+        return bits_to_string(xor_bits(burst_unencrypted, burst_encrypted))
 
     @staticmethod
     def fn2count(fn):
-        t1 = int(fn / 1326)
-        t2 = fn % 26
-        t3 = fn % 51
-        return (t1 << 11) | (t3 << 5) | t2
+        return fn2count(int(fn))
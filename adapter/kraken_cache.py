@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import time
+
+from adapter.kraken_metrics import FIELDS
+from core.adapterinterfaces.a5 import A5ReconstructionStatus
+
+# columns of the jobs table, in the order of kraken_metrics.FIELDS
+JOB_COLUMNS = ["submitted REAL NOT NULL", "node TEXT NOT NULL", "shard TEXT", "job_id INTEGER",
+               "outcome TEXT NOT NULL", "latency REAL", "ack_time REAL", "kraken_time REAL", "queue_wait REAL",
+               "candidates INTEGER", "verification_time REAL", "error TEXT"]
+
+
+class KrakenCache(object):
+    """
+    Persistent cache of the results of Kraken attacks, stored in a SQLite database.
+
+    It holds the verdict of Kraken for every keystream that was looked up, i.e. the key found for it or that it was
+    not found in the tables, and the key of every attacked session, identified by the capture and the framenumber
+    of the Cipher Mode Command. Keys are stored with the cell and TMSI of the session, if known, so they can be
+    tried against other sessions of the same cell or subscriber.
+
+    The metrics of all Kraken jobs are stored as well, see KrakenMetrics.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path of the database file, created if it does not exist.
+        """
+        self.path = path
+        self.__db = sqlite3.connect(path)
+        with self.__db:
+            self.__db.execute("CREATE TABLE IF NOT EXISTS keystreams ("
+                              "keystream TEXT PRIMARY KEY, status TEXT NOT NULL, kc TEXT, created REAL NOT NULL, "
+                              "tables TEXT)")
+            columns = [row[1] for row in self.__db.execute("PRAGMA table_info(keystreams)")]
+            if "tables" not in columns:  # created by a previous version
+                self.__db.execute("ALTER TABLE keystreams ADD COLUMN tables TEXT")
+            self.__db.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                              "capture TEXT NOT NULL, fnr_cmc INTEGER NOT NULL, kc TEXT NOT NULL, cell TEXT, "
+                              "tmsi TEXT, created REAL NOT NULL, PRIMARY KEY (capture, fnr_cmc))")
+            self.__db.execute("CREATE TABLE IF NOT EXISTS jobs (%s)" % ", ".join(JOB_COLUMNS))
+
+    def keystream_result(self, keystream, tables=None):
+        """
+        :param keystream: the keystream, as string of '0' and '1' characters.
+        :param tables: identifier of the set of tables that would look up the keystream. A keystream that was not
+        found in another set of tables counts as not looked up yet.
+        :return: a (status, kc) tuple, the status being A5ReconstructionStatus.FOUND or NOT_FOUND, or None if the
+        keystream has not been looked up yet.
+        """
+        row = self.__db.execute("SELECT status, kc, tables FROM keystreams WHERE keystream = ?",
+                                (keystream,)).fetchone()
+        if row is None or (row[0] == A5ReconstructionStatus.NOT_FOUND and row[2] != tables):
+            return None
+        return row[0], row[1]
+
+    def store_keystream_result(self, keystream, status, kc=None, tables=None):
+        """
+        :param tables: identifier of the set of tables that looked up the keystream.
+        """
+        if status not in (A5ReconstructionStatus.FOUND, A5ReconstructionStatus.NOT_FOUND):
+            return  # only final verdicts are cached
+        with self.__db:
+            self.__db.execute("INSERT OR REPLACE INTO keystreams (keystream, status, kc, created, tables) "
+                              "VALUES (?, ?, ?, ?, ?)", (keystream, status, kc, time.time(), tables))
+
+    def keystream_count(self, status):
+        return self.__db.execute("SELECT COUNT(*) FROM keystreams WHERE status = ?", (status,)).fetchone()[0]
+
+    def clear_keystream_results(self):
+        with self.__db:
+            self.__db.execute("DELETE FROM keystreams")
+
+    def session_key(self, capture, fnr_cmc):
+        """
+        :param capture: identifier of the capture, i.e. the path of the burst file.
+        :param fnr_cmc: framenumber of the Cipher Mode Command.
+        :return: the key of the session, None if it is not known.
+        """
+        row = self.__db.execute("SELECT kc FROM sessions WHERE capture = ? AND fnr_cmc = ?",
+                                (capture, fnr_cmc)).fetchone()
+        return row[0] if row is not None else None
+
+    def store_session_key(self, capture, fnr_cmc, kc, cell=None, tmsi=None):
+        with self.__db:
+            self.__db.execute("INSERT OR REPLACE INTO sessions (capture, fnr_cmc, kc, cell, tmsi, created) "
+                              "VALUES (?, ?, ?, ?, ?, ?)", (capture, fnr_cmc, kc, cell, tmsi, time.time()))
+
+    def related_keys(self, cell=None, tmsi=None):
+        """
+        Get the keys of previous sessions of the same cell or the same TMSI, the most recent one first.
+        A network may not renew the key for every session.
+
+        :return: a list of keys.
+        """
+        if cell is None and tmsi is None:
+            return []
+        rows = self.__db.execute("SELECT kc FROM sessions WHERE cell = ? OR tmsi = ? "
+                                 "GROUP BY kc ORDER BY MAX(created) DESC", (cell, tmsi)).fetchall()
+        return [row[0] for row in rows]
+
+    def store_job_records(self, records):
+        """
+        :param records: metrics records of Kraken jobs, see kraken_metrics.job_record().
+        """
+        with self.__db:
+            self.__db.executemany("INSERT INTO jobs (%s) VALUES (%s)" % (", ".join(FIELDS),
+                                                                         ", ".join("?" * len(FIELDS))),
+                                  [tuple(record[field] for field in FIELDS) for record in records])
+
+    def job_records(self, since=None):
+        """
+        :param since: only return jobs submitted after this time, as seconds since the epoch.
+        :return: the metrics records of Kraken jobs, in order of submission.
+        """
+        rows = self.__db.execute("SELECT %s FROM jobs WHERE submitted >= ? ORDER BY submitted" % ", ".join(FIELDS),
+                                 (since if since is not None else 0,)).fetchall()
+        return [dict(zip(FIELDS, row)) for row in rows]
+
+    def clear_job_records(self):
+        with self.__db:
+            self.__db.execute("DELETE FROM jobs")
+
+    def close(self):
+        self.__db.close()
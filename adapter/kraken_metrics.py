@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import collections
+import json
+import time
+
+import numpy
+
+# outcomes of a Kraken job
+HIT = "hit"  # a candidate of the job was verified
+MISS = "miss"  # Kraken searched all tables without a verified candidate
+ERROR = "error"  # the node failed or the connection broke
+TIMEOUT = "timeout"
+CANCELLED = "cancelled"  # e.g. another shard found the key first
+
+OUTCOMES = [HIT, MISS, ERROR, TIMEOUT, CANCELLED]
+
+# fields of a job record, durations are in seconds
+FIELDS = ["submitted", "node", "shard", "job_id", "outcome", "latency", "ack_time", "kraken_time", "queue_wait",
+          "candidates", "verification_time", "error"]
+
+
+def job_record(job, outcome, verification_time=0.0, error=None):
+    """
+    Create the metrics record of a Kraken job that is done.
+
+    :type job: KrakenJob
+    :param outcome: the outcome, one of OUTCOMES.
+    :param verification_time: time spent verifying the candidates of the job.
+    :param error: the error of a failed job.
+    :return: a dictionary with the FIELDS:
+    latency is the time from submission to the end of the job, ack_time the time until Kraken assigned a job number,
+    kraken_time the search time reported by Kraken and queue_wait the remaining latency, i.e. the time the job waited
+    in Kraken's queue and on the network.
+    """
+    end = job.finished_at if job.finished_at is not None else time.time()
+    latency = end - job.submitted
+    return {
+        "submitted": job.submitted,
+        "node": str(job.node),
+        "shard": job.node.shard,
+        "job_id": job.job_id,
+        "outcome": outcome,
+        "latency": latency,
+        "ack_time": job.acknowledged - job.submitted if job.acknowledged is not None else None,
+        "kraken_time": job.kraken_time,
+        "queue_wait": max(latency - job.kraken_time, 0.0) if job.kraken_time is not None else None,
+        "candidates": len(job.candidates),
+        "verification_time": verification_time,
+        "error": error,
+    }
+
+
+class KrakenMetrics(object):
+    """
+    Collects the metrics of the Kraken jobs of an adapter.
+
+    Records are kept in memory, appended to an optional JSON-lines trace file as they are created and stored in the
+    Kraken cache when the metrics are flushed, so that 'kraken stats' can report on all past jobs.
+    """
+
+    def __init__(self, cache=None, trace_path=None):
+        """
+        :type cache: KrakenCache
+        :param trace_path: path of the trace file, None for no trace.
+        """
+        self.cache = cache
+        self.records = []
+        self.__unsaved = []
+        self.__trace = open(trace_path, "a") if trace_path else None
+
+    def record(self, job, outcome, verification_time=0.0, error=None):
+        """
+        Record a Kraken job that is done, see job_record().
+        """
+        record = job_record(job, outcome, verification_time, error)
+        self.records.append(record)
+        self.__unsaved.append(record)
+        if self.__trace is not None:
+            self.__trace.write(json.dumps(record, sort_keys=True) + "\n")
+        return record
+
+    def flush(self):
+        if self.__trace is not None:
+            self.__trace.flush()
+        if self.cache is not None and self.__unsaved:
+            self.cache.store_job_records(self.__unsaved)
+        self.__unsaved = []
+
+    def close(self):
+        self.flush()
+        if self.__trace is not None:
+            self.__trace.close()
+            self.__trace = None
+
+
+def read_trace(path):
+    """
+    :param path: path of a JSON-lines trace file.
+    :return: the job records.
+    """
+    with open(path) as trace:
+        return [json.loads(line) for line in trace if line.strip()]
+
+
+class KrakenStats(object):
+    """
+    Summary of job records, overall and per node.
+    """
+
+    def __init__(self, records):
+        self.records = records
+
+    def nodes(self):
+        """
+        :return: the nodes of the records, sorted.
+        """
+        return sorted(set(record["node"] for record in self.records))
+
+    def summary(self, node=None):
+        """
+        :param node: summarize the jobs of this node, None for all jobs.
+        :return: a dictionary with the number of jobs, the outcomes (a Counter), the median and 90th percentile of
+        the durations, the mean number of candidates and the total verification time.
+        """
+        records = [record for record in self.records if node is None or record["node"] == node]
+        summary = {
+            "jobs": len(records),
+            "outcomes": collections.Counter(record["outcome"] for record in records),
+            "candidates": float(numpy.mean([record["candidates"] for record in records])) if records else 0.0,
+            "verification_time": sum(record["verification_time"] for record in records),
+        }
+        for field in ["latency", "ack_time", "kraken_time", "queue_wait"]:
+            values = [record[field] for record in records if record[field] is not None]
+            summary[field] = (float(numpy.percentile(values, 50)), float(numpy.percentile(values, 90))) \
+                if values else None
+        return summary
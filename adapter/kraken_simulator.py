@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+import collections
+import random
+import socket
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy
+
+from adapter import a51
+from core.adapterinterfaces.a5 import A5BurstSet
+from core.common.bits import bits_to_string, pack_bits
+from core.common.fnr_window import MAX_FNR
+
+
+class KrakenSimulator(object):
+    """
+    A local stand-in for a Kraken server, speaking Kraken's line protocol:
+    'crack <bits>' is answered with 'Cracking #n', followed by 'Found <state> @ <pos>  #n  (table:N)' for a hit and
+    'crack #n took <t> msec' when the job is done; 'cancel <n>' stops a job.
+
+    Instead of rainbow tables the simulator holds a table of known keystreams and the states to report for them.
+    Unknown keystreams are either never found or, with random_hits, found with a random state, which does not
+    belong to the keystream and is rejected by a client that verifies the keys.
+    """
+
+    def __init__(self, host="localhost", port=0, latency=0.5, hit_rate=1.0, concurrency=4, seed=None,
+                 random_hits=False):
+        """
+        :param host: the address to listen on.
+        :param port: the port to listen on, 0 for a free port.
+        :param latency: mean duration of a job in seconds. Durations are uniformly distributed between half and
+        one and a half times the mean.
+        :param hit_rate: probability that a known keystream is found, modelling the coverage of the tables.
+        :param concurrency: number of jobs processed at the same time, further jobs are queued.
+        :param seed: seed for the random durations and hits.
+        :param random_hits: whether unknown keystreams are found as well, with the same probability.
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.hit_rate = hit_rate
+        self.concurrency = concurrency
+        self.random_hits = random_hits
+        self.jobs = 0  # number of jobs received
+        self.__random = random.Random(seed)
+        self.__table = dict()  # keystream -> (state, bitpos)
+        self.__lock = threading.Lock()
+        self.__queue = queue.Queue()
+        self.__cancelled = set()
+        self.__socket = None
+        self.__running = False
+
+    def add_entry(self, keystream, state, bitpos):
+        """
+        Make a keystream known to the simulator.
+
+        :param keystream: the keystream, as string of '0' and '1' characters.
+        :param state: the state reported for the keystream, as hex string.
+        :param bitpos: the keystream bit position reported for the state.
+        """
+        self.__table[keystream] = (state, bitpos)
+
+    def start(self):
+        """
+        Start listening. The simulator runs in daemon threads until it is stopped.
+        """
+        self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__socket.bind((self.host, self.port))
+        self.__socket.listen(5)
+        self.port = self.__socket.getsockname()[1]
+        self.__running = True
+
+        self.__start_thread(self.__accept)
+        for _ in range(self.concurrency):
+            self.__start_thread(self.__work)
+
+    def stop(self):
+        self.__running = False
+        for _ in range(self.concurrency):
+            self.__queue.put(None)
+        if self.__socket is not None:
+            self.__socket.close()
+            self.__socket = None
+
+    def __start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args, name="kraken-simulator")
+        thread.daemon = True
+        thread.start()
+
+    def __accept(self):
+        while self.__running:
+            try:
+                connection, address = self.__socket.accept()
+            except (socket.error, AttributeError):
+                return  # stopped
+            self.__start_thread(self.__serve, connection)
+
+    def __serve(self, connection):
+        write_lock = threading.Lock()
+
+        def reply(line):
+            with write_lock:
+                try:
+                    connection.sendall((line + "\n").encode("ascii"))
+                except socket.error:
+                    pass
+
+        lines = connection.makefile("r")
+        try:
+            for line in iter(lines.readline, ""):
+                command = line.split()
+                if len(command) == 2 and command[0] == "crack":
+                    with self.__lock:
+                        job_id = self.jobs
+                        self.jobs += 1
+                    reply("Cracking #%s" % job_id)
+                    self.__queue.put((job_id, command[1], reply))
+                elif len(command) == 2 and command[0] == "cancel" and command[1].isdigit():
+                    with self.__lock:
+                        self.__cancelled.add(int(command[1]))
+        except (socket.error, ValueError):
+            pass
+        finally:
+            connection.close()
+
+    def __work(self):
+        while True:
+            job = self.__queue.get()
+            if job is None:
+                return
+            job_id, keystream, reply = job
+            with self.__lock:
+                duration = self.latency * self.__random.uniform(0.5, 1.5)
+                hit = (keystream in self.__table or self.random_hits) and self.__random.random() < self.hit_rate
+                table = self.__random.randint(100, 499)
+                entry = self.__table.get(keystream) or ("%016x" % self.__random.getrandbits(a51.STATE_SIZE),
+                                                        self.__random.randint(0, a51.KEYSTREAM_SIZE - a51.STATE_SIZE))
+            if self.__is_cancelled(job_id):
+                continue
+
+            time.sleep(duration)
+            if self.__is_cancelled(job_id):
+                continue
+            if hit:
+                state, bitpos = entry
+                reply("Found %s @ %s  #%s  (table:%s)" % (state, bitpos, job_id, table))
+            reply("crack #%s took %d msec" % (job_id, duration * 1000))
+
+    def __is_cancelled(self, job_id):
+        with self.__lock:
+            if job_id in self.__cancelled:
+                self.__cancelled.discard(job_id)
+                return True
+            return False
+
+
+def simulated_burst_sets(count, simulators, seed=None):
+    """
+    Create burst sets encrypted with random keys and make their keystreams known to the simulators.
+
+    :param count: number of burst sets.
+    :param simulators: the simulators.
+    :param seed: seed for the keys, framenumbers and plaintexts.
+    :return: the burst sets.
+    """
+    rng = numpy.random.RandomState(seed)
+    keys = rng.randint(0, 2, (count, a51.KEY_SIZE)).astype(numpy.uint8)
+    framenumbers = rng.randint(0, MAX_FNR, count).astype(numpy.int64)
+    check_framenumbers = (framenumbers + 1) % MAX_FNR
+    bitpositions = rng.randint(0, a51.KEYSTREAM_SIZE - a51.STATE_SIZE + 1, count)
+    plaintexts = rng.randint(0, 2, (count, a51.KEYSTREAM_SIZE)).astype(numpy.uint8)
+    check_plaintexts = rng.randint(0, 2, (count, a51.KEYSTREAM_SIZE)).astype(numpy.uint8)
+
+    counts = a51.fn2count(framenumbers)
+    keystreams = a51.keystream(keys, counts)
+    check_keystreams = a51.keystream(keys, a51.fn2count(check_framenumbers))
+    states = a51.kraken_value(a51.internal_states(keys, counts, bitpositions))
+
+    burst_sets = []
+    for i in range(count):
+        burst_sets.append(A5BurstSet(int(framenumbers[i]), pack_bits(plaintexts[i] ^ keystreams[i]),
+                                     pack_bits(plaintexts[i]), int(check_framenumbers[i]),
+                                     pack_bits(check_plaintexts[i] ^ check_keystreams[i]),
+                                     pack_bits(check_plaintexts[i])))
+        keystream = bits_to_string(pack_bits(keystreams[i]))
+        for simulator in simulators:
+            simulator.add_entry(keystream, states[i], int(bitpositions[i]))
+    return burst_sets
+
+
+class KrakenBenchmark(object):
+    """
+    Measures the throughput and latency of an A5 reconstruction adapter, keeping a fixed number of burst sets in
+    flight.
+    """
+
+    def __init__(self, adapter, burst_sets, in_flight=32):
+        """
+        :type adapter: A5ReconstructionAdapter
+        :param burst_sets: the burst sets to reconstruct.
+        :param in_flight: number of burst sets submitted at the same time.
+        """
+        self.adapter = adapter
+        self.burst_sets = burst_sets
+        self.in_flight = in_flight
+        self.latencies = []
+        self.statuses = collections.Counter()
+        self.errors = []
+        self.duration = 0.0
+
+    def run(self):
+        remaining = list(reversed(self.burst_sets))
+        submitted = dict()  # id of the burst set -> time of submission
+        batch = self.adapter.reconstruct_many([])
+
+        def submit():
+            burst_set = remaining.pop()
+            submitted[id(burst_set)] = time.time()
+            batch.add([burst_set])
+
+        start = time.time()
+        for _ in range(min(self.in_flight, len(remaining))):
+            submit()
+        for result in batch:
+            self.latencies.append(time.time() - submitted.pop(id(result.burst_set)))
+            self.statuses[result.status] += 1
+            if result.error is not None:
+                self.errors.append(result.error)
+            if remaining:
+                submit()
+        self.duration = time.time() - start
+        return self
+
+    @property
+    def jobs_per_second(self):
+        return len(self.latencies) / self.duration if self.duration > 0 else 0.0
+
+    def percentile(self, percent):
+        """
+        :return: the latency percentile in seconds.
+        """
+        if not self.latencies:
+            return 0.0
+        return float(numpy.percentile(self.latencies, percent))
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Channel coding of the xCCH control channels (SACCH, SDCCH, BCCH, ...) as defined in 3GPP TS 45.003, 4.1.
+
+A 23 byte L2 block is protected by a fire code, convolutionally encoded and interleaved over the payloads of
+4 normal bursts. All steps are linear over GF(2) and are applied to many blocks at once.
+"""
+import numpy
+
+from core.common.bits import PAYLOAD_SIZE
+
+BLOCK_SIZE = 23  # bytes of an L2 block
+DATA_BITS = BLOCK_SIZE * 8
+PARITY_BITS = 40
+TAIL_BITS = 4
+CODED_BITS = 2 * (DATA_BITS + PARITY_BITS + TAIL_BITS)
+BURSTS = 4
+
+# fire code g(D) = (D^23 + 1)(D^17 + D^3 + 1), the remainder is inverted
+FIRE_POLYNOMIAL = 0x0004820009
+
+
+def _create_parity_matrix():
+    """
+    :return: a (184, 40) matrix, the parity bits of every single data bit. The parity of a block is the sum of
+    the rows of its set bits, inverted.
+    """
+    matrix = numpy.zeros((DATA_BITS, PARITY_BITS), dtype=numpy.uint8)
+    mask = (1 << PARITY_BITS) - 1
+    # shifting a set bit into the empty register yields the polynomial, every following bit shifts the register
+    crc = FIRE_POLYNOMIAL
+    for bit in reversed(range(DATA_BITS)):
+        matrix[bit] = [(crc >> (PARITY_BITS - 1 - i)) & 1 for i in range(PARITY_BITS)]
+        crc = ((crc << 1) ^ FIRE_POLYNOMIAL if crc >> (PARITY_BITS - 1) else crc << 1) & mask
+    return matrix
+
+
+def _create_interleaving():
+    """
+    :return: the burst and the position within the burst of every coded bit, see TS 45.003, 4.1.4.
+    """
+    k = numpy.arange(CODED_BITS)
+    return k % BURSTS, 2 * ((49 * k) % 57) + (k % 8) // 4
+
+
+PARITY_MATRIX = _create_parity_matrix()
+INTERLEAVING = _create_interleaving()
+
+
+def block_to_bits(blocks):
+    """
+    :param blocks: a (n, 23) array of L2 blocks.
+    :return: a (n, 184) array of the data bits, the bits of each byte LSB first.
+    """
+    blocks = numpy.asarray(blocks, dtype=numpy.uint8).reshape(-1, BLOCK_SIZE)
+    return numpy.unpackbits(blocks[:, :, None], axis=2)[:, :, ::-1].reshape(len(blocks), DATA_BITS)
+
+
+def fire_encode(data):
+    """
+    :param data: a (n, 184) array of data bits.
+    :return: a (n, 228) array of the data bits, followed by the parity bits and the tail bits.
+    """
+    parity = (data.astype(numpy.int64).dot(PARITY_MATRIX) & 1).astype(numpy.uint8) ^ 1
+    tail = numpy.zeros((len(data), TAIL_BITS), dtype=numpy.uint8)
+    return numpy.concatenate((data, parity, tail), axis=1)
+
+
+def convolutional_encode(bits):
+    """
+    Rate 1/2 convolutional code with G0 = 1 + D^3 + D^4 and G1 = 1 + D + D^3 + D^4.
+
+    :param bits: a (n, 228) array of bits.
+    :return: a (n, 456) array of coded bits.
+    """
+    u = numpy.concatenate((numpy.zeros((len(bits), 4), dtype=numpy.uint8), bits), axis=1)
+    length = bits.shape[1]
+
+    def delayed(d):
+        return u[:, 4 - d:4 - d + length]
+
+    coded = numpy.empty((len(bits), 2 * length), dtype=numpy.uint8)
+    coded[:, 0::2] = delayed(0) ^ delayed(3) ^ delayed(4)
+    coded[:, 1::2] = delayed(0) ^ delayed(1) ^ delayed(3) ^ delayed(4)
+    return coded
+
+
+def interleave(coded):
+    """
+    :param coded: a (n, 456) array of coded bits.
+    :return: a (n, 4, 114) array, the payload bits of the 4 bursts.
+    """
+    bursts = numpy.empty((len(coded), BURSTS, PAYLOAD_SIZE), dtype=numpy.uint8)
+    bursts[:, INTERLEAVING[0], INTERLEAVING[1]] = coded
+    return bursts
+
+
+def encode(blocks):
+    """
+    Encode L2 blocks into the payloads of their bursts.
+
+    :param blocks: a (n, 23) array of L2 blocks.
+    :return: a (n, 4, 114) array with one payload bit per element.
+    """
+    return interleave(convolutional_encode(fire_encode(block_to_bits(blocks))))
+
+
+class XcchEncoder(object):
+    """
+    Encodes L2 blocks into bursts, remembering the bursts of the blocks encoded before.
+    An attack uses the same few System Information messages over and over, with the timing advance of the attacked
+    session.
+    """
+
+    def __init__(self, max_entries=256):
+        """
+        :param max_entries: maximum number of remembered blocks. If it is exceeded, all are forgotten.
+        """
+        self.max_entries = max_entries
+        self.__bursts = dict()  # (block, timing advance) -> packed payloads of the bursts
+
+    def encode(self, message, timing_advance=None):
+        """
+        :param message: the L2 block, a list of 23 byte values. For SACCH blocks, the L1 header is included.
+        :param timing_advance: timing advance to put into the L1 header of a SACCH block, None to keep the one of
+        the message.
+        :return: the payloads of the 4 bursts, as packed bits.
+        """
+        if len(message) != BLOCK_SIZE:
+            raise ValueError("An L2 block has %s bytes, not %s" % (BLOCK_SIZE, len(message)))
+        key = (tuple(message), timing_advance)
+        if key not in self.__bursts:
+            block = numpy.array(message, dtype=numpy.uint8)
+            if timing_advance is not None:
+                block[1] = timing_advance
+            if len(self.__bursts) >= self.max_entries:
+                self.__bursts.clear()
+            self.__bursts[key] = list(numpy.packbits(encode(block)[0], axis=1))
+        return self.__bursts[key]
@@ -1,38 +1,233 @@
 # -*- coding: utf-8 -*-
+import heapq
 from abc import abstractmethod
 
+from core.common.bits import pack_bits, as_packed
+
 
 class A5ReconstructionAdapter(object):
-    lapdm_ui = [
+    # bursts of a LAPDm UI frame, as packed bits
+    lapdm_ui = [pack_bits(bits) for bits in [
         "100000010001110101010000000010100000000111111101010000001010000100010111010100000000101000010000010101010100000010",
         "101010111111111101000000101010101111111111110100000000100010111111111111010101000000001010101011011101010000001000",
         "000000011111010101010000100000010001010111010101000010100001010001111101010001000010000000000101110101010100000010",
         "000100001010101010111101110101010000000010101110111111010100010000001010101011011101010001000010001011101111010101"
-    ]
+    ]]
     xor_match_unencrypted = "0" * 114
 
     @abstractmethod
     def __init__(self, config_provider):
         pass
 
+    def reconstruct(self, a5_burst_set, verbose=False):
+        """
+        Reconstruct the key of a single burst set.
+
+        :param a5_burst_set: the burst set.
+        :return: the key, None if it could not be reconstructed.
+        """
+        return self.reconstruct_many([a5_burst_set], verbose).wait_for_key()
+
     @abstractmethod
-    def reconstruct(self, a5_burst_set):
+    def reconstruct_many(self, a5_burst_sets, verbose=False):
+        """
+        Start the reconstruction of the key for many burst sets at once, without waiting for the results.
+
+        :param a5_burst_sets: an iterable of burst sets.
+        :param verbose: print information about the progress.
+        :return: the batch, which provides the results as they become available.
+        :rtype: A5ReconstructionBatch
+        """
+        pass
+
+
+class A5ReconstructionStatus(object):
+    PENDING = "pending"
+    FOUND = "found"
+    NOT_FOUND = "not found"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+
+class A5ReconstructionResult(object):
+    """
+    Status and result of the reconstruction of a single burst set.
+    """
+
+    def __init__(self, burst_set):
+        self.burst_set = burst_set
+        self.status = A5ReconstructionStatus.PENDING
+        self.key = None
+        self.error = None
+
+    @property
+    def done(self):
+        return self.status != A5ReconstructionStatus.PENDING
+
+
+class A5ReconstructionBatch(object):
+    """
+    Reconstruction of many burst sets, which are processed at the same time by the backend.
+    Iterating over a batch yields the result of each burst set as soon as it is done, in order of completion.
+    """
+
+    def __init__(self):
+        self.results = []  # results of all burst sets, in order of submission
+
+    @abstractmethod
+    def add(self, a5_burst_sets):
+        """
+        Add further burst sets to the batch.
+        """
+        pass
+
+    @abstractmethod
+    def __iter__(self):
+        pass
+
+    @abstractmethod
+    def cancel(self, a5_burst_sets=None):
+        """
+        Cancel the reconstruction of burst sets that are not done yet.
+
+        :param a5_burst_sets: the burst sets to cancel, None to cancel all burst sets of the batch.
+        """
         pass
 
+    def wait_for_key(self):
+        """
+        Wait until a key is found or all burst sets are done. The first key wins, all other burst sets are cancelled.
+
+        :return: the key, None if no key was found.
+        """
+        for result in self:
+            if result.status == A5ReconstructionStatus.FOUND:
+                self.cancel()
+                return result.key
+        return None
+
+    @property
+    def errors(self):
+        return [result.error for result in self.results if result.status == A5ReconstructionStatus.FAILED]
+
+
+class A5ReconstructionQueue(object):
+    """
+    Reconstruction of the keys of many sessions, sharing one batch of the adapter.
+
+    Burst sets are queued with a priority and submitted in order of priority, keeping a limited number in flight so
+    that promising burst sets of all sessions are looked up before less promising ones. As soon as a key of a session
+    is found, the remaining burst sets of the session are cancelled or dropped from the queue.
+    """
+
+    def __init__(self, adapter, in_flight=64, verbose=False):
+        """
+        :type adapter: A5ReconstructionAdapter
+        :param in_flight: maximum number of burst sets submitted at the same time.
+        :param verbose: print information about the progress.
+        """
+        self.in_flight = in_flight
+        self.batch = adapter.reconstruct_many([], verbose)
+        self.__queue = []  # heap of (priority, sequence number, session, burst set)
+        self.__sequence = 0
+        self.__sessions = dict()  # id of a submitted burst set -> session
+        self.__remaining = dict()  # session -> number of burst sets that are queued or in flight
+        self.__in_flight = dict()  # session -> burst sets in flight
+        self.__solved = set()
+
+    def add(self, session, a5_burst_sets, priority=0):
+        """
+        Queue the burst sets of a session.
+
+        :param session: identifier of the session, e.g. the framenumber of the Cipher Mode Command.
+        :param a5_burst_sets: the burst sets.
+        :param priority: burst sets with a lower priority value are submitted first, burst sets of the same priority in
+        the order they were added.
+        """
+        if session in self.__solved:
+            return
+        self.__remaining.setdefault(session, 0)
+        self.__in_flight.setdefault(session, [])
+        for burst_set in a5_burst_sets:
+            heapq.heappush(self.__queue, (priority, self.__sequence, session, burst_set))
+            self.__sequence += 1
+            self.__remaining[session] += 1
+
+    def __iter__(self):
+        """
+        Process all queued burst sets.
+
+        :return: a generator yielding a (session, key) tuple as soon as the key of a session is found, and
+        (session, None) when all burst sets of a session are done without finding its key.
+        Sessions without burst sets are reported right away.
+        """
+        for session in [s for s in self.__remaining if self.__remaining[s] == 0]:
+            del self.__remaining[session]
+            yield session, None
+        self.__fill()
+
+        for result in self.batch:
+            session = self.__sessions.pop(id(result.burst_set))
+            if session in self.__solved:
+                self.__fill()
+                continue
+            self.__in_flight[session].remove(result.burst_set)
+            self.__remaining[session] -= 1
+
+            if result.status == A5ReconstructionStatus.FOUND:
+                self.__solved.add(session)
+                del self.__remaining[session]
+                self.batch.cancel(self.__in_flight.pop(session))
+                yield session, result.key
+            elif self.__remaining[session] == 0:
+                del self.__remaining[session]
+                del self.__in_flight[session]
+                yield session, None
+            self.__fill()
+
+            for session in [s for s in self.__remaining if self.__remaining[s] == 0]:
+                # sessions added while iterating without burst sets
+                del self.__remaining[session]
+                yield session, None
+
+    def __fill(self):
+        while self.__queue and len(self.__sessions) < self.in_flight:
+            priority, sequence, session, burst_set = heapq.heappop(self.__queue)
+            if session in self.__solved:
+                continue
+            self.__sessions[id(burst_set)] = session
+            self.__in_flight[session].append(burst_set)
+            self.batch.add([burst_set])
+
+    def cancel(self):
+        """
+        Drop all queued burst sets and cancel the ones in flight.
+        """
+        self.__queue = []
+        self.batch.cancel()
+
+    @property
+    def errors(self):
+        return self.batch.errors
+
 
 class A5BurstSet(object):
     def __init__(self, frame_number, burst_data_cipher, burst_data_plain, check_frame_number, check_burst_data_cipher,
                  check_burst_data_plain):
         """
+        Burst payloads can be provided as strings of '0' and '1' characters or as packed bits,
+        they are stored as packed bits.
 
-        :param burst: resulting burst of xor'ing plaintext and ciphertext burst
-        :param frame_number:
-        :param check_burst: resulting burst of xor'ing plaintext and ciphertext burst
-        :param check_frame_number:
+        :param frame_number: framenumber of the burst
+        :param burst_data_cipher: payload of the ciphered burst
+        :param burst_data_plain: guessed plaintext payload of the burst
+        :param check_frame_number: framenumber of the burst used for verifying a key
+        :param check_burst_data_cipher: payload of the ciphered verification burst
+        :param check_burst_data_plain: guessed plaintext payload of the verification burst
         """
         self.frame_number = frame_number
-        self.burst_data_cipher = burst_data_cipher
-        self.burst_data_plain = burst_data_plain
+        self.burst_data_cipher = as_packed(burst_data_cipher)
+        self.burst_data_plain = as_packed(burst_data_plain)
         self.check_frame_number = check_frame_number
-        self.check_burst_data_cipher = check_burst_data_cipher
-        self.check_burst_data_plain = check_burst_data_plain
+        self.check_burst_data_cipher = as_packed(check_burst_data_cipher)
+        self.check_burst_data_plain = as_packed(check_burst_data_plain)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import numpy
+
+PAYLOAD_SIZE = 114
+
+
+def pack_bits(bits):
+    """
+    Pack bits into a NumPy uint8 array, 8 bits per byte, MSB first.
+
+    :param bits: a string of '0' and '1' characters or an array with one bit per element.
+    :return: the packed bits.
+    """
+    if isinstance(bits, str):
+        bits = numpy.frombuffer(bits.encode("ascii"), dtype=numpy.uint8) - ord("0")
+    return numpy.packbits(numpy.asarray(bits, dtype=numpy.uint8), axis=-1)
+
+
+def as_packed(bits):
+    """
+    Convert bits to their packed representation, if they are not packed yet.
+
+    :param bits: a string of '0' and '1' characters or already packed bits.
+    :return: the packed bits.
+    """
+    if isinstance(bits, str):
+        return pack_bits(bits)
+    return numpy.asarray(bits, dtype=numpy.uint8)
+
+
+def unpack_bits(packed, count=PAYLOAD_SIZE):
+    """
+    :param packed: packed bits.
+    :param count: number of bits to unpack.
+    :return: an array with one bit per element.
+    """
+    return numpy.unpackbits(numpy.asarray(packed, dtype=numpy.uint8), axis=-1)[..., :count]
+
+
+def bits_to_string(packed, count=PAYLOAD_SIZE):
+    """
+    :param packed: packed bits.
+    :param count: number of bits.
+    :return: the bits as string of '0' and '1' characters.
+    """
+    return str((unpack_bits(packed, count) + ord("0")).astype(numpy.uint8).tobytes().decode("ascii"))
+
+
+def xor_bits(a, b):
+    """
+    XOR two sets of bits, given as string or packed.
+
+    :return: the packed result.
+    """
+    return numpy.bitwise_xor(as_packed(a), as_packed(b))
+
+
+class PackedBursts(object):
+    """
+    Payloads of bursts, stored as packed bits and accessible by framenumber.
+    """
+
+    def __init__(self, framenumbers, payloads, snr_db=None):
+        """
+        :param framenumbers: framenumbers of the bursts.
+        :param payloads: a (n, 114) array with one payload bit per element.
+        :param snr_db: the SNR of each burst, if known.
+        """
+        self.framenumbers = numpy.asarray(framenumbers, dtype=numpy.int64)
+        payloads = numpy.asarray(payloads, dtype=numpy.uint8).reshape(len(self.framenumbers), PAYLOAD_SIZE)
+        self.data = numpy.packbits(payloads, axis=1)
+        self.snr_db = numpy.full(len(self.framenumbers), numpy.nan)
+        if snr_db is not None:
+            self.snr_db[:] = snr_db
+        # if a framenumber occurs more than once, the last burst wins
+        self.__rows = dict((int(fnr), row) for row, fnr in enumerate(self.framenumbers))
+
+    @staticmethod
+    def allocate(framenumbers):
+        """
+        Preallocate the storage for the payloads of bursts with the given framenumbers, see store().
+
+        :param framenumbers: framenumbers of the bursts to store.
+        """
+        bursts = PackedBursts([], numpy.zeros((0, PAYLOAD_SIZE), dtype=numpy.uint8))
+        bursts.framenumbers = numpy.unique(numpy.asarray(framenumbers, dtype=numpy.int64))
+        bursts.data = numpy.zeros((len(bursts.framenumbers), (PAYLOAD_SIZE + 7) // 8), dtype=numpy.uint8)
+        bursts.snr_db = numpy.full(len(bursts.framenumbers), numpy.nan)
+        return bursts
+
+    def __allocated_rows(self, framenumbers):
+        """
+        :return: the preallocated rows of the framenumbers and a boolean mask of the framenumbers that have one.
+        """
+        framenumbers = numpy.asarray(framenumbers, dtype=numpy.int64)
+        if len(self.framenumbers) == 0:
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(len(framenumbers), dtype=bool)
+        rows = numpy.minimum(numpy.searchsorted(self.framenumbers, framenumbers), len(self.framenumbers) - 1)
+        allocated = self.framenumbers[rows] == framenumbers
+        return rows[allocated], allocated
+
+    def allocated(self, framenumbers):
+        """
+        :return: a boolean mask of the framenumbers for which storage was preallocated.
+        """
+        return self.__allocated_rows(framenumbers)[1]
+
+    def store(self, framenumbers, payloads, snr_db=None):
+        """
+        Store payloads of bursts into the preallocated storage. Bursts with other framenumbers are ignored.
+
+        :param framenumbers: framenumbers of the bursts.
+        :param payloads: a (n, 114) array with one payload bit per element.
+        :param snr_db: the SNR of each burst, if known.
+        :return: the number of stored bursts.
+        """
+        rows, allocated = self.__allocated_rows(framenumbers)
+        if len(rows) > 0:
+            self.data[rows] = numpy.packbits(numpy.asarray(payloads, dtype=numpy.uint8)[allocated], axis=1)
+            self.snr_db[rows] = numpy.asarray(snr_db, dtype=float)[allocated] if snr_db is not None else numpy.nan
+        for row in rows.tolist():
+            self.__rows[int(self.framenumbers[row])] = row
+        return len(rows)
+
+    @staticmethod
+    def from_strings(framenumbers, bursts):
+        """
+        Create packed payloads from bursts given as strings of 148 '0' and '1' characters, as gr-gsm's burst sink
+        provides them.
+        """
+        if len(bursts) == 0:
+            return PackedBursts([], numpy.zeros((0, PAYLOAD_SIZE), dtype=numpy.uint8))
+        bits = numpy.frombuffer("".join(bursts).encode("ascii"), dtype=numpy.uint8).reshape(len(bursts), -1)
+        bits = bits - ord("0")
+        return PackedBursts(framenumbers, numpy.concatenate((bits[:, 3:60], bits[:, 88:145]), axis=1))
+
+    def __getitem__(self, framenumber):
+        return self.data[self.__rows[framenumber]]
+
+    def snr(self, framenumber):
+        """
+        :return: the SNR of a burst in dB, None if it is not known.
+        """
+        row = self.__rows.get(framenumber)
+        if row is None or numpy.isnan(self.snr_db[row]):
+            return None
+        return float(self.snr_db[row])
+
+    def __contains__(self, framenumber):
+        return framenumber in self.__rows
+
+    def __iter__(self):
+        return iter(self.__rows)
+
+    def __len__(self):
+        return len(self.__rows)
@@ -43,20 +43,30 @@ class ConfigProvider(object):
         if not os.path.isdir(self.userplugins_dir):
             os.makedirs(self.userplugins_dir, 0755)
 
-    def get(self, section, option):
+    def get(self, section, option, default=None):
         """
         Pass the arguments to the ConfigParser and get the
         option value from there.
 
         :param section: the section of the desired option
         :param option: the option that shall be retrieved
+        :param default: value returned if the option is not set, i.e. in configuration files created by older versions
         :return:
         """
+        if default is not None and not self.__config.has_option(section, option):
+            return default
         return self.__config.get(section, option)
 
-    def getint(self, section, option):
+    def getint(self, section, option, default=None):
+        if default is not None and not self.__config.has_option(section, option):
+            return default
         return self.__config.getint(section, option)
 
+    def getfloat(self, section, option, default=None):
+        if default is not None and not self.__config.has_option(section, option):
+            return default
+        return self.__config.getfloat(section, option)
+
     def getboolean(self, section, option):
         return self.__config.getboolean(section, option)
 
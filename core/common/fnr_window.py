@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import numpy
+
+# framenumbers wrap around to 0 after a hyperframe of 2715648 TDMA frames
+MAX_FNR = 2715648
+
+
+def fnr_add(fnr, offset):
+    """
+    Add an offset to a framenumber, taking the hyperframe wraparound into account.
+
+    :param fnr: the framenumber.
+    :param offset: number of frames to add, can be negative.
+    :return: the resulting framenumber.
+    """
+    return (fnr + offset) % MAX_FNR
+
+
+def fnr_diff(fnr_a, fnr_b):
+    """
+    Get the shortest distance between two framenumbers, taking the hyperframe wraparound into account.
+
+    :return: the number of frames from fnr_b to fnr_a, negative if fnr_a is before fnr_b.
+    """
+    return (fnr_a - fnr_b + MAX_FNR // 2) % MAX_FNR - MAX_FNR // 2
+
+
+class FnrWindow(object):
+    """
+    A window of consecutive framenumbers, which may span the hyperframe wraparound.
+    """
+
+    def __init__(self, start, length):
+        """
+        :param start: first framenumber of the window.
+        :param length: number of frames in the window.
+        """
+        if length < 0 or length > MAX_FNR:
+            raise ValueError("Invalid window length %s" % length)
+        self.start = start % MAX_FNR
+        self.length = length
+
+    @staticmethod
+    def around(fnr, before, after):
+        """
+        Create a window around a framenumber.
+
+        :param fnr: the framenumber.
+        :param before: number of frames before fnr.
+        :param after: number of frames after fnr.
+        :return: the window from fnr - before to fnr + after.
+        """
+        return FnrWindow(fnr - before, before + after + 1)
+
+    @property
+    def first(self):
+        return self.start
+
+    @property
+    def last(self):
+        return fnr_add(self.start, self.length - 1)
+
+    def offset(self, fnr):
+        """
+        :return: the position of a framenumber relative to the start of the window.
+        """
+        return (fnr - self.start) % MAX_FNR
+
+    def contains(self, fnrs):
+        """
+        :param fnrs: an array of framenumbers.
+        :return: a boolean mask of the framenumbers within the window.
+        """
+        return (numpy.asarray(fnrs, dtype=numpy.int64) - self.start) % MAX_FNR < self.length
+
+    def __contains__(self, fnr):
+        return self.offset(fnr) < self.length
+
+    def __len__(self):
+        return self.length
+
+    def ranges(self):
+        """
+        Split the window into ranges that do not span the hyperframe wraparound.
+
+        :return: a list of (first, last) tuples, in the order of the window.
+        """
+        if self.length == 0:
+            return []
+        if self.start + self.length <= MAX_FNR:
+            return [(self.start, self.start + self.length - 1)]
+        return [(self.start, MAX_FNR - 1), (0, self.last)]
+
+    def __repr__(self):
+        return "FnrWindow(%s - %s)" % (self.first, self.last)
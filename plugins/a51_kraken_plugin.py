@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
 import array
+import os
 from itertools import cycle, dropwhile
-from subprocess import check_output
 
-from adapter.grgsm.cmc_analyzer import ImmediateAssignmentExtractor, CMCFinder, CMCAnalyzer, SICollector
-from adapter.kraken_adapter import KrakenA51ReconstructorAdapter
-from core.adapterinterfaces.a5 import A5BurstSet
+from adapter.grgsm.candidates import LAPDM_UI, Candidate, CandidateRanker
+from adapter.grgsm.cmc_analyzer import CMCAnalyzer, SICollector, SessionAnalyzer, attack_window, \
+    observed_si_cycle
+from adapter.kraken_adapter import KrakenA51ReconstructorAdapter, KrakenError
+from adapter.xcch import XcchEncoder
+from core.adapterinterfaces.a5 import A5BurstSet, A5ReconstructionQueue
 from core.common import arfcn_converter
+from core.common.fnr_window import fnr_add, fnr_diff
 from core.plugin.interface import plugin, PluginBase, cmd, arg, arg_exclusive, arg_group
 
 
@@ -14,6 +18,7 @@ from core.plugin.interface import plugin, PluginBase, cmd, arg, arg_exclusive, a
 class A51ReconstructionPlugin(PluginBase):
     attack_modes = ['SDCCH', 'SACCH', 'SDCCH/SACCH']
     channel_modes = ['BCCH', 'BCCH_SDCCH4', 'SDCCH8']
+    xcch_encoder = XcchEncoder()  # shared, the System Information messages of a network rarely change
 
     @arg("-m", action="store", dest="mode", choices=channel_modes,
          help="Channel mode. This determines on which channels to search for messages that can be cracked.",
@@ -24,6 +29,11 @@ class A51ReconstructionPlugin(PluginBase):
     @arg("-t", action="store", dest="timeslot", type=int,
          help="Timeslot of the Immediate Assignment or Cipher Mode Command.", default=0)
     @arg("-v", action="store_true", dest="verbose", help="If enabled the command displays verbose information.")
+    @arg("--tmsi", action="store", dest="tmsi",
+         help="TMSI of the attacked subscriber. Keys of previous sessions of the TMSI are tried first.")
+    @arg("--budget", action="store", dest="budget", type=int,
+         help="Maximum number of burst sets looked up by Kraken per session, the most promising ones are used. "
+              "Default: no limit.")
     @arg_exclusive(args=[
         arg("--cfile", action="store_path", dest="cfile", help="cfile."),
         arg("--bursts", action="store_path", dest="bursts", help="bursts.")
@@ -39,7 +49,9 @@ class A51ReconstructionPlugin(PluginBase):
     ])
     @arg_exclusive(args=[
         arg("--frame-ia", action="store", dest="fnr_ia", type=int, help="Framenumber of the Immediate Assignment."),
-        arg("--frame-cmc", action="store", dest="fnr_cmc", type=int, help="Framenumber of the Cipher Mode Command.")
+        arg("--frame-cmc", action="store", dest="fnr_cmc", type=int, help="Framenumber of the Cipher Mode Command."),
+        arg("--all", action="store_true", dest="all",
+            help="Reconstruct the keys of all sessions on the timeslot that are ciphered with A5/1.")
     ])
     @cmd(name="a51_kraken", description="Reconstruct A51 session key from captured messages using Kraken TMTO.")
     def a51_kraken(self, args):
@@ -49,48 +61,43 @@ class A51ReconstructionPlugin(PluginBase):
         is_cmc_provided = False
         burst_file = args.bursts
         mode = args.mode
+        cmc_analyzer = None
+        si_messages = None
 
-        if args.fnr_cmc is not None:
+        if args.budget is not None and args.budget <= 0:
+            self.printmsg("The budget has to be positive.")
+            return
+        if args.all:
+            self.__crack_all(args)
+            return
+        elif args.fnr_cmc is not None:
             is_cmc_provided = True
         elif args.fnr_ia is not None:
-            ia_extractor = ImmediateAssignmentExtractor(burst_file, timeslot, mode, args.fnr_ia)
-            ia_extractor.start()
-            ia_extractor.wait()
-
-            error = True
-            mode = "BCCH_SDCCH4"
-            immediate_assignments = ia_extractor.extract_immediate_assignment.get_frame_numbers()
-            for i in range(len(immediate_assignments)):
-                if immediate_assignments[i] == args.fnr_ia:
-                    self.printmsg("Immediate Assignment at %s" % immediate_assignments[i])
-                    timeslot = ia_extractor.extract_immediate_assignment.get_timeslots()[i]
-                    subchannel = ia_extractor.extract_immediate_assignment.get_subchannels()[i]
-                    if ia_extractor.extract_immediate_assignment.get_channel_types()[i] == "SDCCH/8":
-                        mode = "SDCCH8"
-                    error = False
-                    break
-            if error:
+            # the Immediate Assignment, the Cipher Mode Command and the bursts of the session are found in one pass
+            cmc_analyzer = SessionAnalyzer(burst_file, timeslot, mode, args.fnr_ia).run()
+            if not cmc_analyzer.ia_found:
                 self.printmsg("No valid framenumber for immediate assignment was provided.")
                 return
+            self.printmsg("Immediate Assignment at %s" % args.fnr_ia)
 
-            cmc_finder = CMCFinder(burst_file, timeslot, subchannel, mode, args.fnr_ia)  # ToDo: channeltype from ia
-            cmc_finder.start()
-            cmc_finder.wait()
-
-            fnr_cmc = cmc_finder.get_cmc()
+            fnr_cmc = cmc_analyzer.fnr_cmc
             if fnr_cmc is None:
                 self.printmsg("No cipher mode command was found.")
                 return
+            timeslot = cmc_analyzer.timeslot
+            subchannel = cmc_analyzer.subchannel
+            mode = cmc_analyzer.mode
+            si_messages = cmc_analyzer.si_messages
         else:
             self.printmsg("No valid framenumber for cipher mode command or immediate assignment was provided.")
             return
 
-        fnr_start = fnr_cmc - 2 * 102  # should be (args.fnr_cmc - 3 * 102 + max_fnr) mod max_fnr
-        fnr_end = fnr_cmc + 3 * 102 + 3  # should be (args.fnr_cmc + 3 * 102 + 3) mod max_fnr
+        window = attack_window(fnr_cmc)
 
-        cmc_analyzer = CMCAnalyzer(timeslot, burst_file, mode, fnr_start, fnr_end)
-        cmc_analyzer.start()
-        cmc_analyzer.wait()
+        if cmc_analyzer is None:
+            cmc_analyzer = CMCAnalyzer(timeslot, burst_file, mode, window, fnr_cmc)
+            cmc_analyzer.start()
+            cmc_analyzer.wait()
 
         if not cmc_analyzer.is_a51_cmc(fnr_cmc):
             self.printmsg("Cipher Mode Command at %s does not assign A5/1" % fnr_cmc)
@@ -101,39 +108,207 @@ class A51ReconstructionPlugin(PluginBase):
         if is_cmc_provided:
             subchannel = cmc_analyzer.get_subchannel(fnr_cmc)
 
-        kraken_burst_sets = cmc_analyzer.createLapdmUiBurstSets(fnr_cmc)
+        try:
+            kraken_adapter = KrakenA51ReconstructorAdapter(self._config_provider)
+        except KrakenError as e:
+            self.printmsg(str(e))
+            return
+        capture = os.path.abspath(burst_file)
+        key = kraken_adapter.cache.session_key(capture, fnr_cmc)
+        if key is not None:
+            kraken_adapter.close()
+            self.printmsg("Key found (cached): %s" % key)
+            return
+
+        # keys of previous sessions of the same cell or subscriber are tried before querying Kraken
+        cell = self.__cell_identity(cmc_analyzer)
+        related_keys = kraken_adapter.cache.related_keys(cell, args.tmsi)
 
-        kraken_adapter = KrakenA51ReconstructorAdapter(self._config_provider)
+        # all burst sets are submitted at once to keep Kraken's queue full, the most promising ones first,
+        # the first verified key wins
+        batch = kraken_adapter.reconstruct_many([], args.verbose)
 
-        key_found = False
+        try:
+            if args.attackmode != "SDCCH" and si_messages is None:
+                si_messages = self.__collect_si_messages(timeslot, burst_file, mode)
+            candidates = self.__rank_candidates(cmc_analyzer, fnr_cmc, window, args.attackmode, si_messages,
+                                                args.budget)
+            key = self.__submit(batch, related_keys, candidates, args.verbose)
 
-        if args.attackmode != "SACCH":
-            sdcch_counter = 0
-            for burst_set in kraken_burst_sets:
-                if sdcch_counter % 4 == 0 and args.verbose:
-                    self.printmsg(
-                        "Using SDCCH message bursts %s - %s" % (burst_set.frame_number, burst_set.frame_number + 3))
-                sdcch_counter += 1
+            if key is None:
+                key = batch.wait_for_key()
+            else:
+                batch.cancel()
+            if key is not None:
+                kraken_adapter.cache.store_session_key(capture, fnr_cmc, key, cell, args.tmsi)
+        finally:
+            kraken_adapter.close()
+
+        for error in batch.errors:
+            self.printmsg(error)
+        if key is not None:
+            self.printmsg("Key found: %s" % key)
+        else:
+            self.printmsg("No key found.")
 
-                key = kraken_adapter.send2kraken(burst_set, args.verbose)
+    def __crack_all(self, args):
+        """
+        Reconstruct the keys of all sessions on the timeslot that are ciphered with A5/1.
+
+        The burst file is decoded once for all Cipher Mode Commands. The burst sets of all sessions are cracked in a
+        shared queue, the most promising burst sets of all sessions first, and the key of each session is reported
+        as soon as it is found.
+        """
+        burst_file = args.bursts
+        cmc_analyzer = CMCAnalyzer(args.timeslot, burst_file, args.mode)
+        cmc_analyzer.start()
+        cmc_analyzer.wait()
+
+        fnrs_cmc = cmc_analyzer.a51_cmcs()
+        if not fnrs_cmc:
+            self.printmsg("No Cipher Mode Command assigning A5/1 was found.")
+            return
+        self.printmsg("Cipher Mode Commands assigning A5/1 at %s" % ", ".join(str(fnr) for fnr in fnrs_cmc))
+
+        try:
+            kraken_adapter = KrakenA51ReconstructorAdapter(self._config_provider)
+        except KrakenError as e:
+            self.printmsg(str(e))
+            return
+        capture = os.path.abspath(burst_file)
+        cell = self.__cell_identity(cmc_analyzer)
+        related_keys = kraken_adapter.cache.related_keys(cell, args.tmsi)
+        crack_queue = A5ReconstructionQueue(kraken_adapter, verbose=args.verbose)
+        # the whole timeslot was decoded, so the System Information messages on SACCH are known without another pass
+        si_messages = cmc_analyzer.si_messages
+        keys = dict()
+
+        try:
+            for fnr_cmc in fnrs_cmc:
+                key = kraken_adapter.cache.session_key(capture, fnr_cmc)
                 if key is not None:
-                    key_found = True
-                    self.printmsg("Key found: %s" % key)
-                    break
+                    self.printmsg("Session of Cipher Mode Command at %s: key found (cached): %s" % (fnr_cmc, key))
+                    keys[fnr_cmc] = key
+                    continue
+
+                candidates = self.__rank_candidates(cmc_analyzer, fnr_cmc, attack_window(fnr_cmc), args.attackmode,
+                                                    si_messages, args.budget)
+
+                key = KrakenA51ReconstructorAdapter.check_keys(related_keys,
+                                                               [candidate.burst_set for candidate in candidates])
+                if key is not None:
+                    self.printmsg("Session of Cipher Mode Command at %s: key of a previous session matches: %s" % (
+                        fnr_cmc, key))
+                    kraken_adapter.cache.store_session_key(capture, fnr_cmc, key, cell, args.tmsi)
+                    keys[fnr_cmc] = key
+                    continue
+
+                crack_queue.add(fnr_cmc, [])  # sessions without burst sets are reported as well
+                for candidate in candidates:
+                    # the most promising burst sets of all sessions are looked up first
+                    crack_queue.add(fnr_cmc, [candidate.burst_set], -candidate.score)
+
+            for fnr_cmc, key in crack_queue:
+                if key is not None:
+                    self.printmsg("Session of Cipher Mode Command at %s: key found: %s" % (fnr_cmc, key))
+                    kraken_adapter.cache.store_session_key(capture, fnr_cmc, key, cell, args.tmsi)
                 else:
-                    pass
+                    self.printmsg("Session of Cipher Mode Command at %s: no key found." % fnr_cmc)
+                keys[fnr_cmc] = key
+        finally:
+            crack_queue.cancel()
+            kraken_adapter.close()
+
+        for error in sorted(set(crack_queue.errors)):
+            self.printmsg(error)
+        self.printmsg("Keys found for %s of %s sessions." % (len([k for k in keys.values() if k is not None]),
+                                                            len(fnrs_cmc)))
+
+    def __rank_candidates(self, cmc_analyzer, fnr_cmc, window, attack_mode, si_messages, budget):
+        """
+        Create the burst sets of the attack mode and rank them by the evidence in the capture.
+
+        :param si_messages: the System Information messages used on SACCH by the network, by type. Only required for
+        attacks on SACCH.
+        :param budget: maximum number of burst sets, None for all.
+        :return: a list of candidates, the most promising first.
+        """
+        candidates = []
+        if attack_mode != "SACCH":
+            # the burst sets of a message are skipped if its bursts were not captured, so the index of the message
+            # is taken from the framenumber
+            candidates.extend(Candidate(burst_set, "SDCCH", fnr_diff(burst_set.frame_number, fnr_cmc) // 51 - 1,
+                                        LAPDM_UI)
+                              for burst_set in cmc_analyzer.createLapdmUiBurstSets(fnr_cmc))
+        if attack_mode != "SDCCH":
+            candidates.extend(self.__create_sacch_candidates(cmc_analyzer, fnr_cmc, window, si_messages))
+        return CandidateRanker(cmc_analyzer, fnr_cmc, window).rank(candidates, budget)
+
+    def __submit(self, batch, related_keys, candidates, verbose):
+        """
+        Submit the burst sets of candidates to Kraken in the given order, unless a key of a previous session matches.
+
+        :return: the matching key of a previous session, None if the burst sets were submitted.
+        """
+        burst_sets = [candidate.burst_set for candidate in candidates]
+        key = KrakenA51ReconstructorAdapter.check_keys(related_keys, burst_sets)
+        if key is not None:
+            self.printmsg("Key of a previous session matches the captured bursts")
+            return key
+
+        if verbose:
+            for candidate in candidates:
+                self.printmsg("Using %s burst %s, %s, score %.3f" % (candidate.channel,
+                                                                     candidate.burst_set.frame_number,
+                                                                     candidate.plaintext, candidate.score))
+        batch.add(burst_sets)
+        return None
+
+    def __cell_identity(self, cmc_analyzer):
+        """
+        Get the identity of the cell from a System Information Type 6 message on the attacked SACCH.
+
+        :return: the location area identification and cell identity as hex string, None if not available.
+        """
+        for sit_fnr in sorted(cmc_analyzer.sacch_sits):
+            if cmc_analyzer.sacch_sits[sit_fnr][1] == "System Information Type 6":
+                byte_list = self.byte_string_to_list(cmc_analyzer.sacch_sits[sit_fnr][2])
+                # L1 header (2 bytes), LAPDm header (3 bytes), protocol discriminator, message type, CI, LAI
+                if len(byte_list) >= 14:
+                    return "".join("%02x" % byte for byte in byte_list[9:14] + byte_list[7:9])
+        return None
+
+    def __collect_si_messages(self, timeslot, burst_file, mode):
+        """
+        :return: a dictionary of the System Information messages used on SACCH by the network, by type.
+        """
+        si_collector = SICollector(timeslot, burst_file, mode)
+        si_collector.start()
+        si_collector.wait()
+        return si_collector.si_messages
 
-        if key_found or args.attackmode == "SDCCH":
-            return
+    def __create_sacch_candidates(self, cmc_analyzer, fnr_cmc, window, si_messages):
+        """
+        Create the burst sets of the SACCH messages following the CMC, using System Information messages as
+        plaintext.
 
+        :param window: the framenumbers around the CMC.
+        :param si_messages: the System Information messages used on SACCH by the network, by type.
+        :return: a list of candidates, empty if the burst sets cannot be created.
+        """
         last_sit_fnr = -1
         last_si_type = None
         timingadvance = -1
+        subchannel = cmc_analyzer.get_subchannel(fnr_cmc)
 
         plaintext_si_msgs = dict()
 
         for sit_fnr in cmc_analyzer.sacch_sits:
-            if sit_fnr > last_sit_fnr and sit_fnr < fnr_cmc:
+            if sit_fnr not in window or cmc_analyzer.sacch_sits[sit_fnr][0] != subchannel:
+                continue  # the SACCH of another session
+            # positions within the window are compared, as the window may span the hyperframe wraparound
+            if window.offset(sit_fnr) < window.offset(fnr_cmc) and (
+                    last_sit_fnr == -1 or window.offset(sit_fnr) > window.offset(last_sit_fnr)):
                 last_sit_fnr = sit_fnr
                 # extract timing advance
                 last_si_type = cmc_analyzer.sacch_sits[sit_fnr][1]
@@ -149,14 +324,11 @@ class A51ReconstructionPlugin(PluginBase):
 
         if last_sit_fnr == -1:
             self.printmsg("Could not determine last System Information message")
-            return
-
-        si_collector = SICollector(timeslot, burst_file, mode)
-        si_collector.start()
-        si_collector.wait()
+            return []
+        observed_si_types = set(plaintext_si_msgs)
 
         # collect all system information message types used on SACCH by the network
-        for t in si_collector.si_messages:
+        for t in si_messages:
             # there can be at most four different system information message types on SACCH.
             if len(plaintext_si_msgs) >= 4:
                 break
@@ -164,86 +336,86 @@ class A51ReconstructionPlugin(PluginBase):
             # if the type is not in the plaintext dictionary or has another timing advance
             # we put it in the dict
             if not plaintext_si_msgs.has_key(t) or plaintext_si_msgs[t][1] != timingadvance:
-                plaintext_si_msgs[t] = self.byte_string_to_list(si_collector.si_messages[t])
-
-        for msg in plaintext_si_msgs:
-            # correct timing advance
-            if plaintext_si_msgs[msg][1] != timingadvance:
-                plaintext_si_msgs[msg][1] = timingadvance
+                plaintext_si_msgs[t] = self.byte_string_to_list(si_messages[t])
 
-        # create bursts for all system information message types
+        # create bursts for all system information message types, with the timing advance corrected
         plaintext_si_bursts = dict()
         for msg in plaintext_si_msgs:
             try:
-                plaintext_si_bursts[msg] = self.message_to_bursts(plaintext_si_msgs[msg])
-            except OSError:
-                self.printmsg("Cannot encode burst. Please install gsmframecoder to execute attack mode SACCH.")
-                return
-
-        sacch_si_types = ["System Information Type 5", "System Information Type 5bis", "System Information Type 5ter",
-                          "System Information Type 6"]
-        if not plaintext_si_msgs.has_key("System Information Type 5bis"):
-            sacch_si_types.remove("System Information Type 5bis")
-            if not plaintext_si_msgs.has_key("System Information Type 5ter"):
-                sacch_si_types.remove("System Information Type 5ter")
+                plaintext_si_bursts[msg] = self.message_to_bursts(plaintext_si_msgs[msg], timingadvance)
+            except ValueError as e:
+                self.printmsg("Cannot encode %s: %s" % (msg, e))
+                return []
 
-        type_pool = cycle(sacch_si_types)
-        dropwhile(lambda x: x != last_si_type, type_pool)
-        next(type_pool)  # next one would last_si_type, which we use as starting point
+        sacch_si_types = self.__expected_si_types(cmc_analyzer, fnr_cmc, window, last_si_type, plaintext_si_msgs)
+        type_pool = dropwhile(lambda x: x != last_si_type, cycle(sacch_si_types))
+        next(type_pool)  # skip last_si_type, which we use as starting point
 
         # assemble burst sets
-        sacch_burst_sets = []
+        sacch_candidates = []
         for i in range(1, 4):
             type_of_msg = next(type_pool)  # expected type of next message
-            fnr_of_msg = last_sit_fnr + i * 102
+            fnr_of_msg = fnr_add(last_sit_fnr, i * 102)
 
             bursts_of_plaintext = plaintext_si_bursts[type_of_msg]
 
             for j in range(0, 4):
-                fnr = fnr_of_msg + j
+                fnr = fnr_add(fnr_of_msg, j)
                 check_burst_index = 0 if j > 0 else 1
-                sacch_burst_sets.append(
-                    A5BurstSet(
-                        fnr,  # framenumber of the burst we want to use
-                        cmc_analyzer.bursts[fnr],  # data (payload) of the burst we want to use
-                        bursts_of_plaintext[j],  # plaintext data (payload) of a lapdm ui message
-                        fnr_of_msg + check_burst_index,  # framenumber of verification burst.
-                        # we use the first burst of the message as check burst, if j > 0
-                        cmc_analyzer.bursts[fnr_of_msg + check_burst_index],  # data (payload) of the verification burst
-                        bursts_of_plaintext[check_burst_index]  # plaintextdata (payload) of
-                        # the verification burst
-                    )
+                if fnr not in cmc_analyzer.bursts or fnr_add(fnr_of_msg, check_burst_index) not in cmc_analyzer.bursts:
+                    continue  # the burst was not captured
+                burst_set = A5BurstSet(
+                    fnr,  # framenumber of the burst we want to use
+                    cmc_analyzer.bursts[fnr],  # data (payload) of the burst we want to use
+                    bursts_of_plaintext[j],  # plaintext data (payload) of a lapdm ui message
+                    fnr_add(fnr_of_msg, check_burst_index),  # framenumber of verification burst.
+                    # we use the first burst of the message as check burst, if j > 0
+                    cmc_analyzer.bursts[fnr_add(fnr_of_msg, check_burst_index)],  # data of the verification burst
+                    bursts_of_plaintext[check_burst_index]  # plaintextdata (payload) of
+                    # the verification burst
                 )
+                sacch_candidates.append(Candidate(burst_set, "SACCH", i - 1, type_of_msg,
+                                                  type_of_msg in observed_si_types))
+
+        return sacch_candidates
+
+    @staticmethod
+    def __expected_si_types(cmc_analyzer, fnr_cmc, window, last_si_type, plaintext_si_msgs):
+        """
+        Get the order in which the network sends the System Information types on the attacked SACCH. The cycle
+        observed on the subchannel before the CMC is used if it is complete, then the cycle observed on any subchannel
+        of the timeslot, otherwise the order of the standard.
+
+        :param last_si_type: the type of the last System Information message before the CMC.
+        :param plaintext_si_msgs: the System Information messages available as plaintext, by type.
+        :return: the types of one cycle, containing last_si_type.
+        """
+        subchannel = cmc_analyzer.get_subchannel(fnr_cmc)
+        sits = cmc_analyzer.sacch_sits
+        fnrs = sorted((fnr for fnr in sits if fnr in window and sits[fnr][0] == subchannel
+                       and window.offset(fnr) < window.offset(fnr_cmc)), key=window.offset)
+        for si_cycle in (observed_si_cycle([sits[fnr][1] for fnr in fnrs]), cmc_analyzer.si_cycle):
+            if si_cycle is not None and last_si_type in si_cycle and all(t in plaintext_si_msgs for t in si_cycle):
+                return si_cycle
 
-        sacch_counter = 0
-        for burst_set in sacch_burst_sets:
-            if sacch_counter % 4 == 0 and args.verbose:
-                self.printmsg(
-                    "Using SACCH message bursts %s - %s" % (burst_set.frame_number, burst_set.frame_number + 4))
-                sacch_counter += 1
-
-            key = kraken_adapter.send2kraken(burst_set, args.verbose)
-            if key is not None:
-                key_found = True
-                self.printmsg("Key found: %s" % key)
-                break
-            else:
-                pass
-                # Todo: look at a lapdm ui message: if randomized, we wont do the attempt on sdcch
+        sacch_si_types = ["System Information Type 5", "System Information Type 5bis", "System Information Type 5ter",
+                          "System Information Type 6"]
+        if not plaintext_si_msgs.has_key("System Information Type 5bis"):
+            sacch_si_types.remove("System Information Type 5bis")
+            if not plaintext_si_msgs.has_key("System Information Type 5ter"):
+                sacch_si_types.remove("System Information Type 5ter")
+        return sacch_si_types
 
     def byte_string_to_list(self, string):
         byte_arr = array.array('B', string.decode("hex"))
         return byte_arr.tolist()
 
-    def message_to_bursts(self, message_bytes):
-        result = []
-        message = ""
-
-        for byte in message_bytes:
-            message += "%0.2X" % byte
+    def message_to_bursts(self, message_bytes, timing_advance=None):
+        """
+        Encode a SACCH message into the payloads of its 4 bursts.
 
-        output = check_output(["gsmframecoder", message]).split("\n")
-        if len(output) >= 9:
-            for i in range(4):
-                result.append(output[(i + 1) * 2])
-        return result
+        :param message_bytes: the message including the L1 header, a list of 23 byte values.
+        :param timing_advance: timing advance to put into the L1 header, None to keep the one of the message.
+        :return: a list of the payloads, as packed bits.
+        """
+        return self.xcch_encoder.encode(message_bytes, timing_advance)
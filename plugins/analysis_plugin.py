@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 import os
 
+import grgsm
+
+from adapter.grgsm.analysis_engine import AnalysisEngine
+from adapter.grgsm.channel_decoder import Channel
 from adapter.grgsm.info_extractor import InfoExtractor
+from adapter.grgsm.message_store import MessageStore
 from adapter.grgsm.systeminfo_extractor import SystemInfoExtractor
 from adapter.grgsm.tmsi import TmsiCapture
 from core.plugin.interface import plugin, PluginBase, arg, cmd, subcmd, PluginError
@@ -27,8 +32,11 @@ class AnalysisPlugin(PluginBase):
         extractor.start()
         extractor.wait()
 
-        cmc_fnrs = extractor.gsm_extract_cmc.get_framenumbers()
-        cmc_a5vs = extractor.gsm_extract_cmc.get_a5_versions()
+        self.__print_cipher_mode_commands(extractor.gsm_extract_cmc)
+
+    def __print_cipher_mode_commands(self, extract_cmc):
+        cmc_fnrs = extract_cmc.get_framenumbers()
+        cmc_a5vs = extract_cmc.get_a5_versions()
 
         if len(cmc_fnrs) > 0:
             self.printmsg("CMCs:")
@@ -45,16 +53,19 @@ class AnalysisPlugin(PluginBase):
         extractor.start()
         extractor.wait()
 
-        ia_fnrs = extractor.gsm_extract_immediate_assignment.get_frame_numbers()
-        ia_channeltypes = extractor.gsm_extract_immediate_assignment.get_channel_types()
-        ia_timeslots = extractor.gsm_extract_immediate_assignment.get_timeslots()
-        ia_subchannels = extractor.gsm_extract_immediate_assignment.get_subchannels()
-        ia_hopping = extractor.gsm_extract_immediate_assignment.get_hopping()
-        ia_maios = extractor.gsm_extract_immediate_assignment.get_maios()
-        ia_hsns = extractor.gsm_extract_immediate_assignment.get_hsns()
-        ia_arfcns = extractor.gsm_extract_immediate_assignment.get_arfcns()
-        ia_tas = extractor.gsm_extract_immediate_assignment.get_timing_advances()
-        ia_mobileallocations = extractor.gsm_extract_immediate_assignment.get_mobile_allocations()
+        self.__print_immediate_assignments(extractor.gsm_extract_immediate_assignment)
+
+    def __print_immediate_assignments(self, extract_immediate_assignment):
+        ia_fnrs = extract_immediate_assignment.get_frame_numbers()
+        ia_channeltypes = extract_immediate_assignment.get_channel_types()
+        ia_timeslots = extract_immediate_assignment.get_timeslots()
+        ia_subchannels = extract_immediate_assignment.get_subchannels()
+        ia_hopping = extract_immediate_assignment.get_hopping()
+        ia_maios = extract_immediate_assignment.get_maios()
+        ia_hsns = extract_immediate_assignment.get_hsns()
+        ia_arfcns = extract_immediate_assignment.get_arfcns()
+        ia_tas = extract_immediate_assignment.get_timing_advances()
+        ia_mobileallocations = extract_immediate_assignment.get_mobile_allocations()
 
         if len(ia_fnrs) == 0:
             self.printmsg("No Immediate Assignment messages found.")
@@ -101,6 +112,9 @@ class AnalysisPlugin(PluginBase):
         flowgraph.start()
         flowgraph.wait()
 
+        self.__print_tmsis(verbose, destfile)
+
+    def __print_tmsis(self, verbose, destfile):
         tmsis = dict()
         imsis = dict()
 
@@ -152,13 +166,16 @@ class AnalysisPlugin(PluginBase):
         extractor.start()
         extractor.wait()
 
-        chans = extractor.gsm_extract_system_info.get_chans()  # arfcn
-        pwrs = extractor.gsm_extract_system_info.get_pwrs()
-        cell_id = extractor.gsm_extract_system_info.get_cell_id()
-        lac = extractor.gsm_extract_system_info.get_lac()
-        mcc = extractor.gsm_extract_system_info.get_mcc()
-        mnc = extractor.gsm_extract_system_info.get_mnc()
-        ccch_conf = extractor.gsm_extract_system_info.get_ccch_conf()  # 0 = ccch, not combined with SDCCHs
+        self.__print_system_information(extractor.gsm_extract_system_info)
+
+    def __print_system_information(self, extract_system_info):
+        chans = extract_system_info.get_chans()  # arfcn
+        pwrs = extract_system_info.get_pwrs()
+        cell_id = extract_system_info.get_cell_id()
+        lac = extract_system_info.get_lac()
+        mcc = extract_system_info.get_mcc()
+        mnc = extract_system_info.get_mnc()
+        ccch_conf = extract_system_info.get_ccch_conf()  # 0 = ccch, not combined with SDCCHs
 
         class CellInfo:
             def __init__(self, arfcn, pwr, ci, lac, mcc, mnc, ccch_conf, cell_arfcns, neighbour_arfcns):
@@ -178,8 +195,8 @@ class AnalysisPlugin(PluginBase):
             current_arfcn = chans[i]
             if current_arfcn not in found_cellinfos:
                 channel_config = 'BCCH' if ccch_conf[i] == 0 else 'BCCH_SDCCH' if ccch_conf[i] == 1 else ''
-                cell_arfcns = extractor.gsm_extract_system_info.get_cell_arfcns(current_arfcn)
-                neighbour_arfcns = extractor.gsm_extract_system_info.get_neighbours(current_arfcn)
+                cell_arfcns = extract_system_info.get_cell_arfcns(current_arfcn)
+                neighbour_arfcns = extract_system_info.get_neighbours(current_arfcn)
 
                 current_cell_info = CellInfo(current_arfcn, pwrs[i], cell_id[i], lac[i],
                                              mcc[i], mnc[i], channel_config,
@@ -204,3 +221,92 @@ class AnalysisPlugin(PluginBase):
                 strings.append(", ".join(str(entry) for entry in cell_info.neighbour_arfcns))
 
             self.printmsg(columnize(strings, 9))
+
+    @arg("--gprs-assignments", action="store_true", dest="gprs", help="Show GPRS related immediate assignments.")
+    @arg("-v", action="store_true", dest="verbose", help="If set, the captured TMSI / IMSI are printed.")
+    @arg("-o", action="store", dest="dest_file",
+         help="If set, the captured TMSI / IMSI are stored in the specified file.")
+    @arg("-m", action="store", dest="mode", choices=channel_modes, help="Channel mode.", default="BCCH_SDCCH4")
+    @arg("-t", action="store", dest="timeslot", type=int, help="Timeslot of the CCCH.", default=0)
+    @arg("--bursts", action="store_path", dest="bursts", help="bursts.")
+    @subcmd(name="all", help="Run all analyses on the capture file, decoding it only once.", parent="analyze")
+    def all_analyses(self, args):
+        if args.bursts is None:
+            raise PluginError("Provide a burst file.")
+
+        destfile = None
+        if args.dest_file is not None:
+            destfile = self._data_access_provider.getfilepath(args.dest_file)
+        burstfile = self._data_access_provider.getfilepath(args.bursts)
+
+        engine = AnalysisEngine(args.timeslot, burstfile, args.mode)
+        extract_cmc = engine.register("cmc", grgsm.extract_cmc())
+        extract_immediate_assignment = engine.register(
+            "immediate_assignment", grgsm.extract_immediate_assignment(False, not args.gprs, True))
+        extract_system_info = engine.register("system_info", grgsm.extract_system_info())
+        engine.register("tmsi", grgsm.tmsi_dumper())
+        engine.start()
+        engine.wait()
+
+        self.printmsg("System Information:")
+        self.__print_system_information(extract_system_info)
+        self.printmsg("\nImmediate Assignments:")
+        self.__print_immediate_assignments(extract_immediate_assignment)
+        self.printmsg("\nCipher Mode Commands:")
+        self.__print_cipher_mode_commands(extract_cmc)
+        self.printmsg("\nTMSI / IMSI:")
+        self.__print_tmsis(args.verbose, destfile)
+
+    @arg("-v", action="store_true", dest="verbose", help="If set, the raw L3 messages are printed.")
+    @arg("--type", action="store", dest="message_type",
+         help="Show only messages of this type, e.g. 'Ciphering Mode Command'. Matches as prefix, e.g. 'paging' "
+              "matches all paging requests.")
+    @arg("--identity", action="store", dest="identity", help="Show only messages containing this TMSI or IMSI.")
+    @arg("-a", action="store", dest="after", type=int,
+         help="Show only framenumbers greater than or equal the specified one")
+    @arg("-b", action="store", dest="before", type=int,
+         help="Show only framenumbers less than or equal the specified one")
+    @arg("-t", action="store", dest="timeslot", type=int, help="Show only messages on the specified timeslot")
+    @arg("-j", "--jobs", action="store", dest="jobs", type=int,
+         help="Number of channels decoded in parallel. Default: number of CPUs")
+    @arg("--channel", action="store", dest="channels", nargs="+", default=["BCCH_SDCCH4:0"],
+         help="Channels to query, given as MODE:TIMESLOTS, e.g. BCCH:0 SDCCH8:1. Channels are decoded once and "
+              "their messages are stored next to the burst file, later queries only read the stored messages.")
+    @arg("--bursts", action="store_path", dest="bursts", help="bursts.")
+    @subcmd(name="messages", help="Query the decoded L3 messages of a capture.", parent="analyze")
+    def messages(self, args):
+        if args.bursts is None:
+            raise PluginError("Provide a burst file.")
+        if args.jobs is not None and args.jobs <= 0:
+            raise PluginError("The number of jobs must be positive.")
+        try:
+            channels = [channel for spec in args.channels for channel in Channel.parse(spec)]
+        except ValueError as e:
+            raise PluginError(str(e))
+        burstfile = self._data_access_provider.getfilepath(args.bursts)
+
+        with MessageStore(burstfile) as store:
+            decoded = store.populate(channels, args.jobs)
+            if decoded > 0:
+                self.printmsg("Decoded %s channels into %s" % (decoded, store.path))
+            messages = store.messages(args.message_type, args.identity, args.after, args.before, args.timeslot)
+
+        if len(messages) == 0:
+            self.printmsg("No messages found.")
+            return
+        strings = ["FNR", "TS", "SUB", "CHANNEL", "TYPE", "IDENTITIES", "FIELDS"]
+        for message in messages:
+            strings.append(str(message.frame_number))
+            strings.append(str(message.timeslot))
+            strings.append(str(message.subslot))
+            strings.append(str(message.channel) + (" UL" if message.uplink else ""))
+            strings.append(str(message.message_type))
+            strings.append(", ".join("%s %s" % (str(identity_type), str(identity))
+                                     for identity_type, identity in message.identities))
+            strings.append(", ".join("%s=%s" % (str(key), str(message.fields[key])) for key in sorted(message.fields)))
+        self.printmsg(columnize(strings, 7))
+        if args.verbose:
+            for message in messages:
+                self.printmsg("%s %s: %s" % (message.frame_number, str(message.message_type),
+                                             " ".join("%02x" % byte for byte in message.data)))
+        self.printmsg("%s messages" % len(messages))
@@ -1,11 +1,22 @@
 # -*- coding: utf-8 -*-
-from adapter.grgsm.bursts import BurstFilter
-from core.plugin.interface import plugin, PluginBase, cmd, arg, subcmd
+import getopt
+import os
+import shlex
 
+from adapter.grgsm.burstfile import SUBSLOT_SDCCH4, SUBSLOT_SDCCH8, burst_file_writer, compact_metadata
+from adapter.grgsm.burststats import collect_statistics
+from adapter.grgsm.burstquery import BurstHistogram, BurstQuery, QueryError, QUERY_FIELDS, query_bursts
+from adapter.grgsm.bursts import BurstConverter, BurstDecryptor, BurstFilter, BurstSplitter, framenumber_key, \
+    subslot_key, subslot_of_key, timeslot_key
+from core.common import arfcn_converter
+from core.plugin.interface import plugin, PluginBase, cmd, arg, arg_exclusive, arg_group, subcmd, PluginError
 
-@plugin(name="Burstfile Plugin", description="Provides functionality for filtering burst files")
+
+@plugin(name="Burstfile Plugin",
+        description="Provides functionality for filtering, converting and inspecting burst files")
 class BurstfilePlugin(PluginBase):
-    @cmd(name="bursts", description="Provides functionality for filtering burst files.", parent=True)
+    @cmd(name="bursts", description="Provides functionality for filtering, converting and inspecting burst files.",
+         parent=True)
     def bursts(self, args):
         pass
 
@@ -20,7 +31,235 @@ class BurstfilePlugin(PluginBase):
     @arg("output_burst_file", action="store_path", help="The destination burst file")
     @subcmd(name="filter", help="Filter bursts with provided criteria.", parent="bursts")
     def filter(self, args):
-        block = BurstFilter(args.input_burst_file, args.output_burst_file, args.after, args.before, args.timeslot,
-                            args.subslot, args.remove_dummy)
-        block.start()
-        block.wait()
+        burst_filter = BurstFilter(args.input_burst_file, args.output_burst_file, args.after, args.before,
+                                   args.timeslot, args.subslot, args.remove_dummy)
+        count = burst_filter.run()
+        self.printmsg("%s bursts written to %s" % (count, args.output_burst_file))
+
+    @arg_group(name="Capture metadata, stored when converting to the compact format", args=[
+        arg("-b", action="store", dest="band", choices=(arfcn_converter.get_bands()), help="GSM band of the capture."),
+        arg("-f", action="store", dest="freq", type=float, help="Frequency of the capture."),
+        arg("-p", action="store", dest="ppm", type=int, help="ppm used for the capture."),
+        arg("-s", action="store", dest="samp_rate", type=float, help="Sample rate of the capture.")
+    ])
+    @arg("input_burst_file", action="store_path", help="The source burst file")
+    @arg("output_burst_file", action="store_path", help="The destination burst file")
+    @subcmd(name="convert",
+            help="Convert a gr-gsm burst file into the compact burst file format, or a compact burst file back into "
+                 "gr-gsm's format.",
+            parent="bursts")
+    def convert(self, args):
+        metadata = dict(band=args.band, fc=args.freq, ppm=args.ppm, samp_rate=args.samp_rate)
+        converter = BurstConverter(args.input_burst_file, args.output_burst_file, metadata)
+        count = converter.run()
+        target_format = "compact" if converter.to_compact else "gr-gsm"
+        self.printmsg("%s bursts written to %s (%s format)" % (count, args.output_burst_file, target_format))
+
+    @arg("-d", action="store_true", dest="remove_dummy", help="Remove dummy bursts from all outputs")
+    @arg("-m", action="store", dest="subslot_mode", choices=(SUBSLOT_SDCCH4, SUBSLOT_SDCCH8), default=SUBSLOT_SDCCH8,
+         help="Channel combination used for subslots. Default: SDCCH8")
+    @arg_group(name="Outputs", args=[
+        arg("--timeslots", action="store_true", dest="timeslots",
+            help="Write the bursts of each timeslot to <output_prefix>_ts<timeslot>"),
+        arg("--subslots", action="store_true", dest="subslots",
+            help="Write the bursts of each SDCCH subslot to <output_prefix>_ts<timeslot>_<mode>_sub<subslot>"),
+        arg("--fn-buckets", action="store", dest="fn_bucket_size", type=int,
+            help="Write the bursts to <output_prefix>_fn<first>-<last> files, each covering the given number of "
+                 "framenumbers"),
+        arg("--spec", action="append", dest="specs", default=[],
+            help="Write the bursts matching a filter spec '[-a FN] [-b FN] [-t TS] [-s SUBSLOT] [-d] FILE' to FILE. "
+                 "Can be given multiple times.")
+    ])
+    @arg("input_burst_file", action="store_path", help="The source burst file")
+    @arg("output_prefix", action="store_path", help="Prefix for the destination burst files")
+    @subcmd(name="split", help="Split a burst file into several files, reading it only once.", parent="bursts")
+    def split(self, args):
+        if not (args.timeslots or args.subslots or args.fn_bucket_size or args.specs):
+            raise PluginError("Provide at least one of --timeslots, --subslots, --fn-buckets or --spec.")
+        if args.fn_bucket_size is not None and args.fn_bucket_size <= 0:
+            raise PluginError("Invalid bucket size")
+
+        extension = os.path.splitext(args.input_burst_file)[1]
+        prefix = args.output_prefix
+        splitter = BurstSplitter(args.input_burst_file, args.remove_dummy)
+
+        if args.timeslots:
+            splitter.add_partition(timeslot_key, lambda key: "%s_ts%s%s" % (prefix, key, extension))
+        if args.subslots:
+            mode = args.subslot_mode.lower()
+            splitter.add_partition(subslot_key(args.subslot_mode),
+                                   lambda key: "%s_ts%s_%s_sub%s%s" % (prefix, subslot_of_key(key)[0], mode,
+                                                                       subslot_of_key(key)[1], extension))
+        if args.fn_bucket_size:
+            size = args.fn_bucket_size
+            splitter.add_partition(framenumber_key(size),
+                                   lambda key: "%s_fn%s-%s%s" % (prefix, key * size, (key + 1) * size - 1, extension))
+        for spec in args.specs:
+            destination, criteria = self.__parse_spec(spec)
+            # destinations are relative to the file store, like the paths of all arguments
+            splitter.add_output(self._data_access_provider.getfilepath(destination), subslot_mode=args.subslot_mode,
+                                **criteria)
+
+        for destination, count in splitter.run().items():
+            self.printmsg("%s bursts written to %s" % (count, destination))
+
+    @arg("-a", action="store", dest="after", type=int,
+         help="Decipher only framenumbers greater than or equal the specified one, e.g. the one of the Cipher Mode "
+              "Command")
+    @arg("-b", action="store", dest="before", type=int,
+         help="Decipher only framenumbers less than or equal the specified one")
+    @arg("-t", action="store", dest="timeslot", type=int, required=True,
+         help="Timeslot of the dedicated channel")
+    @arg_exclusive(args=[
+        arg("-s", action="store", dest="subslot", type=int,
+            help="Decipher the SDCCH and SACCH bursts of the specified SDCCH subslot"),
+        arg("--tch", action="store_true", dest="tch", help="Decipher the TCH/F, FACCH and SACCH bursts of the timeslot")
+    ])
+    @arg("-m", action="store", dest="subslot_mode", choices=(SUBSLOT_SDCCH4, SUBSLOT_SDCCH8), default=SUBSLOT_SDCCH8,
+         help="Channel combination used for subslots. Default: SDCCH8")
+    @arg("--uplink", action="store_true", dest="uplink", help="The bursts are uplink bursts")
+    @arg("-k", "--kc", action="store", dest="kc", required=True,
+         help="A5/1 session key Kc. Valid formats are '0x12,0x34,0x56,0x78,0x90,0xAB,0xCD,0xEF' and "
+              "'1234567890ABCDEF'")
+    @arg("input_burst_file", action="store_path", help="The source burst file")
+    @arg("output_burst_file", action="store_path", help="The destination burst file")
+    @subcmd(name="decrypt",
+            help="Decipher the A5/1 encrypted bursts of a dedicated channel with a known key, so that later decoding "
+                 "does not need the key. All other bursts are copied unchanged.",
+            parent="bursts")
+    def decrypt(self, args):
+        if args.subslot is None and not args.tch:
+            raise PluginError("Provide either the subslot of a SDCCH with -s or --tch for a TCH/F.")
+        decryptor = BurstDecryptor(args.input_burst_file, args.output_burst_file, self.__parse_kc(args.kc),
+                                   args.timeslot, args.subslot, args.uplink, args.after, args.before,
+                                   args.subslot_mode)
+        count, deciphered = decryptor.run()
+        self.printmsg("%s bursts written to %s, %s of them deciphered" % (count, args.output_burst_file, deciphered))
+
+    @arg("-m", action="store", dest="subslot_mode", choices=(SUBSLOT_SDCCH4, SUBSLOT_SDCCH8), default=SUBSLOT_SDCCH8,
+         help="Channel combination used for the subslot field. Default: SDCCH8")
+    @arg("--bin-size", action="store", dest="bin_size", type=int, default=1,
+         help="Number of consecutive values counted together in the histogram. Default: 1")
+    @arg_exclusive(args=[
+        arg("-o", action="store_path", dest="output_burst_file", help="Write the matching bursts to a burst file."),
+        arg("--count", action="store_true", dest="count", help="Print the number of matching bursts only."),
+        arg("--histogram", action="store", dest="histogram", choices=sorted(QUERY_FIELDS),
+            help="Print the number of matching bursts per value of the given field.")
+    ])
+    @arg("input_burst_file", action="store_path", help="The source burst file")
+    @arg("expression", action="store",
+         help="The query, e.g. 'ts in (0,2) and fn >= 1200000 and not dummy and subslot == 3'. "
+              "Fields: %s" % ", ".join(sorted(QUERY_FIELDS)))
+    @subcmd(name="query", help="Select bursts by a query expression.", parent="bursts")
+    def query(self, args):
+        if args.bin_size <= 0:
+            raise PluginError("Invalid bin size")
+        try:
+            query = BurstQuery(args.expression, args.subslot_mode)
+            matches = query_bursts(args.input_burst_file, query)
+
+            if args.output_burst_file is not None:
+                self.__write_query_result(args.input_burst_file, args.output_burst_file, matches)
+            elif args.count:
+                self.printmsg("%s bursts match" % sum(len(bursts) for bursts in matches))
+            elif args.histogram is not None:
+                histogram = BurstHistogram(args.histogram, args.bin_size, args.subslot_mode)
+                for bursts in matches:
+                    histogram.add(bursts)
+                for value, count in histogram.items():
+                    self.printmsg("%s: %s" % (value, count))
+            else:
+                for bursts in matches:
+                    for fnr, timeslot, arfcn, power, snr, bits in zip(bursts.framenumbers, bursts.timeslots,
+                                                                       bursts.arfcns, bursts.signal_dbm,
+                                                                       bursts.snr_db, bursts.bits):
+                        self.printmsg("%s %s %s %s %s %s" % (fnr, timeslot, arfcn, power, snr,
+                                                             "".join(str(bit) for bit in bits)))
+        except QueryError as e:
+            raise PluginError(str(e))
+
+    @arg("-m", action="store", dest="subslot_mode", choices=(SUBSLOT_SDCCH4, SUBSLOT_SDCCH8), default=SUBSLOT_SDCCH8,
+         help="Channel combination used for counting bursts per subslot. Default: SDCCH8")
+    @arg("input_burst_file", action="store_path", help="The burst file")
+    @subcmd(name="stats", help="Print statistics of a burst file.", parent="bursts")
+    def stats(self, args):
+        statistics = collect_statistics(args.input_burst_file, args.subslot_mode)
+        if statistics.count == 0:
+            self.printmsg("The burst file does not contain any bursts.")
+            return
+
+        self.printmsg("Bursts: %s" % statistics.count)
+        self.printmsg("Dummy bursts: %s (%.1f%%)" % (statistics.dummy_count, statistics.dummy_ratio * 100))
+        self.printmsg("Framenumbers: %s - %s (lowest %s, highest %s)" % (statistics.first_fnr, statistics.last_fnr,
+                                                                        statistics.min_fnr, statistics.max_fnr))
+        self.printmsg("Hyperframe wraparounds: %s" % statistics.wraparounds)
+        self.printmsg("Frames: %s" % statistics.frames)
+        self.printmsg("Gaps: %s (missing frames: %s, longest gap: %s frames)" % (
+            statistics.gaps, statistics.missing_frames, statistics.longest_gap))
+        self.printmsg("51-multiframes: %s (complete: %s, mean occupancy: %.1f%%)" % (
+            len(statistics.multiframe_frames), statistics.complete_multiframes,
+            statistics.multiframe_occupancy * 100))
+
+        self.printmsg("\nBursts per timeslot:")
+        for timeslot, count in enumerate(statistics.timeslot_counts):
+            if count > 0:
+                self.printmsg("  TS %s: %s" % (timeslot, count))
+
+        self.printmsg("\nBursts per %s subslot, including SACCH:" % args.subslot_mode)
+        for timeslot, counts in enumerate(statistics.subslot_counts):
+            if statistics.timeslot_counts[timeslot] == 0:
+                continue
+            self.printmsg("  TS %s:" % timeslot)
+            for subslot, count in enumerate(counts[1:]):
+                if count > 0:
+                    self.printmsg("    Subslot %s: %s" % (subslot, count))
+            self.printmsg("    Other: %s" % counts[0])
+
+    def __write_query_result(self, source, destination, matches):
+        metadata = compact_metadata(source)
+        count = 0
+        with burst_file_writer(destination, metadata is not None, metadata) as writer:
+            for bursts in matches:
+                writer.write(bursts)
+                count += len(bursts)
+        self.printmsg("%s bursts written to %s" % (count, destination))
+
+    @staticmethod
+    def __parse_kc(value):
+        """
+        :return: the Kc as hex string.
+        """
+        try:
+            if "," in value:
+                kc_bytes = [int(byte, 16) for byte in value.split(",")]
+                if any(byte < 0 or byte > 255 for byte in kc_bytes):
+                    raise ValueError()
+                value = "".join("%02x" % byte for byte in kc_bytes)
+            int(value, 16)
+        except ValueError:
+            raise PluginError("Invalid Kc %s" % value)
+        if len(value) != 16:
+            raise PluginError("Invalid Kc %s" % value)
+        return value
+
+    @staticmethod
+    def __parse_spec(spec):
+        """
+        Parse a filter spec of the split command.
+
+        :return: the destination file and the filter criteria.
+        """
+        options = {"-a": "framenr_ge", "-b": "framenr_le", "-t": "timeslot", "-s": "subslot"}
+        try:
+            opts, arguments = getopt.getopt(shlex.split(spec), "a:b:t:s:d")
+            criteria = dict()
+            for option, value in opts:
+                if option == "-d":
+                    criteria["filter_dummy_bursts"] = True
+                else:
+                    criteria[options[option]] = int(value)
+        except (getopt.GetoptError, ValueError) as e:
+            raise PluginError("Invalid filter spec '%s': %s" % (spec, e))
+        if len(arguments) != 1:
+            raise PluginError("Invalid filter spec '%s': provide exactly one destination file" % spec)
+        return arguments[0], criteria
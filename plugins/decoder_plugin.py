@@ -4,13 +4,16 @@ import imp
 import os
 
 import grgsm
+from adapter.grgsm.burstfile import BurstSelection, is_compact_burst_file
+from adapter.grgsm.channel_decoder import CHANNEL_MODES, Channel, MultiChannelDecoder, create_channels, send_gsmtap
+from adapter.grgsm.message_store import MessageStore
 from core.common import arfcn_converter
 from core.plugin.interface import plugin, PluginBase, cmd, arg, arg_exclusive, arg_group
 
 
 @plugin(name='Decoder Plugin', description='Decodes Control and Traffic channels.')
 class DecoderPlugin(PluginBase):
-    channel_modes = ['BCCH', 'BCCH_SDCCH4', 'SDCCH8', 'TCHF']
+    channel_modes = CHANNEL_MODES
     tch_codecs = collections.OrderedDict([
         ('FR', grgsm.TCH_FS),
         ('EFR', grgsm.TCH_EFR),
@@ -24,10 +27,19 @@ class DecoderPlugin(PluginBase):
         ('AMR4.75', grgsm.TCH_AFS4_75)
     ])
 
-    @arg("-m", action="store", dest="mode", choices=channel_modes, help="Channel mode.", default="BCCH")
-    @arg("-t", action="store", dest="timeslot", type=int, help="Timeslot to decode.", default=0)
-    @arg("--subslot", action="store", dest="subslot", type=int,
-         help="Subslot to decode. Use in combination with channel type BCCH_SDCCH4 and SDCCH8.")
+    @arg("-m", action="store", dest="mode",
+         help="Channel mode, one of %s. Several modes can be given comma separated." % ", ".join(channel_modes),
+         default="BCCH")
+    @arg("-t", action="store", dest="timeslot", help="Timeslot to decode, or a list of timeslots like 0,2-4.",
+         default="0")
+    @arg("--subslot", action="store", dest="subslot",
+         help="Subslot to decode, or a list of subslots like 0-7. Use in combination with channel type BCCH_SDCCH4 "
+              "and SDCCH8.")
+    @arg("--channel", action="store", dest="channels", nargs="+",
+         help="Channels to decode, given as MODE:TIMESLOTS[:SUBSLOTS], e.g. BCCH:0 SDCCH8:1:0-7. "
+              "Replaces -m, -t and --subslot.")
+    @arg("-j", "--jobs", action="store", dest="jobs", type=int,
+         help="Number of channels decoded in parallel, if several channels are decoded. Default: number of CPUs")
     @arg_exclusive(args=[
         arg("--cfile", action="store_path", dest="cfile", help="cfile."),
         arg("--bursts", action="store_path", dest="bursts", help="bursts.")
@@ -63,9 +75,18 @@ class DecoderPlugin(PluginBase):
         path = self._config_provider.get("gr-gsm", "apps_path")
         decoder = imp.load_source("", os.path.join(path, "grgsm_decode"))
 
-        timeslot = args.timeslot
-        subslot = args.subslot
-        mode = args.mode
+        try:
+            if args.channels:
+                channels = [channel for spec in args.channels for channel in Channel.parse(spec)]
+            else:
+                channels = create_channels([mode.strip().upper() for mode in args.mode.split(",")], args.timeslot,
+                                           args.subslot)
+        except ValueError as e:
+            self.printmsg(str(e))
+            return
+        if args.jobs is not None and args.jobs <= 0:
+            self.printmsg("The number of jobs must be positive.")
+            return
 
         burstfile = None
         cfile = None
@@ -150,14 +171,59 @@ class DecoderPlugin(PluginBase):
             self.printmsg("You must provide either a cfile or a burst file as destination.")
             return
 
-        tb = decoder.grgsm_decoder(timeslot=timeslot, subslot=subslot, chan_mode=mode,
-                                   burst_file=burstfile,
-                                   cfile=cfile, fc=freq, samp_rate=sample_rate,
-                                   a5=args.a5, a5_kc=kc,
-                                   speech_file=args.speech_output_file,
-                                   speech_codec=self.tch_codecs.get(args.speech_codec),
-                                   enable_voice_boundary_detection=False,
-                                   verbose=verbose,
-                                   print_bursts=args.print_bursts, ppm=ppm)
-        tb.start()
-        tb.wait()
+        if len(channels) > 1:
+            if burstfile is None:
+                self.printmsg("Decoding several channels requires a burst file.")
+                return
+            if args.speech_output_file is not None:
+                self.printmsg("Speech can only be decoded from a single channel.")
+                return
+            self.__decode_channels(burstfile, channels, kc, args, verbose)
+            return
+
+        timeslot = channels[0].timeslot
+        subslot = channels[0].subslot
+        mode = channels[0].mode
+
+        burst_selection = None
+        if burstfile is not None and is_compact_burst_file(burstfile):
+            # grgsm_decode reads gr-gsm burst files only
+            burst_selection = BurstSelection(burstfile)
+            burstfile = burst_selection.path
+
+        try:
+            tb = decoder.grgsm_decoder(timeslot=timeslot, subslot=subslot, chan_mode=mode,
+                                       burst_file=burstfile,
+                                       cfile=cfile, fc=freq, samp_rate=sample_rate,
+                                       a5=args.a5, a5_kc=kc,
+                                       speech_file=args.speech_output_file,
+                                       speech_codec=self.tch_codecs.get(args.speech_codec),
+                                       enable_voice_boundary_detection=False,
+                                       verbose=verbose,
+                                       print_bursts=args.print_bursts, ppm=ppm)
+            tb.start()
+            tb.wait()
+        finally:
+            if burst_selection is not None:
+                burst_selection.remove()
+
+    def __decode_channels(self, burstfile, channels, kc, args, verbose):
+        """
+        Decode several channels of a burst file in parallel and output their messages in the order of their
+        framenumbers, to GSMTAP like grgsm_decode and, if verbose, to the console.
+        """
+        if args.print_bursts:
+            self.printmsg("Bursts are not printed when decoding several channels.")
+        decoder = MultiChannelDecoder(burstfile, channels, kc=kc, a5=args.a5,
+                                      speech_codec=self.tch_codecs.get(args.speech_codec), processes=args.jobs)
+        messages = decoder.run()
+        if not any(kc):
+            # the messages are kept, so that 'analyze messages' does not have to decode the channels again
+            with MessageStore(burstfile) as store:
+                store.store(channels, messages, decoder.first_frame_number)
+        send_gsmtap(messages)
+        if verbose:
+            for message in messages:
+                self.printmsg("%s %s: %s" % (message.frame_number, message.channel,
+                                             " ".join("%02x" % byte for byte in message.payload)))
+        self.printmsg("%s messages decoded on %s channels." % (len(messages), len(channels)))
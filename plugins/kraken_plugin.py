@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+from adapter import kraken_metrics
+from adapter.kraken_adapter import KrakenA51ReconstructorAdapter, KrakenError
+from adapter.kraken_cache import KrakenCache
+from adapter.kraken_metrics import KrakenStats, read_trace
+from adapter.kraken_simulator import KrakenBenchmark, KrakenSimulator, simulated_burst_sets
+from core.adapterinterfaces.a5 import A5ReconstructionStatus
+from core.plugin.interface import plugin, PluginBase, cmd, arg, arg_group, subcmd, PluginError
+
+
+class _BenchmarkConfig(object):
+    """
+    The configuration of the adapter under benchmark: the configured Kraken options, with the nodes replaced and an
+    in-memory cache and no trace, so the benchmark neither uses nor pollutes the persistent cache.
+    """
+
+    def __init__(self, config_provider, nodes):
+        self.__config_provider = config_provider
+        self.__options = {"nodes": nodes, "cache": ":memory:", "trace": ""}
+
+    def get(self, section, option, default=None):
+        if section == "kraken" and option in self.__options:
+            return self.__options[option]
+        return self.__config_provider.get(section, option, default)
+
+    def getint(self, section, option, default=None):
+        return self.__config_provider.getint(section, option, default)
+
+
+@plugin(name="Kraken Plugin", description="Provides a local Kraken simulator and benchmarks of the Kraken adapter")
+class KrakenPlugin(PluginBase):
+    @cmd(name="kraken", description="Provides a local Kraken simulator and benchmarks of the Kraken adapter.",
+         parent=True)
+    def kraken(self, args):
+        pass
+
+    @arg("-H", action="store", dest="host", default="localhost", help="Address to listen on. Default: localhost")
+    @arg("-p", action="store", dest="port", type=int, default=9999, help="Port to listen on. Default: 9999")
+    @arg("--latency", action="store", dest="latency", type=float, default=0.5,
+         help="Mean duration of a job in seconds. Default: 0.5")
+    @arg("--concurrency", action="store", dest="concurrency", type=int, default=4,
+         help="Number of jobs processed at the same time. Default: 4")
+    @arg("--hit-rate", action="store", dest="hit_rate", type=float, default=0.0,
+         help="Probability that a keystream is found, with a random state. Default: 0")
+    @subcmd(name="simulate",
+            help="Run a local stand-in for a Kraken server, which speaks Kraken's protocol but has no tables. It "
+                 "finds keystreams with the given hit rate, but reports random states, which are rejected by the "
+                 "key verification of the Kraken adapter. Use 'kraken benchmark' for hits with valid keys.",
+            parent="kraken")
+    def simulate(self, args):
+        if not 0 <= args.hit_rate <= 1:
+            raise PluginError("Invalid hit rate, expected a probability between 0 and 1")
+        simulator = KrakenSimulator(args.host, args.port, args.latency, args.hit_rate, args.concurrency,
+                                    random_hits=True)
+        simulator.start()
+        self.printmsg("Kraken simulator listening on %s:%s, press Ctrl-C to stop." % (simulator.host, simulator.port))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.printmsg("Stopping. %s jobs received." % simulator.jobs)
+        finally:
+            simulator.stop()
+
+    @arg("-n", action="store", dest="count", type=int, default=200, help="Number of burst sets. Default: 200")
+    @arg("--in-flight", action="store", dest="in_flight", type=int, default=32,
+         help="Number of burst sets submitted at the same time. Default: 32")
+    @arg("--seed", action="store", dest="seed", type=int, help="Seed for the generated burst sets and simulators.")
+    @arg_group(name="Simulators", args=[
+        arg("--simulators", action="store", dest="simulators", type=int, default=1,
+            help="Number of local Kraken simulators, used as replicas. Default: 1"),
+        arg("--latency", action="store", dest="latency", type=float, default=0.05,
+            help="Mean duration of a job in seconds. Default: 0.05"),
+        arg("--hit-rate", action="store", dest="hit_rate", type=float, default=0.5,
+            help="Probability that a simulator finds a keystream. Default: 0.5"),
+        arg("--concurrency", action="store", dest="concurrency", type=int, default=4,
+            help="Number of jobs a simulator processes at the same time. Default: 4")
+    ])
+    @arg("--nodes", action="store", dest="nodes",
+         help="Benchmark running Kraken servers instead of local simulators, given as comma separated "
+              "host:port[/shard] list. Only the throughput is meaningful, as the keystreams are random.")
+    @subcmd(name="benchmark", help="Measure the throughput and latency of the Kraken adapter.", parent="kraken")
+    def benchmark(self, args):
+        if args.count <= 0 or args.in_flight <= 0 or args.simulators <= 0:
+            raise PluginError("Invalid number of burst sets, burst sets in flight or simulators")
+
+        simulators = []
+        nodes = args.nodes
+        if nodes is None:
+            for i in range(args.simulators):
+                simulator = KrakenSimulator("localhost", 0, args.latency, args.hit_rate, args.concurrency,
+                                            None if args.seed is None else args.seed + i)
+                simulator.start()
+                simulators.append(simulator)
+            nodes = ",".join("localhost:%s" % simulator.port for simulator in simulators)
+
+        try:
+            burst_sets = simulated_burst_sets(args.count, simulators, args.seed)
+            adapter = KrakenA51ReconstructorAdapter(_BenchmarkConfig(self._config_provider, nodes))
+            try:
+                benchmark = KrakenBenchmark(adapter, burst_sets, args.in_flight).run()
+                summary = KrakenStats(adapter.metrics.records).summary()
+            finally:
+                adapter.close()
+        except KrakenError as e:
+            raise PluginError(str(e))
+        finally:
+            for simulator in simulators:
+                simulator.stop()
+
+        self.printmsg("Burst sets: %s (%s in flight) on %s" % (args.count, args.in_flight, nodes))
+        self.printmsg("Duration: %.2f s, %.1f jobs/s" % (benchmark.duration, benchmark.jobs_per_second))
+        self.printmsg("Keys found: %s, not found: %s, failed: %s" % (
+            benchmark.statuses[A5ReconstructionStatus.FOUND], benchmark.statuses[A5ReconstructionStatus.NOT_FOUND],
+            benchmark.statuses[A5ReconstructionStatus.FAILED]))
+        self.printmsg("Latency: p50 %.3f s, p90 %.3f s, p99 %.3f s, max %.3f s" % (
+            benchmark.percentile(50), benchmark.percentile(90), benchmark.percentile(99), benchmark.percentile(100)))
+        self.__print_breakdown(summary)
+        for error in sorted(set(benchmark.errors)):
+            self.printmsg(error)
+
+    @arg("--since", action="store", dest="since", type=float,
+         help="Only include the jobs of the last SINCE hours.")
+    @arg("--trace", action="store", dest="trace",
+         help="Summarize the jobs of a trace file instead of the jobs stored in the Kraken cache.")
+    @arg("--clear", action="store_true", dest="clear", help="Delete the job metrics stored in the Kraken cache.")
+    @subcmd(name="stats",
+            help="Show the latency, Kraken time and outcomes of past Kraken jobs, overall and per node.",
+            parent="kraken")
+    def stats(self, args):
+        if args.trace is not None:
+            try:
+                records = read_trace(args.trace)
+            except (IOError, ValueError) as e:
+                raise PluginError("Could not read trace file %s: %s" % (args.trace, e))
+        else:
+            cache = KrakenCache(os.path.expanduser(self._config_provider.get("kraken", "cache",
+                                                                             "~/.gat/kraken_cache.db")))
+            try:
+                if args.clear:
+                    cache.clear_job_records()
+                    self.printmsg("Job metrics deleted.")
+                    return
+                records = cache.job_records(None if args.since is None else time.time() - args.since * 3600)
+            finally:
+                cache.close()
+        if args.since is not None:
+            records = [record for record in records if record["submitted"] >= time.time() - args.since * 3600]
+
+        if not records:
+            self.printmsg("No Kraken jobs recorded.")
+            return
+        stats = KrakenStats(records)
+        self.printmsg("All nodes:")
+        self.__print_summary(stats.summary())
+        for node in stats.nodes():
+            self.printmsg("Node %s:" % node)
+            self.__print_summary(stats.summary(node))
+
+    @arg("--clear", action="store_true", dest="clear",
+         help="Delete the cached verdicts of Kraken, so every keystream is looked up again.")
+    @subcmd(name="cache", help="Show the number of keystream verdicts stored in the Kraken cache, or delete them.",
+            parent="kraken")
+    def cache(self, args):
+        cache = KrakenCache(os.path.expanduser(self._config_provider.get("kraken", "cache", "~/.gat/kraken_cache.db")))
+        try:
+            if args.clear:
+                cache.clear_keystream_results()
+                self.printmsg("Cached keystream verdicts deleted.")
+                return
+            self.printmsg("Cache: %s" % cache.path)
+            for status in (A5ReconstructionStatus.FOUND, A5ReconstructionStatus.NOT_FOUND):
+                self.printmsg("  Keystreams %s: %s" % (status, cache.keystream_count(status)))
+        finally:
+            cache.close()
+
+    def __print_summary(self, summary):
+        self.printmsg("  Jobs: %s (%s)" % (summary["jobs"], ", ".join(
+            "%s %s" % (summary["outcomes"][outcome], outcome) for outcome in kraken_metrics.OUTCOMES)))
+        self.printmsg("  Candidates per job: %.2f" % summary["candidates"])
+        for field, name in [("latency", "Latency"), ("ack_time", "Acknowledgement"), ("kraken_time", "Kraken time"),
+                            ("queue_wait", "Queue wait")]:
+            if summary[field] is not None:
+                self.printmsg("  %s: p50 %.3f s, p90 %.3f s" % ((name,) + summary[field]))
+        self.printmsg("  Verification: %.3f s in total" % summary["verification_time"])
+
+    def __print_breakdown(self, summary):
+        if summary["kraken_time"] is not None:
+            self.printmsg("Kraken time: p50 %.3f s, queue wait: p50 %.3f s, verification: %.3f s in total" % (
+                summary["kraken_time"][0], summary["queue_wait"][0], summary["verification_time"]))